@@ -0,0 +1,149 @@
+"""
+Structured page results for PTW Analyzer
+
+The analysis model used to answer with a free-form markdown table, which was
+re-parsed with string splitting after every call and again on every rerun of
+the results page; rows the parsers could not read became "CHECAGEM HUMANA
+NECESSARIA" placeholders.
+
+The analysis call now records its findings through the RESULT_TOOL tool, whose
+JSON schema fixes the fields and status values of every row. The tool input is
+validated once by rows_from_tool_input() into result rows: plain dictionaries
+keyed by RESULT_COLUMNS, which are JSON-serializable (job state, checkpoints,
+analysis cache) and load straight into a DataFrame for the results table.
+"""
+
+from typing import Any, Dict, List, Optional
+
+# Columns of a page result row, in table order
+RESULT_COLUMNS = ('permit_number', 'page_number', 'page_summary', 'section', 'status', 'comments')
+
+# Column headers of the results table
+RESULT_COLUMN_LABELS = {
+    'permit_number': 'Número da Permissão',
+    'page_number': 'Número da Página',
+    'page_summary': 'Resumo da Página',
+    'section': 'Seção',
+    'status': 'Status',
+    'comments': 'Comentários'
+}
+
+# Status values of the rows of a page result
+STATUS_APPROVED = 'APROVADO'
+STATUS_REPROVED = 'REPROVADO'
+STATUS_HUMAN_CHECK = 'CHECAGEM HUMANA NECESSARIA'
+STATUS_NOT_APPLICABLE = 'N/A'
+RESULT_STATUSES = (STATUS_APPROVED, STATUS_REPROVED, STATUS_HUMAN_CHECK, STATUS_NOT_APPLICABLE)
+
+# Tool the analysis model records its findings with
+RESULT_TOOL_NAME = "record_page_results"
+RESULT_TOOL = {
+    "name": RESULT_TOOL_NAME,
+    "description": "Record the audit result of every section and attachment analyzed on the page, one entry per section.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "rows": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "page_summary": {
+                            "type": "string",
+                            "description": "Short description of the page in Brazilian Portuguese"
+                        },
+                        "section": {
+                            "type": "string",
+                            "description": "Section number and name (e.g. \"19 - Ronda/Auditoria\") or attachment name"
+                        },
+                        "status": {
+                            "type": "string",
+                            "enum": list(RESULT_STATUSES)
+                        },
+                        "comments": {
+                            "type": "string",
+                            "description": "Justification of the status in Brazilian Portuguese, citing the OCR evidence"
+                        }
+                    },
+                    "required": ["page_summary", "section", "status", "comments"]
+                }
+            }
+        },
+        "required": ["rows"]
+    }
+}
+
+
+def result_row(permit_number: Optional[str], page_num: Any, page_summary: str,
+               section: str, status: str, comments: str) -> Dict[str, str]:
+    """
+    Build a page result row.
+
+    Args:
+        permit_number: Permit number ("Desconhecido" when unknown)
+        page_num: Page number (1-based)
+        page_summary: Short description of the page
+        section: Section or attachment the row is about
+        status: One of RESULT_STATUSES
+        comments: Justification of the status
+
+    Returns:
+        dict: Row keyed by RESULT_COLUMNS
+    """
+    return dict(zip(RESULT_COLUMNS, (
+        permit_number or "Desconhecido", str(page_num), page_summary, section, status, comments
+    )))
+
+
+def normalize_status(value: str) -> str:
+    """
+    Map a status written by the model to one of RESULT_STATUSES.
+
+    Args:
+        value: Status text
+
+    Returns:
+        str: Normalized status (STATUS_HUMAN_CHECK when unrecognized)
+    """
+    value = (value or "").strip()
+    if value in RESULT_STATUSES:
+        return value
+    lowered = value.lower()
+    if "reprovado" in lowered or "reproved" in lowered:
+        return STATUS_REPROVED
+    if "aprovado" in lowered or "approved" in lowered:
+        return STATUS_APPROVED
+    if "n/a" in lowered or "não aplicável" in lowered or "nao aplicavel" in lowered:
+        return STATUS_NOT_APPLICABLE
+    return STATUS_HUMAN_CHECK
+
+
+def rows_from_tool_input(tool_input: Any, page_num: int, permit_number: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Validate the RESULT_TOOL input of an analysis call into result rows.
+
+    The permit and page numbers come from the caller, not from the model.
+    Entries that are not objects or have no section are dropped.
+
+    Args:
+        tool_input: Input of the tool call (the parsed JSON object)
+        page_num: Page number (1-based)
+        permit_number: Permit number of the document
+
+    Returns:
+        list: Result rows (empty if the input holds no usable entry)
+    """
+    entries = tool_input.get("rows") if isinstance(tool_input, dict) else None
+    rows = []
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict) or not str(entry.get("section") or "").strip():
+            continue
+        rows.append(result_row(
+            permit_number,
+            page_num,
+            str(entry.get("page_summary") or f"Página {page_num}").strip(),
+            str(entry["section"]).strip(),
+            normalize_status(str(entry.get("status") or "")),
+            str(entry.get("comments") or "").strip()
+        ))
+    return rows
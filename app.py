@@ -5,20 +5,40 @@ import base64
 import io
 import time
 import re
+import asyncio
 import fitz  # PyMuPDF
 import pandas as pd
 import uuid
-import concurrent.futures
 import threading
 import hashlib
 import json
-import pickle
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 from anthropic import Anthropic
 from pathlib import Path
 
 # Import UI helper functions
-from ui_helpers import load_css, init_session_state, render_sidebar, render_welcome_message, get_image_base64
+from ui_helpers import load_css, init_session_state, render_sidebar, render_welcome_message, get_image_base64, get_session_pages, render_page_image
+from page_pipeline import PagePipeline
+from page_scheduler import PRIORITY_INTERACTIVE, get_page_scheduler
+from job_runner import get_job_runner, JobCancelled, JOB_POLL_INTERVAL
+from checkpoint import get_checkpoint_store, document_key
+from llm_engine import get_engine, ProgressEvents, NullEvents, message_tool_input, cacheable_text_block
+from page_cache import get_ocr_cache, get_analysis_cache, hash_bytes, normalize_text
+from guide_color import is_skippable_copy, header_names_copy
+from page_triage import TRIAGE_ENABLED, THIRD_PARTY_JSA_MARKER, BLANK_PAGE_MARKER, triage_page, get_triage_stats
+from analysis_prompts import ANALYSIS_SYSTEM_PROMPT, build_page_rules, detect_prompt_packs, section_pack_name
+from ocr_page import parse_ocr_page, find_permit_number
+from section_rules import evaluate_section_rules, rule_for_label
+from analysis_rows import (
+    RESULT_COLUMNS, RESULT_COLUMN_LABELS, RESULT_TOOL, RESULT_TOOL_NAME,
+    STATUS_REPROVED, STATUS_HUMAN_CHECK, STATUS_NOT_APPLICABLE, result_row, rows_from_tool_input
+)
+from page_index import PageIndex, build_page_index
+from pdf_compress import compress_pdf_images
+from page_raster import (
+    PageRasterizer, RenderedPage, page_thumbnail, page_content_hash,
+    encode_image, encode_page_for_api, standardize_pages, standardize_page_async
+)
 
 # Set page configuration
 st.set_page_config(
@@ -31,9 +51,26 @@ st.set_page_config(
 # Load API key from environment variable with fallback
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 
-# Initialize Claude client
+# Initialize Claude client (used for the Files API; model calls go through the engine)
 anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
 
+# Shared async engine: every model call in the process goes through one rate controller
+model_engine = get_engine()
+
+# Model used for OCR calls and version of the OCR prompts (single and batch).
+# Both are part of the OCR cache key: bump OCR_PROMPT_VERSION whenever the OCR
+# prompts change so transcriptions made with the old prompt are not reused.
+OCR_MODEL = "claude-sonnet-4-20250514"
+OCR_PROMPT_VERSION = "1"
+
+# Model used for page analysis and version of the analysis prompts (see
+# analysis_prompts). Both are part of the analysis cache key: bump
+# ANALYSIS_PROMPT_VERSION whenever the prompts or the section rules (which
+# decide which sections reach the model) change so only pages analysed with the
+# old prompts are re-run.
+ANALYSIS_MODEL = "claude-sonnet-4-20250514"
+ANALYSIS_PROMPT_VERSION = "5"
+
 # Load CSS styling
 load_css()
 load_css("chat_page")
@@ -150,192 +187,96 @@ def get_file_size_mb(file_bytes):
     """Return the file size in megabytes."""
     return len(file_bytes) / (1024 * 1024)
 
-def compress_pdf(input_bytes, target_size_mb=4.0):
-    """Compress PDF to target size."""
-    # Save input bytes to a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_input:
-        temp_input.write(input_bytes)
-        temp_input_path = temp_input.name
-    
-    # Create a temporary output file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_output:
-        temp_output_path = temp_output.name
-    
-    # Check if input already meets the requirement
-    input_size = get_file_size_mb(input_bytes)
-    if input_size <= target_size_mb:
-        # Already under target size, just return the original
-        os.unlink(temp_input_path)
-        os.unlink(temp_output_path)
-        return input_bytes
+def compress_pdf(input_bytes, target_size_mb=4.0, events=None):
+    """
+    Compress PDF to target size.
     
+    Only the embedded raster images are recompressed (in parallel, with the
+    quality chosen in a single pass), so text, vector content and the PDF
+    text layer are preserved.
+    """
     try:
-        # Open the PDF
-        input_pdf = fitz.open(temp_input_path)
-        output_pdf = fitz.open()
-        
-        # Try different compression levels until we achieve target size
-        for quality in [95, 90, 80, 70, 60, 50, 40]:
-            # Clear output PDF
-            output_pdf.close()
-            output_pdf = fitz.open()
-            
-            # Process each page
-            for page_num in range(len(input_pdf)):
-                page = input_pdf[page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(1, 1))
-                
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                img_stream = io.BytesIO()
-                img.save(img_stream, format="JPEG", quality=quality)
-                img_stream.seek(0)
-                
-                # Add the compressed image as a new page
-                new_page = output_pdf.new_page(width=page.rect.width, height=page.rect.height)
-                new_page.insert_image(page.rect, stream=img_stream.getvalue())
-            
-            # Save to the temporary output file
-            output_pdf.save(temp_output_path, garbage=4, deflate=True)
-            
-            # Check if we achieved the target size
-            with open(temp_output_path, 'rb') as f:
-                output_bytes = f.read()
-                if get_file_size_mb(output_bytes) <= target_size_mb:
-                    break
-        
-        # Close PDF objects
-        input_pdf.close()
-        output_pdf.close()
-        
-        # Read the final output file
-        with open(temp_output_path, 'rb') as f:
-            output_bytes = f.read()
-        
-        return output_bytes
-        
+        return compress_pdf_images(input_bytes, target_size_mb)
     except Exception as e:
-        st.error(f"Error compressing PDF: {str(e)}")
+        (events or StreamlitEvents()).message("error", f"Error compressing PDF: {str(e)}")
         return input_bytes
+
+def extract_pages_as_images(pdf_bytes, dpi=300, page_index=None, text_layer=False, store=None, events=None):
+    """
+    Render the pages of a PDF with the specified resolution.
     
-    finally:
-        # Clean up temporary files
-        try:
-            os.unlink(temp_input_path)
-            os.unlink(temp_output_path)
-        except:
-            pass
-
-def extract_pages_as_images(pdf_bytes, dpi=300):
-    """Extract pages from PDF as PNG images with specified resolution."""
-    images = []
+    Pages are rendered one at a time straight from memory and kept as encoded
+    PNG bytes, so memory use does not grow with full-resolution images.
     
-    # Save to a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-        temp_file.write(pdf_bytes)
-        temp_path = temp_file.name
+    Args:
+        pdf_bytes: The PDF content as bytes
+        dpi: Rendering resolution
+        page_index: Optional PageIndex that receives the fingerprint of every
+            page, so near-identical pages can reuse their twin's results
+        text_layer: Read digitally generated pages from their embedded text
+            so they skip (or only partly need) vision OCR
+        store: Optional SessionPages the pages are spilled to, for pages kept
+            in the session
+        events: Optional ProgressEvents receiving the progress and status
+            messages (rendered with st.* when omitted)
+        
+    Returns:
+        list: RenderedPage objects in page order (decode with RenderedPage.image())
+    """
+    events = events or StreamlitEvents()
+    pages = []
     
     try:
-        # Open the PDF
-        pdf = fitz.open(temp_path)
-        total_pages = len(pdf)
-        
-        # Add a progress indicator for large documents
-        if total_pages > 5:
-            progress_bar = st.progress(0)
-            progress_text = st.empty()
-        
-        # Convert each page to an image
-        for page_num in range(total_pages):
-            # Update progress for large documents
-            if total_pages > 5:
-                progress = (page_num + 1) / total_pages
-                progress_bar.progress(progress, text=f"Extraindo página {page_num + 1}/{total_pages}")
-            
-            page = pdf[page_num]
+        with PageRasterizer(pdf_bytes, dpi, text_layer=text_layer) as rasterizer:
+            total_pages = len(rasterizer)
             
-            # Starting with higher DPI for better text clarity, especially for scanned documents
-            initial_dpi = dpi  # Start with a higher DPI for better quality
-            zoom = initial_dpi / 72  # 72 is the default PDF dpi
-            matrix = fitz.Matrix(zoom, zoom)
-            
-            # Always use RGB for better OCR results
-            pix = page.get_pixmap(matrix=matrix)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Apply slight sharpening to improve text clarity (especially for scanned docs)
-            enhancer = ImageEnhance.Sharpness(img)
-            img = enhancer.enhance(1.2)  # Slight sharpening
-            
-            # Adjust contrast slightly to improve readability
-            contrast_enhancer = ImageEnhance.Contrast(img)
-            img = contrast_enhancer.enhance(1.1)  # Slight contrast boost
-            
-            # Create a PNG buffer with high quality
-            buf = io.BytesIO()
-            img.save(buf, format="PNG", optimize=True)
-            buf.seek(0)
-            
-            # Check size and compress if needed
-            img_size_mb = len(buf.getvalue()) / (1024 * 1024)
-            
-            # If image is too large, try to reduce size while maintaining quality
-            if img_size_mb > 4:
-                st.warning(f"Página {page_num + 1} tem {img_size_mb:.2f}MB, comprimindo para processamento...")
+            for page in rasterizer:
+                # Report progress for large documents
+                if total_pages > 5:
+                    events.emit("progress", (page.page_num / total_pages, f"Extraindo página {page.page_num}/{total_pages}"))
                 
-                # Try reducing the resolution in smaller steps to maintain readability
-                for reduce_dpi in [250, 200, 175, 150, 125]:
-                    reduce_matrix = fitz.Matrix(reduce_dpi / 72, reduce_dpi / 72)
-                    reduced_pix = page.get_pixmap(matrix=reduce_matrix)
-                    reduced_img = Image.frombytes("RGB", [reduced_pix.width, reduced_pix.height], reduced_pix.samples)
-                    
-                    # Apply enhancement to maintain readability at lower resolution
-                    enhancer = ImageEnhance.Sharpness(reduced_img)
-                    reduced_img = enhancer.enhance(1.3)  # Slightly stronger sharpening at lower resolution
-                    
-                    # Adjust contrast slightly to improve readability
-                    contrast_enhancer = ImageEnhance.Contrast(reduced_img)
-                    reduced_img = contrast_enhancer.enhance(1.2)
-                    
-                    # Try saving with this reduced resolution
-                    reduced_buf = io.BytesIO()
-                    reduced_img.save(reduced_buf, format="PNG", optimize=True, quality=95)  # High quality
-                    reduced_buf.seek(0)
-                    
-                    reduced_size_mb = len(reduced_buf.getvalue()) / (1024 * 1024)
-                    if reduced_size_mb <= 4.0:
-                        st.info(f"Página {page_num + 1} reduzida para {reduced_size_mb:.2f}MB em {reduce_dpi} DPI")
-                        img = reduced_img
-                        break
+                if page.dpi != dpi:
+                    events.message("info", f"Página {page.page_num} renderizada em {page.dpi} DPI para respeitar o limite de resolução")
+                
+                if page.text_layer is not None:
+                    events.message("info", f"Página {page.page_num} possui camada de texto digital - OCR por visão limitado a {len(page.text_regions)} região(ões)")
+                
+                pages.append(store.add(page) if store is not None else page)
+                
+                # Fingerprint the page so duplicates reuse their twin's results
+                if page_index is not None:
+                    twin_page = page_index.add(page.page_num, page.thumbnail)
+                    if twin_page:
+                        events.message("info", f"Página {page.page_num} é praticamente idêntica à página {twin_page} - o resultado será reaproveitado")
             
-            # Add image to list
-            images.append(img)
-        
-        # Clear progress display
-        if total_pages > 5:
-            progress_bar.empty()
-            progress_text.empty()
+            # Clear progress display
+            if total_pages > 5:
+                events.emit("progress", None)
         
-        pdf.close()
-        return images
+        return pages
     
     except Exception as e:
-        st.error(f"Error extracting pages: {str(e)}")
+        events.message("error", f"Error extracting pages: {str(e)}")
         return []
-    
-    finally:
-        # Clean up temporary file
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
 
-def generate_ptw_summary(pdf_bytes):
-    """Generate a summary of the PTW document using Wonder Wise with robust fallback."""
+def generate_ptw_summary(pdf_bytes, events=None):
+    """
+    Generate a summary of the PTW document using Wonder Wise with robust fallback.
+    
+    Args:
+        pdf_bytes: The PDF content as bytes
+        events: Optional ProgressEvents receiving the status messages
+            (rendered with st.* when omitted)
+        
+    Returns:
+        str: The PTW summary (a default summary if every approach failed)
+    """
+    events = events or StreamlitEvents()
     try:
         # APPROACH 0: Try Files API first - handles large PDFs efficiently
         try:
             pdf_size_mb = get_file_size_mb(pdf_bytes)
-            st.info(f"Tentando usar Files API para PDF de {pdf_size_mb:.1f}MB...")
+            events.message("info", f"Tentando usar Files API para PDF de {pdf_size_mb:.1f}MB...")
             
             # Create temporary file for upload (v0.52.0+ pattern)
             with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
@@ -354,7 +295,7 @@ def generate_ptw_summary(pdf_bytes):
                 except:
                     pass
             
-            st.success(f"PDF carregado com sucesso na Files API (ID: {uploaded_file.id[:12]}...)")
+            events.message("success", f"PDF carregado com sucesso na Files API (ID: {uploaded_file.id[:12]}...)")
             
             # Define the same summary prompt as other approaches
             summary_prompt = """You are an expert in Permit to Works for the Offshore Drilling Industry. 
@@ -392,7 +333,9 @@ def generate_ptw_summary(pdf_bytes):
             
             try:
                 # Generate summary using Files API with extended timeout for sonnet 4
-                response = anthropic_client.beta.messages.create(
+                response = model_engine.create_message_sync(
+                    label="summary (Files API)",
+                    beta=True,
                     model="claude-sonnet-4-20250514",
                     max_tokens=25000,
                     temperature=0,
@@ -420,9 +363,9 @@ def generate_ptw_summary(pdf_bytes):
                 # Clean up the uploaded file
                 try:
                     anthropic_client.beta.files.delete(uploaded_file.id)
-                    st.success("Resumo gerado com sucesso usando Files API!")
+                    events.message("success", "Resumo gerado com sucesso usando Files API!")
                 except Exception as cleanup_error:
-                    st.warning(f"Arquivo temporário pode não ter sido removido: {str(cleanup_error)}")
+                    events.message("warning", f"Arquivo temporário pode não ter sido removido: {str(cleanup_error)}")
                 
                 return response.content[0].text
                 
@@ -433,24 +376,24 @@ def generate_ptw_summary(pdf_bytes):
                 except:
                     pass  # Don't fail on cleanup
                 
-                st.warning(f"Falha na geração de resumo com Files API: {str(files_api_error)}")
+                events.message("warning", f"Falha na geração de resumo com Files API: {str(files_api_error)}")
                 # Continue to fallback approaches
                 
         except Exception as upload_error:
-            st.warning(f"Falha no upload para Files API: {str(upload_error)}")
+            events.message("warning", f"Falha no upload para Files API: {str(upload_error)}")
             # Continue to fallback approaches
         
         # APPROACH 1: Extract ALL pages as images for reliable processing
-        st.info("Extraindo todas as páginas para resumo do documento...")
+        events.message("info", "Extraindo todas as páginas para resumo do documento...")
         
         # Extract all pages at a reasonable resolution for summary purposes
-        page_images = extract_pages_as_images(pdf_bytes, dpi=150)
+        page_images = extract_pages_as_images(pdf_bytes, dpi=150, events=events)
         
         # Use all pages for a complete picture
         preview_images = page_images  # No limit here anymore
         
         if preview_images:
-            st.success(f"Extraiu com sucesso {len(preview_images)} páginas para resumo")
+            events.message("success", f"Extraiu com sucesso {len(preview_images)} páginas para resumo")
             
             # Updated summary prompt to include a structured table of page descriptions
             summary_prompt = """You are an expert in Permit to Works for the Offshore Drilling Industry. 
@@ -490,26 +433,24 @@ def generate_ptw_summary(pdf_bytes):
             content = [{"type": "text", "text": "Please provide a summary of this Permit to Work document based on all pages. Format your response in Brazilian Portuguese. Include the table of page descriptions as specified."}]
             
             # Add each image to the content array
-            for i, img in enumerate(preview_images):
-                # Convert image to base64 with PNG format for better text clarity
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format="PNG", optimize=True)
-                img_buffer.seek(0)
-                img_base64 = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
+            for i, page in enumerate(preview_images):
+                # The stored PNG is sent as is when it fits the API limit
+                payload = encode_page_for_api(page)
                 
                 # Add image to content
                 content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
-                        "data": img_base64
+                        "media_type": payload.media_type,
+                        "data": payload.base64()
                     }
                 })
             
             try:
                 # Call Wonder Wise (Claude) API with images
-                response = anthropic_client.messages.create(
+                response = model_engine.create_message_sync(
+                    label="summary (images)",
                     model="claude-sonnet-4-20250514",
                     max_tokens=25000,  # Use full token limit
                     temperature=0,
@@ -518,13 +459,13 @@ def generate_ptw_summary(pdf_bytes):
                     messages=[{"role": "user", "content": content}]
                 )
                 
-                st.success("Geração de resumo baseada em imagem concluída com sucesso!")
+                events.message("success", "Geração de resumo baseada em imagem concluída com sucesso!")
                 return response.content[0].text
             except Exception as img_error:
-                st.warning(f"Falha na geração de resumo baseada em imagem: {str(img_error)}")
+                events.message("warning", f"Falha na geração de resumo baseada em imagem: {str(img_error)}")
                 # Continue to fallback approaches
         else:
-            st.warning("Não foi possível extrair páginas do PDF para resumo")
+            events.message("warning", "Não foi possível extrair páginas do PDF para resumo")
         
         # APPROACH 2: Try with direct PDF processing - this sometimes works with Wonder Wise
         try:
@@ -567,10 +508,11 @@ def generate_ptw_summary(pdf_bytes):
                 
                 # Encode PDF for API submission
                 base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-                st.info("Tentando processar o PDF diretamente com Wonder Wise...")
+                events.message("info", "Tentando processar o PDF diretamente com Wonder Wise...")
                 
                 # Call Wonder Wise API with the PDF (keeping prompt in English)
-                response = anthropic_client.messages.create(
+                response = model_engine.create_message_sync(
+                    label="summary (direct PDF)",
                     model="claude-sonnet-4-20250514",
                     max_tokens=25000,
                     temperature=0,
@@ -597,22 +539,22 @@ def generate_ptw_summary(pdf_bytes):
                     ]
                 )
                 
-                st.success("Processamento direto do PDF concluído com sucesso!")
+                events.message("success", "Processamento direto do PDF concluído com sucesso!")
                 return response.content[0].text
             else:
-                st.warning(f"PDF muito grande ({pdf_size_mb:.2f}MB) para processamento direto")
+                events.message("warning", f"PDF muito grande ({pdf_size_mb:.2f}MB) para processamento direto")
                 # Continue to fallback approach
         except Exception as pdf_error:
-            st.warning(f"Falha no processamento direto do PDF: {str(pdf_error)}")
+            events.message("warning", f"Falha no processamento direto do PDF: {str(pdf_error)}")
             # Continue to fallback approach
         
         # APPROACH 3: Simplified first page and batch sampling approach as last resort
         try:
-            st.info("Tentando um resumo simplificado com amostragem de páginas...")
+            events.message("info", "Tentando um resumo simplificado com amostragem de páginas...")
             
             # Make sure we have page images
             if not page_images or len(page_images) == 0:
-                page_images = extract_pages_as_images(pdf_bytes, dpi=250)
+                page_images = extract_pages_as_images(pdf_bytes, dpi=250, events=events)
             
             if page_images and len(page_images) > 0:
                 # Sample the first page and then every 2-3 pages to get a representative sample
@@ -631,19 +573,17 @@ def generate_ptw_summary(pdf_bytes):
                 content = [{"type": "text", "text": "This is a sample of pages from a Permit to Work document. Please provide a summary including a table of page descriptions as best you can from these samples."}]
                 
                 # Add each sample image to the content array
-                for i, img in enumerate(sample_images):
-                    # Convert to PNG for better text clarity
-                    buffered = io.BytesIO()
-                    img.save(buffered, format="PNG", optimize=True)
-                    img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+                for i, page in enumerate(sample_images):
+                    # The stored PNG is sent as is when it fits the API limit
+                    payload = encode_page_for_api(page)
                     
                     # Add image to content
                     content.append({
                         "type": "image",
                         "source": {
                             "type": "base64",
-                            "media_type": "image/png",
-                            "data": img_base64
+                            "media_type": payload.media_type,
+                            "data": payload.base64()
                         }
                     })
                 
@@ -665,7 +605,8 @@ def generate_ptw_summary(pdf_bytes):
                 Format your entire response in Brazilian Portuguese."""
                 
                 # Call Wonder Wise API with sampled images
-                simplified_response = anthropic_client.messages.create(
+                simplified_response = model_engine.create_message_sync(
+                    label="summary (sampled pages)",
                     model="claude-sonnet-4-20250514",
                     max_tokens=25000,
                     temperature=0,
@@ -674,17 +615,17 @@ def generate_ptw_summary(pdf_bytes):
                     messages=[{"role": "user", "content": content}]
                 )
                 
-                st.success("Resumo com amostragem de páginas concluído com sucesso!")
+                events.message("success", "Resumo com amostragem de páginas concluído com sucesso!")
                 return simplified_response.content[0].text
             else:
-                st.error("Não foi possível extrair imagens do PDF")
+                events.message("error", "Não foi possível extrair imagens do PDF")
                 # Fall through to default summary
         except Exception as final_error:
-            st.error(f"Todas as tentativas de resumo falharam: {str(final_error)}")
+            events.message("error", f"Todas as tentativas de resumo falharam: {str(final_error)}")
             # Fall through to default summary
     
     except Exception as e:
-        st.error(f"Erro ao gerar resumo da PT: {str(e)}")
+        events.message("error", f"Erro ao gerar resumo da PT: {str(e)}")
     
     # Default summary - only reached if all approaches fail (providing in Portuguese)
     return """Resumo da PT: Este é um resumo padrão gerado porque a geração do resumo original falhou. 
@@ -709,171 +650,189 @@ def generate_document_hash(pdf_bytes):
     """
     return hashlib.sha256(pdf_bytes).hexdigest()
 
-def cache_ocr_text(doc_hash, page_num, ocr_text):
+def get_document_checkpoint_key(content_hash):
     """
-    Cache OCR text for a specific document page.
+    Build the checkpoint key of a document.
     
     Args:
-        doc_hash: Document hash identifier
-        page_num: Page number (1-based)
-        ocr_text: The OCR text to cache
-    """
-    # Initialize OCR cache if it doesn't exist
-    if 'ocr_cache' not in st.session_state:
-        st.session_state.ocr_cache = {}
-    
-    # Create document entry if it doesn't exist
-    if doc_hash not in st.session_state.ocr_cache:
-        st.session_state.ocr_cache[doc_hash] = {}
-    
-    # Store OCR text for this page
-    st.session_state.ocr_cache[doc_hash][page_num] = ocr_text
-    
-    # Also try to persist to disk for future sessions
-    try:
-        cache_dir = Path("./.cache")
-        cache_dir.mkdir(exist_ok=True)
+        content_hash: Hash of the document content (see generate_document_hash)
         
-        cache_file = cache_dir / f"{doc_hash}.pkl"
-        with open(cache_file, 'wb') as f:
-            pickle.dump(st.session_state.ocr_cache[doc_hash], f)
-    except Exception as e:
-        # Log but continue if disk caching fails
-        print(f"Warning: Could not save OCR cache to disk: {str(e)}")
+    Returns:
+        str: Key covering the content and the OCR and analysis models and prompt versions
+    """
+    return document_key(content_hash, OCR_PROMPT_VERSION, OCR_MODEL, ANALYSIS_PROMPT_VERSION, ANALYSIS_MODEL)
 
-def get_cached_ocr_text(doc_hash, page_num):
+def load_document_checkpoint(doc_key, total_pages, events=None):
     """
-    Retrieve cached OCR text for a specific document page.
+    Register a document for checkpointing and return the progress saved for it.
     
     Args:
-        doc_hash: Document hash identifier
-        page_num: Page number (1-based)
+        doc_key: Checkpoint key (see get_document_checkpoint_key)
+        total_pages: Number of pages in the document
+        events: Optional ProgressEvents receiving the status messages
+            (rendered with st.* when omitted)
         
     Returns:
-        str or None: The cached OCR text if available, None otherwise
+        DocumentCheckpoint or None: Progress of an earlier analysis of the same document
     """
-    # Check memory cache first
-    if 'ocr_cache' in st.session_state and doc_hash in st.session_state.ocr_cache:
-        return st.session_state.ocr_cache[doc_hash].get(page_num)
-    
-    # Try to load from disk if not in memory
-    try:
-        cache_file = Path(f"./.cache/{doc_hash}.pkl")
-        if cache_file.exists():
-            with open(cache_file, 'rb') as f:
-                page_cache = pickle.load(f)
-                
-                # Store in session state for future use
-                if 'ocr_cache' not in st.session_state:
-                    st.session_state.ocr_cache = {}
-                st.session_state.ocr_cache[doc_hash] = page_cache
-                
-                return page_cache.get(page_num)
-    except Exception as e:
-        # Log but continue if disk cache loading fails
-        print(f"Warning: Could not load OCR cache from disk: {str(e)}")
-    
-    return None
-
-def standardize_image(image, target_dpi=250):
+    store = get_checkpoint_store()
+    store.start(doc_key, total_pages)
+    checkpoint = store.load(doc_key)
+    
+    if checkpoint is not None:
+        completed_pages = len(checkpoint.completed_pages())
+        if completed_pages:
+            (events or StreamlitEvents()).message(
+                "info",
+                f"Análise anterior deste documento encontrada: {completed_pages} de {total_pages} páginas já concluídas - apenas as páginas restantes serão processadas"
+            )
+    return checkpoint
+
+def use_document_checkpoint(doc_key, checkpoint):
+    """Make a loaded checkpoint the session's current document."""
+    st.session_state.doc_key = doc_key
+    if checkpoint is not None and checkpoint.permit_number:
+        st.session_state.permit_number = checkpoint.permit_number
+
+def get_checkpointed_summary(checkpoint, pdf_bytes, events=None):
     """
-    Standardize image for consistent OCR results:
-    - Resizes to consistent target DPI/resolution
-    - Enhances contrast and reduces noise
-    - Converts to grayscale (better for text recognition)
-    - Ensures size is under Claude's limits
+    Return the document summary saved in the checkpoint, generating and saving it if missing.
     
     Args:
-        image: PIL.Image object
-        target_dpi: Target resolution in DPI (250 is good for OCR)
+        checkpoint: DocumentCheckpoint of the document (or None)
+        pdf_bytes: PDF used to generate the summary
+        events: Optional ProgressEvents receiving the status messages
+            (rendered with st.* when omitted)
         
     Returns:
-        standardized_image: PIL.Image object
-        img_base64: Base64 encoded image for API
+        str: The PTW summary
     """
-    # Preserve original colors (especially blue ink for signatures)
-    # We'll keep the original color mode instead of converting to grayscale
-    # This ensures blue ink signatures remain clearly visible
-    
-    # Calculate target dimensions (assume 72 DPI source if unknown)
-    source_dpi = getattr(image, 'info', {}).get('dpi', (72, 72))[0]
-    width, height = image.size
-    
-    # Calculate scaling factor to reach target DPI
-    scale_factor = target_dpi / source_dpi
-    target_width = int(width * scale_factor)
-    target_height = int(height * scale_factor)
-    
-    # Limit dimensions to prevent excessively large images (max 2500 pixels in any dimension)
-    max_dimension = 2500
-    if target_width > max_dimension or target_height > max_dimension:
-        ratio = min(max_dimension / target_width, max_dimension / target_height)
-        target_width = int(target_width * ratio)
-        target_height = int(target_height * ratio)
-    
-    # Resize using high-quality interpolation
-    resized_image = image.resize((target_width, target_height), Image.LANCZOS)
+    events = events or StreamlitEvents()
+    if checkpoint is not None and checkpoint.summary:
+        events.message("info", "Resumo da PT recuperado da análise anterior deste documento")
+        return checkpoint.summary
+    
+    events.message("info", "Gerando resumo da PT com Wonder Wise...")
+    ptw_summary = generate_ptw_summary(pdf_bytes, events)
+    # The default summary returned when every approach failed is not worth keeping
+    if checkpoint is not None and not ptw_summary.startswith("Resumo da PT: Este é um resumo padrão"):
+        get_checkpoint_store().save_document(checkpoint.doc_key, summary=ptw_summary)
+    return ptw_summary
+
+def get_ocr_cache_key(page_image):
+    """
+    Build the OCR cache key for a page image.
     
-    # Apply contrast enhancement
-    enhancer = ImageEnhance.Contrast(resized_image)
-    enhanced_image = enhancer.enhance(1.5)  # Increase contrast by 50%
+    Args:
+        page_image: RenderedPage (hash computed at render time) or PIL.Image object
+        
+    Returns:
+        str: Cache key covering the image content, OCR prompt version and model
+    """
+    return get_ocr_cache().make_key(page_content_hash(page_image), OCR_PROMPT_VERSION, OCR_MODEL)
+
+def get_analysis_cache_key(ocr_text, ptw_summary, page_num, permit_number):
+    """
+    Build the analysis cache key for a page.
     
-    # Apply mild sharpening for better text edges
-    enhanced_image = enhanced_image.filter(ImageFilter.SHARPEN)
+    The key covers every input of the analysis call: the normalized OCR text,
+    a digest of the PTW summary, the analysis prompt version and the model. The
+    page and permit numbers are included because they are rendered into the
+    prompt and into the rows of the returned table.
     
-    # Save to buffer with consistent settings
-    img_buffer = io.BytesIO()
-    enhanced_image.save(img_buffer, format='JPEG', optimize=True, quality=85)
-    img_buffer.seek(0)
+    Args:
+        ocr_text: OCR text of the page
+        ptw_summary: Summary of the whole PTW document
+        page_num: Page number (1-based)
+        permit_number: Permit number used in the prompt
+        
+    Returns:
+        str: Cache key for the analysis result
+    """
+    return get_analysis_cache().make_key(
+        hash_bytes(normalize_text(ocr_text)),
+        hash_bytes(ptw_summary or ""),
+        page_num,
+        permit_number,
+        ANALYSIS_PROMPT_VERSION,
+        ANALYSIS_MODEL
+    )
+
+def derive_page_result(twin_result, page_num, twin_page_num):
+    """
+    Reuse the analysis rows of a near-identical page for another page.
     
-    # Check file size and reduce if needed
-    img_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-    final_image = enhanced_image
+    The page number column is rewritten and every row's comment states which
+    page the result was derived from, so reviewers can tell derived rows apart.
     
-    # If still too large, compress further
-    if img_size_mb > 4.5:  # Keep some margin below Claude's 5MB limit
-        compression_quality = 75
-        while img_size_mb > 4.5 and compression_quality > 30:
-            img_buffer = io.BytesIO()
-            final_image.save(img_buffer, format='JPEG', optimize=True, quality=compression_quality)
-            img_buffer.seek(0)
-            img_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-            compression_quality -= 10
+    Args:
+        twin_result: Result rows of the twin page
+        page_num: Page number the rows are derived for
+        twin_page_num: Page number of the twin
+        
+    Returns:
+        list: Result rows for page_num
+    """
+    return [
+        {
+            **row,
+            'page_number': str(page_num),
+            'comments': f"{row['comments']} [Resultado derivado da página {twin_page_num}, praticamente idêntica]"
+        }
+        for row in twin_result or []
+    ]
+
+def show_engine_event(kind, payload):
+    """
+    Render a status message queued by an engine coroutine.
+
+    Called on the Streamlit script thread by model_engine.run() while it waits,
+    so it is the only place engine progress reaches st.*.
+
+    Args:
+        kind: Event type ("message" events are rendered, others are ignored)
+        payload: (level, text) tuple for "message" events
+    """
+    if kind == "message":
+        level, text = payload
+        getattr(st, level, st.info)(text)
+
+class StreamlitEvents(ProgressEvents):
+    """
+    Progress sink rendering events immediately with st.* (script thread only).
     
-    # Base64 encode for Claude
-    img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+    Default sink of the document helpers (page extraction, summary,
+    checkpoints) when they run in the app; headless callers such as
+    ptw_batch pass their own ProgressEvents instead.
+    """
     
-    return final_image, img_base64
-
-def process_page_with_claude_ocr(page_image, page_num=None, use_cache=True):
-    """Process page image with Wonder Wise OCR with caching support."""
-    try:
-        # Apply standardized image processing for consistent OCR
-        if page_num:
-            st.info(f"Padronizando imagem da página {page_num} para OCR consistente...")
-        else:
-            st.info(f"Padronizando imagem para OCR consistente...")
-        
-        # Use our standardization function for consistent image processing
-        standardized_image, img_base64 = standardize_image(page_image)
-        
-        # Get the size after standardization
-        img_buffer = io.BytesIO()
-        standardized_image.save(img_buffer, format='JPEG', optimize=True)
-        img_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-        
-        if page_num:
-            st.info(f"Página {page_num} padronizada para OCR: {img_size_mb:.2f}MB, resolução otimizada")
-        else:
-            st.info(f"Imagem padronizada para OCR: {img_size_mb:.2f}MB, resolução otimizada")
-        
-        # Call Wonder Wise for OCR (keeping prompt in English)
-        ocr_response = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=25000,
-            timeout=900,
-            temperature=0,
-            system="""You are an expert OCR system for analyzing standardized, pre-processed document images. Your primary responsibilities are:
+    def __init__(self):
+        """Initialize the sink; the progress bar is created on first use."""
+        super().__init__()
+        self._progress_bar = None
+    
+    def message(self, level, text):
+        show_engine_event("message", (level, text))
+    
+    def emit(self, kind, payload):
+        # "progress" payloads are (fraction, text), or None once done
+        if kind == "progress":
+            if payload is None:
+                if self._progress_bar is not None:
+                    self._progress_bar.empty()
+                    self._progress_bar = None
+                return
+            if self._progress_bar is None:
+                self._progress_bar = st.progress(0)
+            fraction, text = payload
+            self._progress_bar.progress(fraction, text=text)
+            return
+        show_engine_event(kind, payload)
+
+# OCR prompts for single-page calls (keeping in English). The system prompt is
+# static and sent as a cacheable block; the instructions follow the page image,
+# so they stay outside the cached prefix.
+OCR_SYSTEM_PROMPT = """You are an expert OCR system for analyzing standardized, pre-processed document images. Your primary responsibilities are:
 
 CRITICAL: DOCUMENT COLOR IDENTIFICATION
 - Look for and PROMINENTLY report any indicators of document color/type:
@@ -1100,22 +1059,9 @@ SPECIAL INSTRUCTIONS:
   * These ALWAYS have a safety technician signature requirement
   * The signature section is at the ABSOLUTE BOTTOM of the page
   * Scan past any blank space to find the signature area
-  * Report specifically on the "Técnico de Segurança" signature status""",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": img_base64
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": f"""Please perform OCR analysis on this document image and provide a detailed extraction following these guidelines:
+  * Report specifically on the "Técnico de Segurança" signature status"""
+
+OCR_PAGE_INSTRUCTIONS = """Please perform OCR analysis on this document image and provide a detailed extraction following these guidelines:
 
 GENERAL EXTRACTION:
 - Extract ALL printed text maintaining the original layout and structure
@@ -1243,1006 +1189,435 @@ FINAL VERIFICATION:
   * Stamps that satisfy mandatory requirements
   * Signature fields at the bottom of the form
   * Colored pre-printed text that should NOT be marked as filled"""
-                        }
-                    ]
-                }
-            ]
-        )
-        
-        # Get OCR text
-        ocr_text = ocr_response.content[0].text
-        return ocr_text
-        
-    except Exception as e:
-        error_msg = f"Erro ao realizar OCR com Wonder Wise: {str(e)}"
-        if page_num:
-            st.error(f"Erro ao realizar OCR com Wonder Wise na página {page_num}: {str(e)}")
-        else:
-            st.error(error_msg)
-        return f"Processamento OCR falhou: {str(e)}"
-
-# Special section verification functions
-def verify_section_14(ocr_text):
-    """Special verification for Section 14 (Simultaneous Operations)"""
-    # Look for section 14 heading in OCR text
-    section_found = False
-    yes_checked = False
-    fields_filled = False
+
+OCR_REGION_INSTRUCTIONS = """The images above are regions cropped from a digitally generated form page whose printed text was already read from the PDF's text layer. Transcribe ONLY what is visible in each region, following the same conventions as full-page OCR:
+- Label each answer with its region header (e.g. "REGION 1:")
+- Signature areas: [Signed], [Empty] or [Unclear], with the name/role printed next to it if visible
+- Checkboxes: [Checked] or [Unchecked] followed by the label text next to the box
+- Stamps and seals: note their presence and transcribe their readable text
+- Handwritten entries: [Filled] (do not reproduce the handwriting), or [Empty]
+- Anything else: a short description, or [UNCLEAR]
+Do NOT repeat or summarize the printed text of the page."""
+
+def skipped_copy_ocr_text(guide_color, confidence):
+    """
+    Build the placeholder OCR text for a carbon copy identified by its paper color and header.
     
-    for line in ocr_text.lower().split('\n'):
-        # Check if section 14 is present
-        if "seção 14" in line or "secao 14" in line or "section 14" in line or "14 - operações simultâneas" in line:
-            section_found = True
-        
-        # Check if "Yes" is checked
-        if "[checked: sim]" in line.lower() or "[checked: yes]" in line.lower():
-            yes_checked = True
-        
-        # Check if required fields are filled when "Yes" is checked
-        if yes_checked and ("[filled field:" in line.lower() or "[filled]" in line.lower()):
-            fields_filled = True
+    The [DOCUMENT TYPE] marker makes detect_guide_color() route the page to the
+    N/A row, so neither OCR nor analysis calls the API.
     
-    # Only return a decision if we found the section
-    if section_found:
-        if yes_checked and not fields_filled:
-            return "REPROVADO", "Seção 14: Marcado 'Sim' para operações simultâneas, mas campos obrigatórios não foram preenchidos."
-        elif yes_checked and fields_filled:
-            return "APROVADO", "Seção 14: Operações simultâneas corretamente documentadas com campos preenchidos."
-        else:
-            return "APROVADO", "Seção 14: Não há operações simultâneas (opção 'Não' selecionada ou formulário N/A)."
+    Args:
+        guide_color: "VERDE" or "AMARELA"
+        confidence: Classifier confidence (0-1)
+        
+    Returns:
+        str: Placeholder OCR text
+    """
+    return (
+        f"[DOCUMENT TYPE: GUIA {guide_color}]\n"
+        f"[OCR skipped: copy identified from paper color and header, confidence {confidence:.0%}]"
+    )
+
+async def transcribe_page_regions(page, page_num=None, events=None):
+    """
+    Complete the text layer of a digital page with vision OCR of its visual regions.
     
-    # If section not found, return None to let Claude decide
-    return None, None
-
-def verify_section_15(ocr_text):
-    """Special verification for Section 15 (Co-issuer)"""
-    # Look for section 15 in OCR text
-    section_found = False
-    name_fields = []
-    signature_fields = []
+    Only the crops of the areas without embedded text (signatures, stamps,
+    checkboxes) are sent, all in one call.
     
-    for line in ocr_text.lower().split('\n'):
-        # Check if section 15 is present
-        if "seção 15" in line or "secao 15" in line or "section 15" in line or "15 - co-emissor" in line:
-            section_found = True
-        
-        # Track filled name fields
-        if "[filled field: name]" in line.lower() or "[filled field: nome]" in line.lower():
-            name_fields.append(True)
+    Args:
+        page: RenderedPage with a text layer and text_regions
+        page_num: Page number used in status messages (optional)
+        events: ProgressEvents receiving status messages (optional)
         
-        # Track signature fields
-        if "[signed]" in line.lower() or "[assinado]" in line.lower():
-            signature_fields.append(True)
-    
-    # Only return a decision if we found the section
-    if section_found:
-        # Check if there's a mismatch between names and signatures
-        if len(name_fields) != len(signature_fields) and (len(name_fields) > 0 or len(signature_fields) > 0):
-            return "REPROVADO", "Seção 15: Inconsistência entre campos de nome e assinatura. Todos os campos preenchidos devem ter assinaturas correspondentes."
-        else:
-            return "APROVADO", "Seção 15: Campos de co-emissor corretamente preenchidos ou adequadamente vazios."
+    Returns:
+        str: The text layer followed by the transcription of the regions
+    """
+    events = events or NullEvents()
+    if page_num:
+        events.message("info", f"Página {page_num} lida da camada de texto do PDF - {len(page.text_regions)} região(ões) visual(is) enviada(s) ao OCR")
+    
+    content = []
+    for number, region in enumerate(page.text_regions, 1):
+        content.append({"type": "text", "text": f"---- REGION {number} ----"})
+        content.append({
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": region.media_type,
+                "data": region.base64()
+            }
+        })
+    content.append({"type": "text", "text": OCR_REGION_INSTRUCTIONS})
+    
+    response = await model_engine.create_message(
+        label=f"OCR regions page {page_num}" if page_num else "OCR regions",
+        model=OCR_MODEL,
+        max_tokens=4000,
+        timeout=300,
+        temperature=0,
+        system=[cacheable_text_block(OCR_SYSTEM_PROMPT)],
+        messages=[{"role": "user", "content": content}]
+    )
+    
+    return f"{page.text_layer}\n\n[VISUAL REGIONS: transcribed by vision OCR]\n{response.content[0].text}"
+
+async def ocr_page_async(page_image, page_num=None, use_cache=True, events=None):
+    """
+    OCR a page image on the model engine loop.
     
-    # If section not found, return None to let Claude decide
-    return None, None
-
-def verify_section_18(ocr_text):
-    """Special verification for Section 18 (Awareness of Work Permit)"""
-    # Look for section 18 in OCR text
-    section_found = False
-    name_fields = []
-    function_fields = []
-    signature_fields = []
+    This is the UI-free core of process_page_with_claude_ocr: status messages
+    are reported through events instead of st.* so it can run concurrently
+    with other pages on the engine loop.
     
-    for line in ocr_text.lower().split('\n'):
-        # Check if section 18 is present
-        if "seção 18" in line or "secao 18" in line or "section 18" in line or "18 - ciência da pt" in line:
-            section_found = True
-        
-        # Track filled name fields
-        if "[filled field: name]" in line.lower() or "[filled field: nome]" in line.lower():
-            name_fields.append(True)
+    Args:
+        page_image: RenderedPage (never decoded here) or PIL.Image object of the page
+        page_num: Page number used in status messages (optional)
+        use_cache: Look up and store the transcription in the OCR cache
+        events: ProgressEvents receiving status messages (optional)
         
-        # Track filled function fields
-        if "[filled field: function]" in line.lower() or "[filled field: função]" in line.lower():
-            function_fields.append(True)
+    Returns:
+        str: The OCR text
         
-        # Track signature fields
-        if "[signed]" in line.lower() or "[assinado]" in line.lower():
-            signature_fields.append(True)
-    
-    # Only return a decision if we found the section
-    if section_found:
-        # Check if at least one row is complete, or if all rows are empty
-        if (len(name_fields) > 0 and len(function_fields) > 0 and len(signature_fields) > 0):
-            return "APROVADO", "Seção 18: Pelo menos uma linha completa com nome, função e assinatura."
-        elif (len(name_fields) == 0 and len(function_fields) == 0 and len(signature_fields) == 0):
-            return "APROVADO", "Seção 18: Seção completamente vazia, o que é aceitável."
+    Raises:
+        Exception: Any error of the OCR call, so that callers never mistake a
+            failure for the page's text (nothing is cached for the page)
+    """
+    events = events or NullEvents()
+    page = page_image
+    thumbnail = page_thumbnail(page)
+    
+    # Green and yellow copies are not audited: the paper color names a candidate,
+    # which skips the API once the page header confirms it (photos and pages
+    # without a known render resolution are not classified); otherwise the
+    # triage model decides on its own, at its own confidence threshold
+    text_layer = getattr(page, "text_layer", None)
+    photo = getattr(page, "dpi", None) is None
+    paper_color, paper_confidence = await asyncio.to_thread(is_skippable_copy, thumbnail, photo)
+    if paper_color and header_names_copy(text_layer, paper_color):
+        if page_num:
+            events.message("info", f"Página {page_num} identificada pela cor do papel e pelo cabeçalho como GUIA {paper_color} (confiança {paper_confidence:.0%}) - OCR ignorado")
         else:
-            return "REPROVADO", "Seção 18: Informações parciais detectadas. Cada linha deve ter nome, função e assinatura ou estar completamente vazia."
+            events.message("info", f"Página identificada pela cor do papel e pelo cabeçalho como GUIA {paper_color} (confiança {paper_confidence:.0%}) - OCR ignorado")
+        return skipped_copy_ocr_text(paper_color, paper_confidence)
     
-    # If section not found, return None to let Claude decide
-    return None, None
-
-def verify_section_20(ocr_text):
-    """Special verification for Section 20 (Closure)"""
-    # Look for section 20 in OCR text
-    section_found = False
-    has_checkbox = False
+    # Digitally generated pages with nothing but text are read from the PDF itself
+    if text_layer is not None and not page.text_regions:
+        if page_num:
+            events.message("info", f"Página {page_num} lida da camada de texto do PDF - OCR por visão dispensado")
+        return text_layer
+    
+    # Reuse a previous transcription of this exact page if available
+    cache_key = None
+    if use_cache:
+        cache_key = await asyncio.to_thread(get_ocr_cache_key, page)
+        cached_text = await asyncio.to_thread(get_ocr_cache().get, cache_key)
+        if cached_text is not None:
+            if page_num:
+                events.message("info", f"OCR da página {page_num} recuperado do cache")
+            return cached_text
+    
+    # A small model routes third-party JSAs, carbon copies and blank pages past OCR and analysis
+    if TRIAGE_ENABLED and isinstance(page, RenderedPage):
+        decision = await triage_page(page, page_num)
+        # Only answers above TRIAGE_MIN_CONFIDENCE skip, whatever the paper color suggested
+        if decision is not None and decision.skip:
+            page_label = f"GUIA {decision.guide_color}" if decision.page_type == "color_copy" else {
+                "third_party_jsa": "JSA de terceiros",
+                "blank": "página em branco"
+            }[decision.page_type]
+            events.message("info", f"Página {page_num or ''} classificada pela triagem como {page_label} (confiança {decision.confidence:.0%}) - OCR e análise dispensados")
+            return decision.ocr_text()
+    
+    # Digital pages with signatures, stamps or checkboxes only send those regions
+    if text_layer is not None:
+        try:
+            ocr_text = await transcribe_page_regions(page, page_num, events)
+            if cache_key:
+                await asyncio.to_thread(get_ocr_cache().put, cache_key, ocr_text)
+            return ocr_text
+        except Exception as e:
+            events.message("warning", f"OCR das regiões da página {page_num or ''} falhou, usando OCR da página inteira: {str(e)}")
+    
+    # Apply standardized image processing for consistent OCR
+    if page_num:
+        events.message("info", f"Padronizando imagem da página {page_num} para OCR consistente...")
+    else:
+        events.message("info", f"Padronizando imagem para OCR consistente...")
     
-    for line in ocr_text.lower().split('\n'):
-        # Check if section 20 is present
-        if "seção 20" in line or "secao 20" in line or "section 20" in line or "20 - encerramento" in line:
-            section_found = True
-        
-        # Check for checkbox indicators
-        if "[checked:" in line.lower() and ("término do trabalho" in line.lower() or 
-                                          "acidente" in line.lower() or 
-                                          "outros" in line.lower()):
-            has_checkbox = True
+    # Use our standardization function for consistent image processing
+    # (CPU-bound, so it runs in the rasterization worker pool, off the engine loop)
+    standardized_data = await standardize_page_async(page)
+    img_base64 = base64.b64encode(standardized_data).decode("utf-8")
+    img_size_mb = len(standardized_data) / (1024 * 1024)
     
-    # Only return a decision if we found the section
-    if section_found:
-        if has_checkbox:
-            return "APROVADO", "Seção 20: Motivo de encerramento devidamente marcado."
-        else:
-            # Double-check for various checkbox patterns that might be missed
-            closure_terms = ["encerramento", "closure", "término", "termino", "trabalho concluído", "trabalho concluido"]
-            checkbox_lines = [line for line in ocr_text.lower().split('\n') if any(term in line.lower() for term in closure_terms)]
-            
-            if len(checkbox_lines) > 0:
-                # If we found lines with closure terms, look more carefully for checkbox indicators
-                for line in checkbox_lines:
-                    if "checked" in line or "marcado" in line or "selected" in line or "selecionado" in line:
-                        return "APROVADO", "Seção 20: Motivo de encerramento devidamente marcado (detectado em análise secundária)."
-            
-            return "REPROVADO", "Seção 20: Nenhum motivo de encerramento selecionado. Um dos três motivos deve ser marcado."
+    if page_num:
+        events.message("info", f"Página {page_num} padronizada para OCR: {img_size_mb:.2f}MB, resolução otimizada")
+    else:
+        events.message("info", f"Imagem padronizada para OCR: {img_size_mb:.2f}MB, resolução otimizada")
+    
+    # Call Wonder Wise for OCR (keeping prompt in English)
+    ocr_started = time.monotonic()
+    ocr_response = await model_engine.create_message(
+        label=f"OCR page {page_num}" if page_num else "OCR",
+        model=OCR_MODEL,
+        max_tokens=25000,
+        timeout=900,
+        temperature=0,
+        system=[cacheable_text_block(OCR_SYSTEM_PROMPT)],
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "image/jpeg",
+                            "data": img_base64
+                        }
+                    },
+                    {
+                        "type": "text",
+                        "text": OCR_PAGE_INSTRUCTIONS
+                    }
+                ]
+            }
+        ]
+    )
+    
+    # Get OCR text
+    ocr_text = ocr_response.content[0].text
+    get_triage_stats().record_stage("ocr", time.monotonic() - ocr_started)
     
-    # If section not found, return None to let Claude decide
-    return None, None
+    # Only successful transcriptions are cached
+    if cache_key:
+        await asyncio.to_thread(get_ocr_cache().put, cache_key, ocr_text)
+    
+    return ocr_text
+
+# Start of the text the synchronous OCR wrapper returns instead of a transcription on error
+OCR_FAILURE_PREFIX = "Processamento OCR falhou"
 
-def analyze_page_with_claude(ocr_text, ptw_summary, page_num, permit_number=None, doc_hash=None):
-    """Analyze the page OCR text using Wonder Wise API with the master prompt and verification."""
+def process_page_with_claude_ocr(page_image, page_num=None, use_cache=True):
+    """Process page image with Wonder Wise OCR with caching support (an OCR_FAILURE_PREFIX message on error)."""
+    events = ProgressEvents()
     try:
-        # Check if we should use cached analysis results
-        if doc_hash is not None:
-            # Try to get cached analysis result
-            analysis_cache_key = f"analysis_{doc_hash}_{page_num}"
-            if analysis_cache_key in st.session_state:
-                st.info(f"Using cached analysis for page {page_num}")
-                return st.session_state[analysis_cache_key]
-        
-        # Detect guide color - this is a critical pre-screening step
-        guide_color = detect_guide_color(ocr_text)
-        
-        # Skip non-white guides unless filtering is disabled
-        if guide_color in ["VERDE", "AMARELA"]:
-            st.info(f"Página {page_num} identificada como GUIA {guide_color} - não sujeita a verificação")
-            # Create a standardized "NOT APPLICABLE" response
-            na_response = f"""
-| {permit_number or "Desconhecido"} | {page_num} | GUIA {guide_color} | Documento Completo | N/A | NÃO APLICÁVEL - Cópia não sujeita a verificação (GUIA {guide_color}) |
-"""
-            return na_response
-        
-        # Try to extract permit number if not provided
-        final_permit_number = permit_number
+        return model_engine.run(ocr_page_async(page_image, page_num, use_cache, events), events, show_engine_event)
+    except Exception as e:
+        if page_num:
+            st.error(f"Erro ao realizar OCR com Wonder Wise na página {page_num}: {str(e)}")
+        else:
+            st.error(f"Erro ao realizar OCR com Wonder Wise: {str(e)}")
+        return f"{OCR_FAILURE_PREFIX}: {str(e)}"
+
+async def analyze_page_async(ocr_text, ptw_summary, page_num, permit_number=None, use_cache=True, events=None):
+    """
+    Analyze a page's OCR text on the model engine loop.
+    
+    This is the UI-free core of analyze_page_with_claude: status messages are
+    reported through events instead of st.* so it can run concurrently with
+    other pages on the engine loop.
+    
+    Args:
+        ocr_text: OCR text of the page
+        ptw_summary: Summary of the whole PTW document
+        page_num: Page number (1-based)
+        permit_number: Permit number (extracted from the text if not given)
+        use_cache: Look up and store the analysis rows in the analysis cache
+        events: ProgressEvents receiving status messages (optional)
         
-        if not final_permit_number:
-            # Use our extract_permit_number function
-            final_permit_number = extract_permit_number(ocr_text, ptw_summary) or "Unknown"
+    Returns:
+        list: Verified result rows of the page (see analysis_rows)
         
-        # Master analysis prompt (keeping in English)
-        master_prompt = f"""
-
-<max_thinking_length>43622</max_thinking_length>
-
-You are an elite Permit to Work (PTW) Auditing Specialist with 20+ years of experience in offshore drilling safety compliance. Your expertise is in analyzing Work at Heights permits with meticulous attention to detail, applying a strict interpretation of regulatory standards and company procedures. Your task is to thoroughly evaluate PTW documents based on OCR-extracted text to identify compliance issues with laser precision.
+    Raises:
+        Exception: Any error of the analysis call, so that a rate limit or a
+            timeout is never recorded as the page's verdict
+    """
+    events = events or NullEvents()
+    # Detect guide color - this is a critical pre-screening step
+    guide_color = detect_guide_color(ocr_text)
+    
+    # Skip non-white guides unless filtering is disabled
+    if guide_color in ["VERDE", "AMARELA"]:
+        events.message("info", f"Página {page_num} identificada como GUIA {guide_color} - não sujeita a verificação")
+        # Create a standardized "NOT APPLICABLE" response
+        return [result_row(
+            permit_number, page_num, f"GUIA {guide_color}", "Documento Completo", STATUS_NOT_APPLICABLE,
+            f"NÃO APLICÁVEL - Cópia não sujeita a verificação (GUIA {guide_color})"
+        )]
+    
+    # Third-party JSAs and blank pages are not audited either (marker from OCR or triage)
+    page_text = (ocr_text or "").strip()
+    if page_text.startswith(THIRD_PARTY_JSA_MARKER):
+        events.message("info", f"Página {page_num} identificada como JSA de terceiros - não sujeita a verificação")
+        return [result_row(
+            permit_number, page_num, "JSA de Terceiros", "Documento Completo", STATUS_NOT_APPLICABLE,
+            "NÃO APLICÁVEL - JSA de outra empresa, não sujeita a verificação"
+        )]
+    if page_text.startswith(BLANK_PAGE_MARKER):
+        events.message("info", f"Página {page_num} identificada como página em branco - não sujeita a verificação")
+        return [result_row(
+            permit_number, page_num, "Página em Branco", "Documento Completo", STATUS_NOT_APPLICABLE,
+            "NÃO APLICÁVEL - Página sem conteúdo de formulário"
+        )]
+    
+    # Try to extract permit number if not provided
+    final_permit_number = permit_number
+    
+    if not final_permit_number:
+        # Use our extract_permit_number function
+        final_permit_number = extract_permit_number(ocr_text, ptw_summary) or "Unknown"
+    
+    # Handle case where OCR text failed (providing in Portuguese)
+    if not page_text or page_text.startswith(OCR_FAILURE_PREFIX):
+        # Provide a default response for this case
+        return [result_row(
+            None, page_num, f"Página {page_num}", "Conteúdo do Documento", STATUS_REPROVED,
+            "Deficiência crítica: Não foi possível analisar o documento devido à falha no processamento OCR. A imagem original deve ser revisada manualmente."
+        )]
+    
+    # Sections decided by the deterministic rules are not sent to the model,
+    # and a page whose detected sections are all decided skips the call
+    decisions = [decision for decision in evaluate_section_rules(ocr_text) if decision.decided]
+    decided_sections = [decision.rule.section for decision in decisions]
+    decided_packs = {section_pack_name(section) for section in decided_sections}
+    if decisions and all(pack.name in decided_packs for pack in detect_prompt_packs(ocr_text)):
+        events.message("info", f"Página {page_num} decidida pelas regras determinísticas - análise do modelo dispensada")
+        return apply_section_verification([], decisions, page_num, final_permit_number)
+    
+    # Reuse the rows of this exact page if it was analysed before
+    cache_key = None
+    rows = None
+    if use_cache:
+        cache_key = get_analysis_cache_key(ocr_text, ptw_summary, page_num, final_permit_number)
+        cached_rows = await asyncio.to_thread(get_analysis_cache().get, cache_key)
+        if cached_rows is not None:
+            rows = json.loads(cached_rows)
+            events.message("info", f"Análise da página {page_num} recuperada do cache")
+    
+    if rows is None:
+        analysis_started = time.monotonic()
+        rows = await request_page_analysis(ocr_text, ptw_summary, page_num, final_permit_number, decided_sections)
+        get_triage_stats().record_stage("analysis", time.monotonic() - analysis_started)
+        if not rows:
+            rows = [result_row(
+                final_permit_number, page_num, f"Página {page_num}", "Conteúdo do Documento", STATUS_HUMAN_CHECK,
+                "Falha na análise. O modelo não registrou resultados para a página. A página requer verificação manual."
+            )]
+        elif cache_key:
+            await asyncio.to_thread(get_analysis_cache().put, cache_key, json.dumps(rows, ensure_ascii=False))
+    
+    # Add the rows of the sections decided by the rules (they replace any row the model wrote for them)
+    return apply_section_verification(rows, decisions, page_num, final_permit_number)
+
+def analyze_page_with_claude(ocr_text, ptw_summary, page_num, permit_number=None, use_cache=True):
+    """Analyze the page OCR text using Wonder Wise API with the analysis prompts and verification."""
+    events = ProgressEvents()
+    try:
+        return model_engine.run(
+            analyze_page_async(ocr_text, ptw_summary, page_num, permit_number, use_cache, events),
+            events,
+            show_engine_event
+        )
+    except Exception as e:
+        st.error(f"Erro ao analisar página com Wonder Wise: {str(e)}")
+        # Provide a generic fallback row (in Portuguese)
+        return [result_row(
+            None, page_num, f"Página {page_num}", "Conteúdo do Documento", STATUS_REPROVED,
+            f"Deficiência crítica: Ocorreu um erro durante a análise: {str(e)}. A imagem original deve ser revisada manualmente."
+        )]
 
-## CRITICAL GUIDE COLOR POLICY
-ONLY "GUIA BRANCA" (WHITE COPY) documents should be audited for compliance.
-- If the document is identified as "GUIA VERDE" (green copy) or "GUIA AMARELA" (yellow copy), DO NOT EVALUATE IT.
-- For any "GUIA VERDE" or "GUIA AMARELA" pages, respond with "NÃO APLICÁVEL - Cópia não sujeita a verificação" and mark the status as "N/A"
-- For a document with no clear color identification, proceed with normal evaluation
-- Check for color indicators like "[DOCUMENT TYPE: GUIA VERDE]" at the beginning of the OCR text
-- Also look for text mentioning "Via Verde", "Guia Amarela", etc. throughout the document
+async def request_page_analysis(ocr_text, ptw_summary, page_num, permit_number, decided_sections=()):
+    """
+    Send one page to the analysis model and return its validated result rows.
+    
+    The request is laid out for prompt caching: the static common prompt is
+    cached across every permit, the PTW summary across the pages of one
+    permit, and only the page-specific block is processed from scratch. That
+    block carries the rules of the sections and attachments detected in the
+    OCR text (see analysis_prompts.build_page_rules) instead of every rule.
+    
+    The model must answer through the RESULT_TOOL tool, so the findings come
+    back as JSON matching its schema instead of a markdown table.
+    
+    Args:
+        ocr_text: OCR text of the page
+        ptw_summary: Summary of the whole PTW document
+        page_num: Page number (1-based)
+        permit_number: Permit number of the document
+        decided_sections: Sections already decided by the section rules; their
+            rules are left out and the model is told to skip them
+        
+    Returns:
+        list: Result rows recorded by the model (empty if it recorded none)
+    """
+    decided_note = ""
+    if decided_sections:
+        decided_note = (
+            f"\nSections {', '.join(decided_sections)} of this page were already decided by deterministic checks: "
+            "do not analyze them or record entries for them.\n"
+        )
+    
+    # Prepare the message for Wonder Wise (keeping in English)
+    messages = [
+        {
+            "role": "user", 
+            "content": [
+                cacheable_text_block(f"""
+Here is a summary of the Permit to Work document being analyzed:
 
+{ptw_summary}
+"""),
+                {
+                    "type": "text",
+                    "text": f"""
 ## Document Information
-Permit Number: {final_permit_number}
+Permit Number: {permit_number}
 Page Number: {page_num}
 
-## OCR Output Interpretation Guide
-
-You will receive text extracted by an OCR system with standardized formatting. Interpret this formatted output as follows:
-
-### Signature Field Interpretation
-- **[Signed]** = Field contains a valid signature (treat as FILLED in your verification table)
-- **[Empty]** = No signature present (treat as EMPTY in your verification table)
-- **[Unclear signature]** = Ambiguous mark (treat as EMPTY unless context clearly indicates intention to sign)
-- **[Stamp: CONTENT]** = Official stamp present (treat as valid SIGNATURE for appropriate fields)
-
-### Form Field Interpretation
-- **[Filled field: FIELD_NAME]** = Field contains handwritten content (treat as FILLED)
-- **[Empty field: FIELD_NAME]** = Field has no content (treat as EMPTY)
-- **[UNCLEAR]** or **[ILLEGIBLE]** = Content exists but cannot be reliably determined (evaluate based on context)
-
-### Checkbox/Option Interpretation
-- **[Checked: OPTION_TEXT]** = Option has been selected (treat as answered/marked)
-- **[Unchecked: OPTION_TEXT]** = Option has not been selected
-- Multiple **[Checked]** options in mutually exclusive fields = Potential error requiring scrutiny
-
-When creating your signature verification tables and section evaluations, translate these OCR markers directly into your FILLED/EMPTY determinations.
-
-## Critical Auditing Philosophy
-
-1. **Conservative Approach**: When in doubt, err on the side of HUMAN CONFIRMATION REQUIRED. Safety documentation must be unambiguously complete and correct.
-2. **Methodical Process**: You will follow a rigid, step-by-step verification process for every section.
-3. **Zero Tolerance**: Partially completed fields or missing signatures are NEVER acceptable when required.
-4. **Visual Verification**: All signature/handwriting determinations must be based on the OCR system's output regarding blue or black ink.
-5. **Double-Check Protocol**: Every signature field must be verified twice before making a final determination.
-
-## CRITICAL: SECTION EVALUATION RESTRICTIONS
-
-**MANDATORY RULE**: You are ONLY allowed to evaluate sections that have EXPLICIT instructions below. 
-**FORBIDDEN**: You MUST NOT evaluate, analyze, or provide opinions on any section without clear instructions.
-**Auto-approval rule**: If a section appears in the OCR but has no instructions, automatically mark it as APPROVED without analysis
-**Authorized sections with instructions**: 1, 3, 3.1, 5, 6, 7, 8, 9, 10, 11, 12, 14, 15, 17, 18, 19, 20
-**Unauthorized sections**: Any section not listed above (like 4, 13, 16, etc.) should be auto-approved silently
-**Safety requirement**: Never make up evaluation criteria - only follow provided instructions
-
-## Balancing Rigor and Flexibility
-
-- The safety remains the priority, however real-world documents rarely achieve perfection
-- In cases of minor doubt, prefer APPROVED if there is no direct impact on operational safety
-- If an OCR output indicates content is present but unclear, consider the context before deciding
-- Partial completion of descriptive fields should generally be accepted
-- If the intent of the filled information is clear, even if execution is imperfect, consider APPROVED
-- Reserve "REPROVED" for clear violations of safety requirements, not for aesthetic filling failures
-- When it's truly impossible to determine, use "HUMAN VERIFICATION REQUIRED" instead of automatically rejecting
-
-## MANDATORY SIGNATURE VERIFICATION PROTOCOL
-
-When analyzing any document with signature fields, you MUST think through this process methodically:
+{build_page_rules(ocr_text, decided_sections)}
+{decided_note}
+Now, I am providing you with the OCR text from page {page_num}. Please analyze this text according to the methodology provided and list any issues or compliance problems you find:
 
-### STEP 1: Document Type Identification
-First, identify what type of document you are analyzing based on the OCR output:
-- Main PTW form
-- JSA (Job Safety Analysis)
-- PRTA (Rescue Plan for Work at Height)
-- CLPTA (Checklist for Work at Height Planning)
-- CLPUEPCQ (Checklist - Pre-Use of Fall Protection Equipment)
-- ATASS (Health Sector Authorization)
-- LVCTA (Verification List for Work Basket)
+OCR TEXT:
+{ocr_text}
 
-## Identification of Document Types
+Record your analysis with the {RESULT_TOOL_NAME} tool, following ALL the output rules. Create ONE ENTRY PER SECTION analyzed - NEVER combine multiple sections in a single entry.
+"""
+                }
+            ]
+        }
+    ]
+    
+    # Call Wonder Wise API with streaming (long responses exceed the non-streaming time limit)
+    response = await model_engine.stream_message(
+        label=f"analysis page {page_num}",
+        model=ANALYSIS_MODEL,
+        max_tokens=30000,
+        temperature=0,
+        timeout=900,
+        system=[cacheable_text_block(ANALYSIS_SYSTEM_PROMPT)],
+        tools=[RESULT_TOOL],
+        tool_choice={"type": "tool", "name": RESULT_TOOL_NAME},
+        messages=messages
+    )
+    
+    return rows_from_tool_input(message_tool_input(response, RESULT_TOOL_NAME), page_num, permit_number)
 
-To correctly identify each document, check these distinctive characteristics in the OCR output:
+# OCR prompts for batch calls (keeping in English); both are static and cacheable
+OCR_BATCH_SYSTEM_PROMPT = """You are an expert OCR system for analyzing standardized, pre-processed document images. Your primary responsibilities are:
 
-### JSA (Job Safety Analysis):
-
-JSA IDENTIFICATION DECISION TREE:
-1. Is this a Constellation JSA? 
-   → Yes: Is it the Constellation flame/drop? 
-      → Yes: ANALYZE
-      → No: RETURN "[THIRD-PARTY JSA - No analysis required]"
-   → No: Check for "Constellation" text anywhere
-      → Found: ANALYZE
-      → Not found: RETURN "[THIRD-PARTY JSA - No analysis required]"
-
-- Format: Matrix with columns for Steps, Hazards, Severity, Frequency, Risk Class
-- Final section: Participants and Safety Technician
-
-### CLPUEPCQ (Pre-Use Fall Protection Equipment Checklist):
-- Page 1: Items 1-21 without signature section
-- Page 2: Remaining items and field for 4 users to sign
-
-### LVCTA (Work Basket Verification List):
-- Characteristics: Numbered items 22-34 related to suspended baskets
-- Final section: 6 specific fields for basket operation-related functions
-
-IMPORTANT: If identification is uncertain, mark as "HUMAN VERIFICATION REQUIRED"
-
-### STEP 2: Locate All Signature Sections
-Precisely identify all sections requiring signatures in the document type, looking for "[Signed]" or "[Empty]" markers.
-
-### STEP 3: Create Visual Verification Table
-For EACH row requiring name and signature verification, you MUST create and fill this table in your thinking:
-
-| Position/Function | Name Field Status | Signature Field Status | Applicable Rule | Compliance Status |
-|-------------------|-------------------|------------------------|-----------------|-------------------|
-| [Function title]  | [FILLED/EMPTY]    | [FILLED/EMPTY]         | [STANDARD/EXCEPTION] | [COMPLIANT/NON-COMPLIANT] |
-
-Rules for filling this table based on OCR output:
-- **Name Field Status**: Mark FILLED if OCR indicates "[Filled field: Name]" or similar
-- **Signature Field Status**: Mark FILLED if OCR indicates "[Signed]" or "[Stamp: CONTENT]"
-- **Applicable Rule**: Mark STANDARD for normal name+signature requirements, EXCEPTION for fields covered by specific exceptions
-- **Compliance Status**: Mark COMPLIANT only if:
-  * BOTH fields are FILLED, OR
-  * BOTH fields are EMPTY, OR
-  * The field follows an EXCEPTION rule and meets its specific requirements
-
-Mark NON-COMPLIANT if:
-  * Name field is FILLED but Signature field is EMPTY (unless covered by an exception)
-  * Signature field is FILLED but Name field is EMPTY (unless covered by an exception)
-
-## Exceptions to Name+Signature Requirements
-
-For the documents below, specific rules apply:
-
-### JSA (Job Safety Analysis):
-- "Safety Technician" field: Requires ONLY SIGNATURE, name field is OPTIONAL
-- "Maritime Operations Superintendent" field: Requires ONLY SIGNATURE, name field is OPTIONAL
-
-### PRTA (Rescue Plan for Work at Height):
-- "Requesting Supervisor" field: Requires ONLY SIGNATURE, name field is OPTIONAL
-- "Safety Technician" field: Requires ONLY SIGNATURE, name field is OPTIONAL
-
-### Section 17 (Release for Work Execution):
-- Mandatory fields: ONLY "Date" and "Time", other fields are OPTIONAL
-- *IMPORTANT* - Ignore the content of date and time, you are not allowed to judge if time and date are correct, just check if they were filled
-
-### Section 20 (Closure):
-- When OCR indicates "[Stamp: CONTENT]", consider it as valid filling for multiple fields
-- Pay Special attention to the check boxes. They are very close to the words, and they mean the reason for the closure. Please dont miss these checkboxes
-
-### STEP 4: Interpreting OCR Signature Indications
-- "[Signed]" in the OCR output indicates a valid signature is present
-- "[Empty]" in the signature field indicates no signature is present
-- "[Unclear signature]" should generally be considered empty unless context strongly suggests otherwise
-- "[Stamp: CONTENT]" should be treated as a valid signature for appropriate fields
-
-### STEP 5: Interpreting Checkbox and Option Markers
-- "[Checked: Yes]" or "[Checked: No]" indicates a valid response to a yes/no question
-- "[Checked: OPTION_TEXT]" indicates a selection has been made
-- "[Unchecked: OPTION_TEXT]" indicates no selection for that option
-- For required selections, at least one "[Checked]" marker must be present
-
-### Stamps and Other Mark Recognition
-
-- "[Stamp: CONTENT]" should be recognized as a valid signature and may satisfy multiple fields
-- For Yes/No fields: "[Checked: Yes]" or "[Checked: No]" is considered valid
-- A "[Checked]" indication for any checkbox or option is considered a valid marking
-- If OCR indicates "[Filled field]" for any field requiring content, consider it filled
-
-### STEP 6: Double-Check Using Explicit Examples
-Before finalizing judgment, verify against these example patterns:
-
-**APPROVED Examples**:
-1. All rows have both name ("[Filled field: Name]") AND signature ("[Signed]") fields filled
-2. Some rows have both name and signature completely empty ("[Empty field]")
-3. Some rows have both name and signature filled; other rows have both empty
-4. A field covered by an exception rule meets its specific requirements (e.g., only signature for Safety Technician in JSA)
-
-**REPROVED Examples**:
-1. ANY row has name filled ("[Filled field: Name]") but signature empty ("[Empty]") (unless covered by an exception)
-2. ANY row has signature filled ("[Signed]") but name empty ("[Empty field: Name]") (unless covered by an exception)
-3. ALL rows are completely empty when at least one completed row is required
-
-## Verification of Mandatory Questions
-
-IMPORTANT: Before considering that a mandatory question was not answered, FIRST check if the question exists in the current OCR output. If the question is not present, ignore this requirement.
-
-For Section 3.1 (Critical Systems/Equipment): 
-- Check ONLY the questions that are visible in the OCR output
-- Different versions of the form may contain different sets of questions
-- NEVER reject a document for missing an answer to a non-existent question
-- **CRITICAL SYSTEMS INTELLIGENCE**: You MUST analyze the work description (from Section 1, summary, or other sections) to identify if any critical systems are affected, then verify this is properly declared in Section 3.1
-- **Cross-Reference Analysis**: Look for keywords in work descriptions like "ballast", "fire system", "ESD", "emergency", "power management", "navigation", "gas detection", "helideck", "lifeboat", etc.
-- **Intelligent Flagging**: If work clearly involves critical systems but Section 3.1 shows "No" for critical questions, this is a MANDATORY REPROVAL for safety compliance
-
-## Comprehensive Audit Methodology
-
-### Phase 1: Document Identification & Classification
-
-1. Immediately identify from OCR output:
-   - Document type and revision number
-   - PTW number (format XXX-XXXXX)
-   - Job classification based on Section 3.3 references
-   - Document version against current standards (EP-036-OFF Rev 44)
-
-### Phase 2: Section-by-Section Critical Analysis
-
-#### Section 1: Work Planning (Planejamento do Trabalho)
-- **Mandatory Field Check**: "Necessário Bloqueio?" field MUST show "[Checked: Yes]" or "[Checked: No]"
-- **Classification Type**: Either "[Checked: Convencional]" or "[Checked: Longo Prazo]" must be present if these options exist
-- RESULT: REPROVED if mandatory fields do not show "[Checked]" status
-
-#### Section 3: Equipment/Tools in Good Condition to be Used
-- **Basic Verification**: Look for "[Checked]" indicators for selected equipment
-- For "Other Equipment/Tools": Any "[Filled field]" indication is sufficient
-- RESULT: APPROVED if relevant fields show "[Checked]" or "[Filled field]" status, OR all Fields showing [Empty] is also accepted
-
-#### Section 3.1: Critical Systems/Equipment
-- **ENHANCED CRITICAL SYSTEMS ANALYSIS**: This section requires intelligent evaluation of work scope vs. critical systems
-- **Step 1 - Basic Question Verification**: Only check questions that actually appear in the OCR output:
-  * "Os equipamentos utilizados na execução da tarefa são considerados críticos?" should show "[Checked: Yes]" or "[Checked: No]"
-  * "Os sistemas/equipamentos em manutenção são considerados críticos?" should show "[Checked: Yes]" or "[Checked: No]"
-  * Only check for other questions if they appear in the OCR output
-- **Step 2 - Critical Systems Cross-Reference**: Analyze work description and affected systems against this MANDATORY critical systems list:
-  * Ballast System, EX Equipment, Rig Structure (DP Vessel and Moored Semi)
-  * Watertight Doors/Hatches/Valves, Weathertight Doors/Hatches, Towing System
-  * Mud Processing Area Ventilation System, Navigation & Obstruction Systems, Weather Station
-  * Power Management System (DP), Fire Detection System, HC Gas Detection System
-  * H2S (Toxic) Gas Detection System, Flood Detection System, Fire Main System
-  * Helideck Fire Fighting System, Drill Floor Deluge System, Fixed Fire Extinguishing Systems
-  * Fireman's Equipment, Portable Fire Extinguishing Appliances, Fire Boundaries
-  * Bilge System, Emergency Communication Systems, Public Address and Alarm System
-  * Drill Floor Hoisting Safety Systems, Motion Compensator System, TR Escape Routes
-  * Temporary Refuge (TR), Emergency Shutdown System (ESD), Remotely Operated Fuel Oil Tank Shut Off
-  * Machinery Valves, Emergency Generator, Helicopter Deck, Lifeboat System
-  * Life-raft System, Escape Ladders to the Sea, Marine Life jackets, Well Test System
-  * Third Party H2S Safety Systems, Shutdowns, Spaces Ventilation System
-- **Step 3 - Compliance Logic**:
-  * IF work affects ANY critical system → "Yes" MUST be checked for critical equipment/systems questions
-  * IF work affects NO critical systems → Either "Yes" or "No" is acceptable (but must be checked)
-  * Look for work descriptions mentioning: maintenance, testing, inspection, modification of above systems
-- **Step 4 - Advanced Analysis**:
-  * Cross-reference Section 1 (work description) and Section 4 (affected areas/systems)
-  * Check if critical system work is properly identified as such
-  * Verify consistency between work scope and critical system declarations
-- RESULT: REPROVED if:
-  * Any visible question lacks "[Checked]" status, OR
-  * Work clearly affects critical systems but "No" is checked for critical questions, OR
-  * Inconsistency between work description and critical system identification
-
-#### Section 5: Safety Barriers
-- **Basic Verification**: Look for "[Checked]" indicators for selected barriers
-- **Detailed Specifications**: The following fields have RECOMMENDED but NOT MANDATORY details:
-  * "Ramal de Emergência da Unidade" - "[Filled field]" is recommended but not mandatory
-  * "Observador trabalho sobre o mar/altura" - "[Filled field]" is recommended but not mandatory
-  * "Velocidade do Vento" - "[Filled field]" is recommended but not mandatory
-- Still check these critical items for "[Filled field]" status where required:
-  * "Tipos de Luvas" - should show "[Filled field]" if selected
-  * "Pitch/Roll/Heave" - should show "[Filled field]" if selected
-  * "Inibir sensor" - should show "[Filled field]" if selected
-- RESULT: APPROVED as this field is not mandatory
-
-#### Section 6: Applicable Procedures and Documents
-- **Documentation Verification**: Look for "[Checked]" indicators for all selected items
-- **Special Attention Items**: These items require "[Filled field]" status if checked:
-  * "Outros (Descrever) (1)" - should show "[Filled field]" if selected
-  * "Outros (Descrever) (2)" - should show "[Filled field]" if selected
-  * "Outros (Descrever) (3)" - should show "[Filled field]" if selected
-- RESULT: APPROVED as this field is not mandatory
-
-#### Section 7: APR/JSA (Risk Assessment)
-- **Assessment Question**: "Foi realizada uma APR e/ou JSA?" must show "[Checked: Yes]" or "[Checked: No]"
-- **Verification**: At least one box must show "[Checked]" status
-- RESULT: REPROVED if question does not show "[Checked]" status
-
-#### Section 8: Participants
-- **Participant Verification**: For each listed participant row:
-  * Both Name ("[Filled field: Name]") AND Signature ("[Signed]") indicators must be present
-  * Empty rows ("[Empty field]") are acceptable but partially filled rows are not
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if any participant has a name field showing "[Filled field]" but signature showing "[Empty]" or vice versa
-
-#### Section 9: Training and Certifications
-- **Certification Question**: "Os executantes estão treinados e possuem as certificações necessárias para a realização da atividade?" must show "[Checked: Yes]" or "[Checked: No]"
-- RESULT: REPROVED if question does not show "[Checked]" status
-
-#### Section 10: Form of Supervision
-- **Supervision Type**: Either "[Checked: Intermitente]" OR "[Checked: Contínua]" must be present
-- RESULT: REPROVED if neither option shows "[Checked]" status
-
-#### Section 11: Pre-Task Meeting
-- **Meeting Verification**: "Foi realizada a reunião pré-tarefa?" must show "[Checked: Yes]" or "[Checked: No]"
-- RESULT: REPROVED if question does not show "[Checked]" status
-
-#### Section 12: Third-Party Authorization Form
-- **Authorization Verification**: "Formulário de autorização de terceiros é válido?" must show "[Checked: Yes]", "[Checked: No]", or "[Checked: N/A]"
-- RESULT: REPROVED if question does not show "[Checked]" status
-
-#### Section 14: Simultaneous Operations
-- **Operations Question**: "Existem outras operações sendo realizadas simuladamente?" must show "[Checked: Yes]" or "[Checked: No]"
-- **Both Fields Checked is rare, but accepted and should be treated as [Checked: No]**
-- IF "[Checked: YES]":
-  * "Quais..." field must show "[Filled field]"
-  * "Autorização: Eu ... autorizo" field must show "[Filled field]"
-  * "Recomendações de segurança adicionais às atividades simultâneas" field must show "[Filled field]"
-- IF "[Checked: NO]":
-  * All fields may show "[Empty field]"
-- RESULT: REPROVED if "[Checked: Yes]" is present but required fields show "[Empty field]"
-
-#### Section 15: Co-issuer
-- *Verify if the OCR process identified stamps on this section. If yes, approve it and go to the next section. Its mandatory to approve this section when there are stamps
-- **Co-issuer Verification**: For each column with ANY "[Filled field]" or "[Signed]" indication:
-  * ALL four fields (Name, Function, Area, Signature) must show as filled
-  * If Name shows "[Filled field]", other 3 fields must also show filled status
-  * Empty columns ("[Empty field]" for all fields) are acceptable
-  * Stamps Automatically approve this section
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if there ARE NO STAMPS, OR any column has partial information (mix of "[Filled field]" and "[Empty field]").
-- *IMPORTANT* - A Stamp in a column automatically APROVES that column
-
-#### Section 16: Additional Safety Recommendations
-- **Safety Recommendations**: This section is optional and will always be approved
-
-#### Section 17: Release for Work Execution
-- **Release Verification**: The following fields MUST show proper status:
-  * Date and Time (MANDATORY): "[Filled field: Date]", "[Filled field: Time]"
-  * Responsible (Requester): Name, Company, Function, Signature (OPTIONAL as per exceptions)
-  * Safety Technician: Name, Company, Function, Signature (OPTIONAL as per exceptions)
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if Date and Time fields show "[Empty field]"
-
-#### Section 18: Awareness of Work Permit
-- **Awareness Verification**: At minimum, at least one row must have:
-  * Name: "[Filled field: Name]"
-  * Function: "[Filled field: Function]"
-  * Signature: "[Signed]"
-  * Empty columns ("[Empty field]" for all fields) are acceptable
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if any column has partial information (mix of "[Filled field]" and "[Empty field]")
-- **IMPORTANT** - This field can be blank, having all fields empty is accepted, DONT FORGET THAT!
-
-#### Section 19: Rounds/Audit
-- **Audit Verification**: Examine all 12 cells (4 columns × 3 rows)
-* Incomplete rows are unacceptable  
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED ONLY if all rows show "[Empty field]". 
-
-#### Section 20: Closure - Suspension of Work Permit
-- **Suspension Section**: 
-  * If all fields show "[Empty field]", this is acceptable (no suspension occurred)
-  * If ANY field shows "[Filled field]" or "[Signed]", ALL fields must show filled status:
-    - Reasons for Suspension: "[Filled field: Specify]", "[Filled field: Date]", "[Filled field: Time]", "[Signed]"
-    - Return from Suspension: "[Filled field: Date]", "[Filled field: Time]", "[Signed]" (Requester), "[Signed]" (TST)
-  *IMPORTANT* - If there is a Stamp or the table at the bottom of the form is filled with Name and signature, consider the section APPROVED
-  
-- **Closure Section**:
-  * One of the three closure reasons MUST show "[Checked]" status:
-    - "[Checked: Work Completion]"
-    - "[Checked: Accident/Incident/Emergency]"
-    - "[Checked: Others]" - if selected, must also show "[Filled field: Specify]"
-  * Date and Time fields MUST show "[Filled field]" status
-  * Responsible fields MUST show filled status (Name, Company, Function, Signature)
-  * IMPORTANT: If OCR indicates "[Stamp: CONTENT]", it can satisfy multiple fields simultaneously
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if closure fields show "[Empty field]" where required
-
-### Phase 3: Attachment Analysis
-
-#### JSA (Job Safety Analysis) Attachment
-
-1. Is this a Constellation JSA? 
-   → Yes: Is it the Constellation flame/drop? 
-      → Yes: ANALYZE
-      → No: RETURN "[THIRD-PARTY JSA - No analysis required]"
-   → No: Check for "Constellation" text anywhere
-      → Found: ANALYZE
-      → Not found: RETURN "[THIRD-PARTY JSA - No analysis required]"
-
-- **Document Structure Verification**:
-  * Verify proper document structure from OCR output (matrix with steps, hazards, severity, etc.)
-  * For Participant section: At least one participant must have all fields showing filled status
-  * For Safety Technician section: Field must show "[Signed]" (NAME IS OPTIONAL)
-- **Critical Rule**: 
-  * If Safety Technician shows "[Signed]" but no participants show "[Signed]" = REPROVED
-  * If participants show "[Signed]" but Safety Technician shows "[Empty]" = REPROVED
-  * If neither show "[Signed]" = APPROVED (document may be in preparation)
-  * If both show "[Signed]" = APPROVED
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- Apply exception rule: Safety Technician and Maritime Operations Superintendent require ONLY "[Signed]" status
-- IMPORTANT - Safety Technician signature is sometimes presented at the bottom of the form. Do not miss that
-
-#### PRTA (Rescue Plan for Work at Height) Attachment
-- **Signature Verification**: Both Requesting Supervisor and Safety Technician must show "[Signed]" status
-- **Signature Form**: "[Signed]", "[Stamped]", or similar indicators are all acceptable
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- Apply exception rule: For both positions, ONLY "[Signed]" status is required, name field showing "[Filled field]" is optional
-- RESULT: REPROVED if either signature shows "[Empty]"
-
-#### CLPTA (Check List for Work at Height Planning) Attachment
-- **Signature Sections**: Analyze both sections in OCR output:
-  * "Assinaturas da equipe envolvida no trabalho em altura"
-  * "Assinaturas da equipe executante no trabalho em altura"
-- **Row Completion Rule**: For each row with ANY field showing filled status:
-  * All three fields (Name, Function, Signature) must show filled status
-  * Empty rows (all fields showing "[Empty field]") are acceptable
-  * Rows with partial information are NOT acceptable
-- **Minimum Requirement**: At least one fully completed row in each section
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if any row has partial information (mix of "[Filled field]" and "[Empty field]")
-
-#### CLPUEPCQ (Check List - Pre-Use of Fall Protection Equipment) Attachment
-- **Document Identification**: Determine if page 1 or page 2 from OCR output
-  * Page 1: No signature section (marked "Pagina 1 de 2") = APPROVED
-  * Page 2: Contains signature section
-- **Signature Verification**: For each user row:
-  * If Name shows "[Filled field: Name]", Signature must show "[Signed]"
-  * If Signature shows "[Signed]", Name must show "[Filled field: Name]"
-  * At least one row must have all fields showing filled status
-  * Be especially careful with OCR interpretation that might indicate signature overlap
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE FOR ALL FOUR USER ROWS
-- RESULT: REPROVED if any row has partial information or all rows show empty status
--**IMPORTANT**: Sometimes the pages are not marked with a number. In this case, the page that doesnt have the field for signature is considered page 1 and always approved
-
-#### ATASS (Health Sector Authorization for Work at Height) Attachment
-- **Signature Verification**: The evaluator signature field must show "[Signed]" status
-- CREATE AND FILL THE SIGNATURE VERIFICATION TABLE
-- RESULT: REPROVED if signature shows "[Empty]"
-
-#### LVCTA (Verification List for Work Basket) Attachment
-- **Item Verification**: Each item must show "[Checked: Yes]", "[Checked: No]", or "[Checked: N/A]"
-
-- **Critical Line-by-Line Analysis**:
-  For page 2 (signature section), follow this mandatory verification:
-
-  1. **CREATE AND FILL THE SIGNATURE VERIFICATION TABLE FOR ALL SIX POSITIONS**:
-     - OPERADOR DA CESTA
-     - OPERADOR DOS CONTROLES INFERIORES CESTA
-     - SONDADOR / COORD SUBSEA
-     - OIM
-     - ENCARREGADO DE SONDA
-     - VIGIA
-
-  2. **Verification Rules**:
-     - Mark "FILLED" for Name fields showing "[Filled field: Name]"
-     - Mark "FILLED" for Signature fields showing "[Signed]"
-     - Mark "EMPTY" for fields showing "[Empty field]" or "[Empty]"
-     - Be vigilant for OCR indications that might suggest field boundary issues
-
-  3. **Final Decision Rule**:
-     - Count NON-COMPLIANT rows in the table
-     - If NON-COMPLIANT rows > 0, document is REPROVED
-     - If NON-COMPLIANT rows = 0, document is APPROVED
-
-  4. Its mandatory to repeat the steps 1 to 3 and verify very carefully all fields, column by column before making a decision. This is critical and can cause catastrophic effects if not carefully analized.
-
-- RESULT: REPROVED if items do not show "[Checked]" status or signature pairs are incomplete
-
-## Phase 4: Final Compliance Determination
-
-1. For each section and attachment, determine final status (APPROVED/REPROVED)
-2. Apply severity classifications to deficiencies:
-   - Critical: Safety-critical omissions that could cause immediate danger
-   - Major: Significant compliance failures that compromise safety systems
-   - Minor: Procedural errors with minimal safety impact
-3. Formulate final judgment with specific reference to EP-036-OFF and EP-041-OFF requirements
-4. Document all findings thoroughly with regulatory citations
-
-## SELF-CORRECTION PROTOCOL (MANDATORY)
-
-Before submitting your final assessment, you MUST complete these verification steps:
-
-1. **OCR Marker Double-Check**:
-   - Review AGAIN all fields marked as "[Empty]" or "[Empty field]" in the OCR output
-   - Look for possible indications of content that might have been missed
-   - Check if any "[Unclear]" or "[ILLEGIBLE]" markers might indicate attempted completion
-   - Re-evaluate any fields with mixed or ambiguous OCR descriptions
-   - Special Atention to small check boxes close to text. Several times they are checked but very close to the text, so pay special attention to do not mark "[Empty]" when in reality is "[Checked]". Section 20 from the Permits is a classical case
-
-2. **Compliance Logic Verification**:
-   - Confirm that for EVERY row with a "[Filled field: Name]", you have verified if the signature is actually present ("[Signed]")
-   - Confirm that for EVERY "NON-COMPLIANT" determination, you have double-checked the actual OCR indicators
-   - Verify that you've correctly applied exception rules for fields that only require signatures
-
-3. **Common Error Check**:
-   - Verify you haven't miscounted "[Checked]" indicators for required selections
-   - Verify you haven't overlooked any "[Filled field]" indicators
-   - Verify you've properly understood OCR indicators that might suggest stamps or other mark types
-   - Verify you haven't mistaken OCR descriptions of adjacent content as belonging to the wrong field
-
-4. **Exception Rule Verification**:
-   - For JSA: Verify you've applied the "signature only" exception for Safety Technician
-   - For PRTA: Verify you've applied the "signature only" exception for both signing authorities
-   - For Section 17: Verify you're only requiring Date and Time as mandatory
-   - For Section 20: Verify you've recognized stamps as valid for multiple fields
-
-## Output Table Format
-
-Present your findings in this EXACT structured format WITHOUT ANY MODIFICATIONS:
-
-| Permit Number | Page Number | Page Summary | Section | Status | Comments |
-|---------------|-------------|--------------|---------|--------|----------|
-| 45001077 | 4 | Auditoria e Encerramento da PT | 19 - Ronda/Auditoria | APROVADO | Seção adequadamente preenchida com 2 registros de auditoria completos, incluindo nomes, funções, assinaturas e horários (22:57 e 02:59) |
-| 45001077 | 4 | Auditoria e Encerramento da PT | 20 - Encerramento | APROVADO | Encerramento adequadamente documentado com motivo selecionado (Término do Trabalho), data (22/10-22), hora (7:00) e assinatura do requisitante. Seção de suspensão corretamente vazia indicando que não houve suspensão do trabalho |
-
-**CRITICAL FORMATTING RULES:**
-1. Create ONE ROW PER SECTION analyzed - NEVER combine multiple sections in a single row
-2. Each section must appear as its own separate table row
-3. Each page may contain multiple sections requiring multiple rows in the table
-4. Use the EXACT column structure shown above (Permit Number, Page Number, Page Summary, Section, Status, Comments)
-5. Status must be exactly "APROVADO", "REPROVADO", or "CHECAGEM HUMANA NECESSARIA"
-6. Do not add extra columns or change the order of columns
-7. Maintain consistent formatting across all rows
-
-**IMPORTANT** - CHECK ONLY THE ITEMS LISTED ABOVE, YOU ARE NOT ALLOWED TO CHECK FOR THINGS NOT DESCRIBED HERE. YOU NEVER REPROVE ANYTHING BASED ON YOUR GUESS OF WRONG NAME OR WRONG NUMBER. YOUR TASK IS ONLY TO VERIFY IF FIELDS SHOW THE PROPER "[FILLED]", "[SIGNED]", "[CHECKED]", OR "[EMPTY]" STATUS.
-
-**IMPORTANT** - If the OCR output indicates a completely blank page, don't try to guess the type or anything...just report "Blank page". Blank pages cannot be evaluated, so neither approved nor reproved.
-
-**IMPORTANT** - There are some sections in which there are several handwritten checks to be made, and then names and signatures at the bottom. In these sections, after analyzing the check marks, clear your memory completely and analyze the names and signatures field very carefully with no Bias. Here it's Quality over speed, so take your time and analyze very carefully all names and signatures, and question yourself several times before making your final determination.
-
-**CRITICAL SAFETY RULE**: YOU ARE STRICTLY FORBIDDEN FROM EVALUATING ANY SECTION WITHOUT EXPLICIT INSTRUCTIONS. The authorized sections are: 1, 3, 3.1, 5, 6, 7, 8, 9, 10, 11, 12, 14, 15, 17, 18, 19, 20. If you encounter any other section (like Section 13, 16, 4, etc.), automatically mark it as APROVADO without analysis or explanation. Simply ignore unauthorized sections and focus only on the sections with explicit instructions. This is a mandatory safety requirement.
-
-Format your entire response in Brazilian Portuguese with 'APPROVED' translated to 'APROVADO' and 'REPROVED' translated to 'REPROVADO' and 'HUMAN VERIFICATION REQUIRED' to 'CHECAGEM HUMANA NECESSARIA". Keep the table structure but translate column headers."""
-        
-        # Handle case where OCR text failed (providing in Portuguese)
-        if not ocr_text or "Error:" in ocr_text or ocr_text.strip() == "":
-            # Provide a default response for this case
-            return f"""
-| Desconhecido | {page_num} | Página {page_num} | Conteúdo do Documento | REPROVADO | Deficiência crítica: Não foi possível analisar o documento devido à falha no processamento OCR. A imagem original deve ser revisada manualmente. |
-"""
-        
-        # Prepare the message for Wonder Wise (keeping in English)
-        messages = [
-            {
-                "role": "user", 
-                "content": f"""
-Here is a summary of the Permit to Work document being analyzed:
-
-{ptw_summary}
-
-Now, I am providing you with the OCR text from page {page_num}. Please analyze this text according to the methodology provided and list any issues or compliance problems you find:
-
-OCR TEXT:
-{ocr_text}
-
-Please provide your analysis in the EXACT table format specified in the instructions, following ALL the formatting rules. Create ONE ROW PER SECTION analyzed - NEVER combine multiple sections in a single row. Output ONLY the table with your results, with no additional text before or after.
-"""
-            }
-        ]
-        
-        # Call Wonder Wise API with thinking and streaming
-        response_stream = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=30000,
-            temperature=0,
-            timeout=900,  # DEVE ser 1 quando thinking está ativado
-            system=master_prompt,
-            messages=messages,
-            #thinking={"type": "enabled", "budget_tokens": 15000},
-            # NÃO use top_p ou top_k com thinking - são incompatíveis
-            # NÃO tente usar pre_filled_response com thinking - incompatível
-            stream=True
-        )
-        
-        # Processando a resposta em streaming
-        full_response = ""
-        thinking_log = ""
-        
-        for chunk in response_stream:
-            if chunk.type == "content_block_delta" and hasattr(chunk.delta, "text"):
-                text_chunk = chunk.delta.text
-                full_response += text_chunk
-            elif chunk.type == "thinking":
-                thinking_content = chunk.thinking.text
-                thinking_log += thinking_content
-            # Também tratar potenciais redacted_thinking blocks
-            elif chunk.type == "redacted_thinking":
-                # Estes são criptografados pela Anthropic mas devem ser mantidos
-                # para manter contexto interno do modelo
-                pass
-        
-        # Post-process the response to ensure consistent formatting
-        standardized_response = standardize_table_format(full_response, page_num, permit_number)
-        
-        # Apply special section verification to override Claude's decisions for problematic sections
-        # This ensures consistent analysis for sections that are particularly error-prone
-        override_response = apply_section_verification(ocr_text, standardized_response, page_num, permit_number)
-        
-        # Cache the analysis result if we have a document hash
-        if doc_hash is not None:
-            analysis_cache_key = f"analysis_{doc_hash}_{page_num}"
-            st.session_state[analysis_cache_key] = override_response
-        
-        # Return the verified and standardized analysis
-        return override_response
-
-    except Exception as e:
-        st.error(f"Erro ao analisar página com Wonder Wise: {str(e)}")
-        # Provide a generic fallback response that won't break the table structure (in Portuguese)
-        return f"""
-    | Desconhecido | {page_num} | Página {page_num} | Conteúdo do Documento | REPROVADO | Deficiência crítica: Ocorreu um erro durante a análise: {str(e)}. A imagem original deve ser revisada manualmente. |
-    """
-
-# Function to process multiple pages in a batch
-def process_pages_batch(page_images, batch_start, batch_size, ptw_summary):
-    """Process multiple pages in a single batch."""
-    try:
-        batch_pages = []
-        batch_end = min(batch_start + batch_size, len(page_images))
-        
-        # Extract the pages for this batch
-        for i in range(batch_start, batch_end):
-            page_num = i + 1  # Page numbers are 1-based
-            batch_pages.append((page_num, page_images[i]))
-        
-        # Prepare images for batch processing with the same detailed user instructions as individual processing
-        batch_content = [{"type": "text", "text": f"""Please perform OCR analysis on these document images and provide a detailed extraction following these guidelines:
-
-GENERAL EXTRACTION:
-- Extract ALL printed text maintaining the original layout and structure
-- Include headers, footers, page numbers, and all visible text elements
-- Extract ALL pre-printed text regardless of color (black text, red translations, blue instructions, etc.)
-- Process multiple columns appropriately (if present)
-- Note ink color if distinguishable (typically blue or black) for HANDWRITTEN content only
-
-CRITICAL: HANDLING COLORED PRE-PRINTED TEXT
-- Forms may contain pre-printed text in multiple colors:
-  * Black text (often Portuguese)
-  * Red text (often English translations)
-  * Blue text (often instructions or labels)
-- ALL colored pre-printed text is part of the original form - extract it but NEVER mark it as [Filled]
-- Only handwritten/user-added content should be marked as [Filled], regardless of pre-printed text colors
-
-FORM ELEMENTS & HANDWRITTEN CONTENT:
-- Identify all form fields (empty or filled)
-- For handwritten content, DO NOT reproduce the actual text
-- Instead, indicate:
-  * "[Checked]" for marked checkboxes - look for ANY intentional mark:
-  - X marks (even single lines crossing the box)
-  - Checkmarks (✓)
-  - Dots, circles, or fills
-  - Any pen/pencil mark that shows intent to select
-  - The mark does NOT need to be centered or fill a specific percentage
-  - Even a simple diagonal line counts as a check
-* Be especially careful with APR/JSA sections and Yes/No (Sim/Não) options
-* A checkbox is [Unchecked] ONLY if completely empty inside
-  * "[Filled]" for completed text fields with handwritten/typed user input
-  * "[Empty]" for blank fields
-- Note if handwriting appears to be in blue or black ink when obvious
-- Pay special attention to distinguish between checkboxes and nearby text
-- IMPORTANT: Faint lines, borders, or nearby text do NOT constitute a checked box
-
-SIGNATURE IDENTIFICATION:
-- For signature fields, be extremely precise:
-  * Mark as [Signed] ONLY when you can clearly see distinctive signature marks
-  * Pay special attention to BLUE INK signatures which are common and important
-  * Mark as [Empty] when no visible marks appear in the signature field
-  * Mark as [Unclear] when content is present but indeterminate
-  * If in doubt about whether a field contains a signature, note your uncertainty
-- A true signature typically:
-  * Shows distinctive pen strokes (not just a name)
-  * Covers a notable portion of the designated field
-  * Has a different appearance than printed text
-  * Is often written in blue ink in these documents
-- CRITICAL: Check the ENTIRE document including bottom sections
-  * JSA forms often have safety technician signatures at the bottom
-  * Do not stop scanning until you've checked all margins and bottom areas
-- Please double-check all signature fields before finalizing your response
-
-SPECIAL ELEMENTS:
-STAMP HANDLING FOR MANDATORY SECTIONS:
-- Sections 15, 17, 19, and 20 on Permit forms often have special completion rules
-- If a section contains a STAMP with:
-- Then the ENTIRE SECTION is considered complete
-- Do NOT report "partial completion" errors when stamps are present
-- Common scenarios:
-  * Section 15 with engineer/supervisor stamp = All fields satisfied
-  * Handwritten entries + stamp = Enhanced approval
-  * Empty fields + stamp = Still complete (stamp has authority)
-- Report format: "[Section X: Contains stamp - COMPLETE]" when applicable
-- For seals or watermarks: Note their presence and general content
-- For tables: Present in properly formatted tabular structure
-- For unclear or partially visible text: Indicate [UNCLEAR]
-
-Please organize your response in a logical reading order, maintaining the document's hierarchical structure where possible.
-
-LVCTA SIGNATURE TABLE INSTRUCTIONS:
-- For the LVCTA signature table (typically 3 columns by 7 rows):
-  * The first column contains role descriptions
-  * The second column is for printed/typed names
-  * The third column is STRICTLY for signatures only
-  * A name in column 2 does NOT mean column 3 is signed
-  * ONLY mark column 3 as [Signed] if you see clear signature pen marks
-  * Be extremely strict - when in doubt, mark as [Empty]
-
-JSA PRELIMINARY CHECK - MANDATORY:
-1. FIRST, identify if this is a Constellation JSA by looking for:
-   - Constellation logo (flame/drop shape) typically in top right
-   - "Constellation" company name in header
-   - Constellation-specific form layout
-2. IF CONSTELLATION JSA DETECTED:
-   - Proceed with full OCR analysis as instructed below
-3. IF THIRD-PARTY JSA DETECTED (no Constellation identifiers):
-   - STOP analysis immediately
-   - Return only: "[THIRD-PARTY JSA - No analysis required]"
-   - Do not extract any content from third-party JSAs
-
-JSA FORM SPECIFIC INSTRUCTIONS:
-- For JSA (Job Safety Analysis) forms, pay SPECIAL attention to:
-  * The main hazard/risk assessment table in the middle
-  * The signature section at the VERY BOTTOM of the page
-- Bottom signature section MUST include:
-  * All participant names and signatures (usually on the left)
-  * The "Técnico de Segurança do Trabalho:" (Safety Technician) signature
-  * This safety technician field is CRITICAL - it may be:
-    - In a separate row below participant signatures
-    - On the right side of the signature area
-    - In smaller text but is ALWAYS required
-- Common mistakes: Missing the safety technician signature because it's:
-  * At the very edge of the page
-  * In a different format than other signatures
-  * Separated from the main participant signature block
-- ALWAYS report if the safety technician field is [Signed] or [Empty]
-
-SECTION 14 SIMULTANEOUS OPERATIONS VERIFICATION:
-  - Pay EXTREME attention to the "Existem outras operações sendo realizadas simultaneamente?" Yes/No checkboxes
-  - These checkboxes are CRITICAL and often have:
-    * Lighter marks than other sections
-    * Smaller check marks or X's
-    * Marks that may appear faint due to scanning
-  - Check each box multiple times:
-    1. "Sim" (Yes) - Other operations are happening simultaneously
-    2. "Não" (No) - No simultaneous operations
-  - Even the faintest intentional mark counts as checked
-  - This is a MANDATORY field - false negatives here are critical errors
-  - If you detect ANY mark in ANY of these boxes, report it as checked
-  - SPECIAL ATTENTION: Carefully distinguish between "Sim" and "Não" boxes - misidentification is a critical safety error
-  - When in doubt between the two options, describe what you see rather than guessing
-  - Look for marks WITHIN the checkbox boundaries only - nearby text or arrows do NOT indicate a checked box
-
-SECTION 20 CLOSURE VERIFICATION:
-- Pay EXTREME attention to the three closure reason checkboxes
-- These checkboxes are CRITICAL and often have:
-  * Lighter marks than other sections
-  * Smaller check marks or X's
-  * Marks that may appear faint due to scanning
-- Check each box multiple times:
-  1. "Término do Trabalho" - Normal work completion
-  2. "Acidente/Incidente" - Safety events
-  3. "Outros" - Other reasons
-- Even the faintest intentional mark counts as checked
-- This is a MANDATORY field - false negatives here are critical errors
-- If you detect ANY mark in ANY of these boxes, report it as checked
-
-FINAL VERIFICATION:
-- Before completing, scan one more time for:
-  * Any checkboxes that might have been misidentified
-  * Stamps that satisfy mandatory requirements
-  * Signature fields at the bottom of the form
-  * Colored pre-printed text that should NOT be marked as filled"""}]
-        
-        # Add each page to the batch content
-        for page_num, page_image in batch_pages:
-            # Apply standardized image processing for consistent OCR
-            st.info(f"Padronizando imagem da página {page_num} para processamento em lote...")
-            
-            # Use our standardization function for consistent image processing
-            standardized_image, img_base64 = standardize_image(page_image)
-            
-            # Get the size after standardization
-            img_buffer = io.BytesIO()
-            standardized_image.save(img_buffer, format='JPEG', optimize=True)
-            img_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-            
-            st.info(f"Página {page_num} padronizada: {img_size_mb:.2f}MB, resolução otimizada para OCR")
-            
-            # Add to batch content with page number
-            batch_content.append({
-                "type": "text",
-                "text": f"---- PAGE {page_num} ----"
-            })
-            
-            batch_content.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/jpeg",
-                    "data": img_base64
-                }
-            })
-        
-        # Process the batch with Claude
-        st.info(f"Processando páginas {batch_start+1}-{batch_end} em lote")
-        
-        batch_response = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=25000,
-            temperature=0,
-            timeout=900,
-            system="""You are an expert OCR system for analyzing standardized, pre-processed document images. Your primary responsibilities are:
-
-CRITICAL: DOCUMENT COLOR IDENTIFICATION
-- Look for and PROMINENTLY report any indicators of document color/type:
-  * "GUIA BRANCA", "VIA BRANCA", "CÓPIA BRANCA" - Report as [DOCUMENT TYPE: GUIA BRANCA]
-  * "GUIA VERDE", "VIA VERDE", "CÓPIA VERDE" - Report as [DOCUMENT TYPE: GUIA VERDE]
-  * "GUIA AMARELA", "VIA AMARELA", "CÓPIA AMARELA" - Report as [DOCUMENT TYPE: GUIA AMARELA]
-- These indicators might appear as headers, footers, watermarks, or form text
-- If color indicators appear with form numbers, report both: [DOCUMENT TYPE: GUIA VERDE - FORM 123]
-- Look for visual color indicators - some forms may have colored borders, headers, or backgrounds
-- PLACE THIS IDENTIFICATION AT THE VERY BEGINNING OF YOUR RESPONSE
-- If no specific color indicator is found, report: [DOCUMENT TYPE: UNKNOWN]
+CRITICAL: DOCUMENT COLOR IDENTIFICATION
+- Look for and PROMINENTLY report any indicators of document color/type:
+  * "GUIA BRANCA", "VIA BRANCA", "CÓPIA BRANCA" - Report as [DOCUMENT TYPE: GUIA BRANCA]
+  * "GUIA VERDE", "VIA VERDE", "CÓPIA VERDE" - Report as [DOCUMENT TYPE: GUIA VERDE]
+  * "GUIA AMARELA", "VIA AMARELA", "CÓPIA AMARELA" - Report as [DOCUMENT TYPE: GUIA AMARELA]
+- These indicators might appear as headers, footers, watermarks, or form text
+- If color indicators appear with form numbers, report both: [DOCUMENT TYPE: GUIA VERDE - FORM 123]
+- Look for visual color indicators - some forms may have colored borders, headers, or backgrounds
+- PLACE THIS IDENTIFICATION AT THE VERY BEGINNING OF YOUR RESPONSE
+- If no specific color indicator is found, report: [DOCUMENT TYPE: UNKNOWN]
 
 JSA COMPANY IDENTIFICATION - CRITICAL FIRST STEP:
 - BEFORE analyzing any JSA form, FIRST check for company identification
@@ -2468,7 +1843,229 @@ SPECIAL INSTRUCTIONS:
   * These ALWAYS have a safety technician signature requirement
   * The signature section is at the ABSOLUTE BOTTOM of the page
   * Scan past any blank space to find the signature area
-  * Report specifically on the "Técnico de Segurança" signature status""",
+  * Report specifically on the "Técnico de Segurança" signature status"""
+
+OCR_BATCH_INSTRUCTIONS = """Please perform OCR analysis on these document images and provide a detailed extraction following these guidelines:
+
+GENERAL EXTRACTION:
+- Extract ALL printed text maintaining the original layout and structure
+- Include headers, footers, page numbers, and all visible text elements
+- Extract ALL pre-printed text regardless of color (black text, red translations, blue instructions, etc.)
+- Process multiple columns appropriately (if present)
+- Note ink color if distinguishable (typically blue or black) for HANDWRITTEN content only
+
+CRITICAL: HANDLING COLORED PRE-PRINTED TEXT
+- Forms may contain pre-printed text in multiple colors:
+  * Black text (often Portuguese)
+  * Red text (often English translations)
+  * Blue text (often instructions or labels)
+- ALL colored pre-printed text is part of the original form - extract it but NEVER mark it as [Filled]
+- Only handwritten/user-added content should be marked as [Filled], regardless of pre-printed text colors
+
+FORM ELEMENTS & HANDWRITTEN CONTENT:
+- Identify all form fields (empty or filled)
+- For handwritten content, DO NOT reproduce the actual text
+- Instead, indicate:
+  * "[Checked]" for marked checkboxes - look for ANY intentional mark:
+  - X marks (even single lines crossing the box)
+  - Checkmarks (✓)
+  - Dots, circles, or fills
+  - Any pen/pencil mark that shows intent to select
+  - The mark does NOT need to be centered or fill a specific percentage
+  - Even a simple diagonal line counts as a check
+* Be especially careful with APR/JSA sections and Yes/No (Sim/Não) options
+* A checkbox is [Unchecked] ONLY if completely empty inside
+  * "[Filled]" for completed text fields with handwritten/typed user input
+  * "[Empty]" for blank fields
+- Note if handwriting appears to be in blue or black ink when obvious
+- Pay special attention to distinguish between checkboxes and nearby text
+- IMPORTANT: Faint lines, borders, or nearby text do NOT constitute a checked box
+
+SIGNATURE IDENTIFICATION:
+- For signature fields, be extremely precise:
+  * Mark as [Signed] ONLY when you can clearly see distinctive signature marks
+  * Pay special attention to BLUE INK signatures which are common and important
+  * Mark as [Empty] when no visible marks appear in the signature field
+  * Mark as [Unclear] when content is present but indeterminate
+  * If in doubt about whether a field contains a signature, note your uncertainty
+- A true signature typically:
+  * Shows distinctive pen strokes (not just a name)
+  * Covers a notable portion of the designated field
+  * Has a different appearance than printed text
+  * Is often written in blue ink in these documents
+- CRITICAL: Check the ENTIRE document including bottom sections
+  * JSA forms often have safety technician signatures at the bottom
+  * Do not stop scanning until you've checked all margins and bottom areas
+- Please double-check all signature fields before finalizing your response
+
+SPECIAL ELEMENTS:
+STAMP HANDLING FOR MANDATORY SECTIONS:
+- Sections 15, 17, 19, and 20 on Permit forms often have special completion rules
+- If a section contains a STAMP with:
+- Then the ENTIRE SECTION is considered complete
+- Do NOT report "partial completion" errors when stamps are present
+- Common scenarios:
+  * Section 15 with engineer/supervisor stamp = All fields satisfied
+  * Handwritten entries + stamp = Enhanced approval
+  * Empty fields + stamp = Still complete (stamp has authority)
+- Report format: "[Section X: Contains stamp - COMPLETE]" when applicable
+- For seals or watermarks: Note their presence and general content
+- For tables: Present in properly formatted tabular structure
+- For unclear or partially visible text: Indicate [UNCLEAR]
+
+Please organize your response in a logical reading order, maintaining the document's hierarchical structure where possible.
+
+LVCTA SIGNATURE TABLE INSTRUCTIONS:
+- For the LVCTA signature table (typically 3 columns by 7 rows):
+  * The first column contains role descriptions
+  * The second column is for printed/typed names
+  * The third column is STRICTLY for signatures only
+  * A name in column 2 does NOT mean column 3 is signed
+  * ONLY mark column 3 as [Signed] if you see clear signature pen marks
+  * Be extremely strict - when in doubt, mark as [Empty]
+
+JSA PRELIMINARY CHECK - MANDATORY:
+1. FIRST, identify if this is a Constellation JSA by looking for:
+   - Constellation logo (flame/drop shape) typically in top right
+   - "Constellation" company name in header
+   - Constellation-specific form layout
+2. IF CONSTELLATION JSA DETECTED:
+   - Proceed with full OCR analysis as instructed below
+3. IF THIRD-PARTY JSA DETECTED (no Constellation identifiers):
+   - STOP analysis immediately
+   - Return only: "[THIRD-PARTY JSA - No analysis required]"
+   - Do not extract any content from third-party JSAs
+
+JSA FORM SPECIFIC INSTRUCTIONS:
+- For JSA (Job Safety Analysis) forms, pay SPECIAL attention to:
+  * The main hazard/risk assessment table in the middle
+  * The signature section at the VERY BOTTOM of the page
+- Bottom signature section MUST include:
+  * All participant names and signatures (usually on the left)
+  * The "Técnico de Segurança do Trabalho:" (Safety Technician) signature
+  * This safety technician field is CRITICAL - it may be:
+    - In a separate row below participant signatures
+    - On the right side of the signature area
+    - In smaller text but is ALWAYS required
+- Common mistakes: Missing the safety technician signature because it's:
+  * At the very edge of the page
+  * In a different format than other signatures
+  * Separated from the main participant signature block
+- ALWAYS report if the safety technician field is [Signed] or [Empty]
+
+SECTION 14 SIMULTANEOUS OPERATIONS VERIFICATION:
+  - Pay EXTREME attention to the "Existem outras operações sendo realizadas simultaneamente?" Yes/No checkboxes
+  - These checkboxes are CRITICAL and often have:
+    * Lighter marks than other sections
+    * Smaller check marks or X's
+    * Marks that may appear faint due to scanning
+  - Check each box multiple times:
+    1. "Sim" (Yes) - Other operations are happening simultaneously
+    2. "Não" (No) - No simultaneous operations
+  - Even the faintest intentional mark counts as checked
+  - This is a MANDATORY field - false negatives here are critical errors
+  - If you detect ANY mark in ANY of these boxes, report it as checked
+  - SPECIAL ATTENTION: Carefully distinguish between "Sim" and "Não" boxes - misidentification is a critical safety error
+  - When in doubt between the two options, describe what you see rather than guessing
+  - Look for marks WITHIN the checkbox boundaries only - nearby text or arrows do NOT indicate a checked box
+
+SECTION 20 CLOSURE VERIFICATION:
+- Pay EXTREME attention to the three closure reason checkboxes
+- These checkboxes are CRITICAL and often have:
+  * Lighter marks than other sections
+  * Smaller check marks or X's
+  * Marks that may appear faint due to scanning
+- Check each box multiple times:
+  1. "Término do Trabalho" - Normal work completion
+  2. "Acidente/Incidente" - Safety events
+  3. "Outros" - Other reasons
+- Even the faintest intentional mark counts as checked
+- This is a MANDATORY field - false negatives here are critical errors
+- If you detect ANY mark in ANY of these boxes, report it as checked
+
+FINAL VERIFICATION:
+- Before completing, scan one more time for:
+  * Any checkboxes that might have been misidentified
+  * Stamps that satisfy mandatory requirements
+  * Signature fields at the bottom of the form
+  * Colored pre-printed text that should NOT be marked as filled"""
+
+# Function to process multiple pages in a batch
+def process_pages_batch(page_images, batch_start, batch_size, ptw_summary, skip_pages=None):
+    """Process multiple pages in a single batch (pages in skip_pages, e.g. duplicates, are left out)."""
+    try:
+        batch_pages = []
+        batch_end = min(batch_start + batch_size, len(page_images))
+        
+        # OCR results known without a batch image call (persistent cache or text layer)
+        cached_results = {}
+        cache_keys = {}
+        text_layer_pages = 0
+        
+        # Extract the pages for this batch, skipping pages already transcribed
+        # (carbon copies need a confirmed color, so scanned copies are found from their OCR text)
+        for i in range(batch_start, batch_end):
+            page_num = i + 1  # Page numbers are 1-based
+            if skip_pages and page_num in skip_pages:
+                continue
+            if getattr(page_images[i], "text_layer", None) is not None:
+                # Digital pages are read from their text layer (plus region crops) outside the batch image call
+                cached_results[page_num] = process_page_with_claude_ocr(page_images[i], page_num)
+                text_layer_pages += 1
+                continue
+            cache_keys[page_num] = get_ocr_cache_key(page_images[i])
+            cached_text = get_ocr_cache().get(cache_keys[page_num])
+            if cached_text is not None:
+                cached_results[page_num] = cached_text
+            else:
+                batch_pages.append((page_num, page_images[i]))
+        
+        if len(cached_results) > text_layer_pages:
+            st.info(f"OCR de {len(cached_results) - text_layer_pages} página(s) do lote recuperado do cache")
+        
+        # Nothing left to send if the whole batch was cached
+        if not batch_pages:
+            return cached_results
+        
+        # Prepare images for batch processing with the same detailed user instructions as individual processing
+        batch_content = [cacheable_text_block(OCR_BATCH_INSTRUCTIONS)]
+        
+        # Apply standardized image processing for consistent OCR (pages of the batch run in parallel)
+        st.info(f"Padronizando imagens das páginas {', '.join(str(page_num) for page_num, _ in batch_pages)} para processamento em lote...")
+        standardized_pages = standardize_pages([page for _, page in batch_pages])
+        
+        # Add each page to the batch content
+        for (page_num, _), standardized_data in zip(batch_pages, standardized_pages):
+            img_base64 = base64.b64encode(standardized_data).decode("utf-8")
+            img_size_mb = len(standardized_data) / (1024 * 1024)
+            
+            st.info(f"Página {page_num} padronizada: {img_size_mb:.2f}MB, resolução otimizada para OCR")
+            
+            # Add to batch content with page number
+            batch_content.append({
+                "type": "text",
+                "text": f"---- PAGE {page_num} ----"
+            })
+            
+            batch_content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/jpeg",
+                    "data": img_base64
+                }
+            })
+        
+        # Process the batch with Claude
+        st.info(f"Processando páginas {batch_start+1}-{batch_end} em lote")
+        
+        batch_response = model_engine.create_message_sync(
+            label=f"OCR batch {batch_start+1}-{batch_end}",
+            model=OCR_MODEL,
+            max_tokens=25000,
+            temperature=0,
+            timeout=900,
+            system=[cacheable_text_block(OCR_BATCH_SYSTEM_PROMPT)],
             messages=[{"role": "user", "content": batch_content}]
         )
         
@@ -2501,210 +2098,53 @@ SPECIAL INSTRUCTIONS:
         if current_page is not None:
             ocr_results[current_page] = current_text.strip()
         
-        # Return the batch OCR results
+        # Cache the pages that came back from this batch
+        for page_num, ocr_text in ocr_results.items():
+            if page_num in cache_keys and ocr_text:
+                get_ocr_cache().put(cache_keys[page_num], ocr_text)
+        
+        # Return the batch OCR results merged with the cached pages
+        ocr_results.update(cached_results)
         return ocr_results
     
     except Exception as e:
         st.error(f"Erro no processamento em lote: {str(e)}")
         return {}  # Return empty dict on error
 
-# Function to apply section-specific verification and override Claude's analysis
-def apply_section_verification(ocr_text, response, page_num, permit_number="Desconhecido"):
+def section_sort_key(row):
+    """Order result rows by section number; attachments and unnumbered rows go last."""
+    match = re.match(r'\D*?(\d+(?:\.\d+)?)', row['section'])
+    return float(match.group(1)) if match else float('inf')
+
+# Function to add the sections decided by the section rules to the model's rows
+def apply_section_verification(rows, decisions, page_num, permit_number):
     """
-    Apply special verification for problematic sections and override Claude's analysis if needed.
+    Merge the rows of the sections decided by the section rules into a page result.
+    
+    A decided section gets the rule's row; any row the model wrote for it is
+    replaced, since the rules decide these error-prone sections consistently.
     
     Args:
-        ocr_text: The OCR text of the page
-        response: The standardized response from Claude
+        rows: Result rows from the model (empty if the call was skipped)
+        decisions: Decided RuleDecisions of the page (see section_rules)
         page_num: The page number
         permit_number: The permit number
         
     Returns:
-        str: The verified and potentially modified response
-    """
-    try:
-        # Parse the table from the response
-        lines = [line.strip() for line in response.split('\n') if line.strip()]
-        
-        # Extract header and separator
-        header = None
-        separator = None
-        data_rows = []
-        
-        for i, line in enumerate(lines):
-            if i == 0 and '|' in line:
-                header = line
-            elif i == 1 and '-|-' in line:
-                separator = line
-            elif '|' in line:
-                data_rows.append(line)
-        
-        if not header or not separator or not data_rows:
-            # Can't parse the table, return the original response
-            return response
-        
-        # Parse each row into a structured format
-        parsed_rows = []
-        for row in data_rows:
-            cells = row.split('|')
-            cells = [cell.strip() for cell in cells if cell.strip()]
-            
-            if len(cells) >= 6:
-                parsed_rows.append({
-                    'permit': cells[0],
-                    'page': cells[1],
-                    'summary': cells[2],
-                    'section': cells[3],
-                    'status': cells[4],
-                    'comments': cells[5]
-                })
-        
-        # Apply section-specific verification for problematic sections
-        verified_rows = []
-        for row in parsed_rows:
-            section = row['section'].strip().lower()
-            
-            # Section 14 verification
-            if "14" in section or "operações simultâneas" in section:
-                status, comments = verify_section_14(ocr_text)
-                if status:  # Override Claude's decision if we have a specific verification
-                    row['status'] = status
-                    row['comments'] = comments
-            
-            # Section 15 verification
-            elif "15" in section or "co-emissor" in section:
-                status, comments = verify_section_15(ocr_text)
-                if status:
-                    row['status'] = status
-                    row['comments'] = comments
-            
-            # Section 18 verification
-            elif "18" in section or "ciência da pt" in section:
-                status, comments = verify_section_18(ocr_text)
-                if status:
-                    row['status'] = status
-                    row['comments'] = comments
-            
-            # Section 20 verification
-            elif "20" in section or "encerramento" in section:
-                status, comments = verify_section_20(ocr_text)
-                if status:
-                    row['status'] = status
-                    row['comments'] = comments
-            
-            verified_rows.append(row)
-        
-        # Reconstruct the table with verified rows
-        reconstructed_rows = []
-        for row in verified_rows:
-            reconstructed_row = f"| {row['permit']} | {row['page']} | {row['summary']} | {row['section']} | {row['status']} | {row['comments']} |"
-            reconstructed_rows.append(reconstructed_row)
-        
-        # Final verified table
-        verified_table = header + "\n" + separator + "\n" + "\n".join(reconstructed_rows)
-        return verified_table
-    
-    except Exception as e:
-        # If verification fails, return the original response
-        print(f"Error in section verification: {str(e)}")
-        return response
-
-# Function to standardize table format in Claude's response
-def standardize_table_format(response, page_num, permit_number="Desconhecido"):
-    """
-    Standardize the table format in Claude's response to ensure consistency.
-    
-    Args:
-        response: The raw response from Claude
-        page_num: The current page number
-        permit_number: The permit number (optional)
-        
-    Returns:
-        String with standardized table format
+        list: Result rows of the page, in section order
     """
-    try:
-        # If response is empty or doesn't contain a table, return a placeholder
-        if not response or "|" not in response:
-            return f"""
-| {permit_number} | {page_num} | Página {page_num} | Conteúdo do Documento | CHECAGEM HUMANA NECESSARIA | Falha na geração da tabela de análise. A resposta não contém o formato de tabela esperado. |
-"""
-        
-        # Extract table content (everything between the first and last pipe characters)
-        lines = [line.strip() for line in response.split('\n') if line.strip()]
-        table_lines = [line for line in lines if line.startswith('|') and line.endswith('|')]
-        
-        # Identify header row and separator row
-        header_row = None
-        separator_row = None
-        data_rows = []
-        
-        for i, line in enumerate(table_lines):
-            if 'Permit Number' in line or 'Número da Permissão' in line:
-                header_row = line
-                if i+1 < len(table_lines) and '---' in table_lines[i+1]:
-                    separator_row = table_lines[i+1]
-            elif '---' not in line and not 'Permit Number' in line and not 'Número da Permissão' in line:
-                data_rows.append(line)
-        
-        # If no valid header row is found, create a standard one
-        if not header_row:
-            header_row = "| Permit Number | Page Number | Page Summary | Section | Status | Comments |"
-            separator_row = "|---------------|-------------|--------------|---------|--------|----------|"
-        
-        # If no data rows found, create a placeholder row
-        if not data_rows:
-            data_rows = [f"| {permit_number} | {page_num} | Página {page_num} | Conteúdo do Documento | CHECAGEM HUMANA NECESSARIA | Falha na análise. Não foi possível extrair dados estruturados da página. |"]
-        
-        # For each data row, ensure it has the correct format
-        formatted_rows = []
-        for row in data_rows:
-            # Split the row into cells
-            cells = row.split('|')
-            cells = [cell.strip() for cell in cells if cell.strip()]
-            
-            # Check if the row has the correct number of columns (should be 6)
-            if len(cells) < 6:
-                # Add missing columns
-                while len(cells) < 6:
-                    cells.append("")
-            elif len(cells) > 6:
-                # Truncate extra columns
-                cells = cells[:6]
-            
-            # Replace empty permit number with the provided one
-            if not cells[0] or cells[0] == "XXX-XXXXX":
-                cells[0] = permit_number
-            
-            # Replace empty page number with the provided one
-            if not cells[1] or cells[1] == "X":
-                cells[1] = str(page_num)
-            
-            # Ensure status is one of the accepted values (APROVADO, REPROVADO, CHECAGEM HUMANA NECESSARIA, N/A)
-            status_values = ["APROVADO", "REPROVADO", "CHECAGEM HUMANA NECESSARIA", "N/A"]
-            if cells[4] not in status_values:
-                if "aprovado" in cells[4].lower():
-                    cells[4] = "APROVADO"
-                elif "reprovado" in cells[4].lower():
-                    cells[4] = "REPROVADO"
-                elif "n/a" in cells[4].lower() or "não aplicável" in cells[4].lower() or "nao aplicavel" in cells[4].lower():
-                    cells[4] = "N/A"
-                else:
-                    cells[4] = "CHECAGEM HUMANA NECESSARIA"
-            
-            # Reconstruct the row
-            formatted_row = "| " + " | ".join(cells) + " |"
-            formatted_rows.append(formatted_row)
-        
-        # Construct the final table
-        final_table = header_row + "\n" + separator_row + "\n" + "\n".join(formatted_rows)
-        
-        return final_table
-    
-    except Exception as e:
-        # If any error occurs, return a safe fallback
-        return f"""
-| {permit_number} | {page_num} | Página {page_num} | Conteúdo do Documento | CHECAGEM HUMANA NECESSARIA | Erro na padronização do formato da tabela: {str(e)}. A página requer verificação manual. |
-"""
+    decided = {decision.rule.section for decision in decisions}
+    kept_rows = []
+    for row in rows:
+        rule = rule_for_label(row['section'])
+        if rule is None or rule.section not in decided:
+            kept_rows.append(row)
+    page_summary = kept_rows[0]['page_summary'] if kept_rows else f"Página {page_num}"
+    rule_rows = [
+        result_row(permit_number, page_num, page_summary, decision.rule.label, decision.status, decision.reason)
+        for decision in decisions
+    ]
+    return sorted(kept_rows + rule_rows, key=section_sort_key)
 
 # Extract permit number from OCR or summary
 def prepare_image_for_claude(image, max_size_mb=3.75):
@@ -2725,59 +2165,15 @@ def prepare_image_for_claude(image, max_size_mb=3.75):
         new_size = (int(image.size[0]*ratio), int(image.size[1]*ratio))
         image = image.resize(new_size, Image.LANCZOS)
     
-    # Try to convert and compress the image
-    quality = 90
-    image_format = "PNG"
-    media_type = "image/png"
-    
-    # Function to check final base64 size
-    def get_base64_size(img_bytes):
-        base64_bytes = len(base64.b64encode(img_bytes.getvalue()))
-        return base64_bytes / (1024 * 1024)
-    
-    while True:
-        img_byte_arr = io.BytesIO()
-        
-        if image_format == "PNG":
-            image.save(img_byte_arr, format=image_format, optimize=True)
-            media_type = "image/png"
-            
-            base64_size = get_base64_size(img_byte_arr)
-            
-            if base64_size > 4.9:
-                image_format = "JPEG"
-                media_type = "image/jpeg"
-                continue
-        else:
-            image.save(img_byte_arr, format=image_format, quality=quality, optimize=True)
-            media_type = "image/jpeg"
-            
-            base64_size = get_base64_size(img_byte_arr)
-        
-        if base64_size <= 4.9:
-            break
-            
-        quality -= 15
-        
-        if quality < 40:
-            quality = 60
-            max_dimension = int(max_dimension * 0.7)
-            ratio = min(max_dimension/image.size[0], max_dimension/image.size[1])
-            new_size = (int(image.size[0]*ratio), int(image.size[1]*ratio))
-            image = image.resize(new_size, Image.LANCZOS)
-            
-        if max_dimension < 500:
-            raise ValueError("Could not compress image below 5MB limit while maintaining usable quality")
-    
-    img_byte_arr.seek(0)
-    img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode()
+    # PNG first, then the best JPEG quality/scale within the limit (base64 adds a third)
+    encoded = encode_image(image, int(max_size_mb * 1024 * 1024 * 3 / 4), min_quality=60)
+    img_base64 = encoded.base64()
     
-    img_byte_arr.seek(0)
-    processed_image = Image.open(img_byte_arr)
+    processed_image = Image.open(io.BytesIO(encoded.data))
     
     base64_size_mb = len(img_base64) / (1024 * 1024)
     
-    return processed_image, img_base64, media_type, base64_size_mb
+    return processed_image, img_base64, encoded.media_type, base64_size_mb
 
 def detect_guide_color(ocr_text):
     """
@@ -2789,52 +2185,16 @@ def detect_guide_color(ocr_text):
     Returns:
         str: "BRANCA", "VERDE", "AMARELA", or "UNKNOWN"
     """
-    # Look for explicit document type markers
-    doc_type_match = re.search(r'\[DOCUMENT TYPE: GUIA (BRANCA|VERDE|AMARELA)', ocr_text)
-    if doc_type_match:
-        return doc_type_match.group(1)
-    
-    # Look for color indicators in text
-    color_patterns = {
-        "BRANCA": [r'guia\s+branca', r'via\s+branca', r'cópia\s+branca', r'copia\s+branca', r'branca'],
-        "VERDE": [r'guia\s+verde', r'via\s+verde', r'cópia\s+verde', r'copia\s+verde', r'verde'],
-        "AMARELA": [r'guia\s+amarela', r'via\s+amarela', r'cópia\s+amarela', r'copia\s+amarela', r'amarela']
-    }
-    
-    # Check each color's patterns
-    for color, patterns in color_patterns.items():
-        for pattern in patterns:
-            if re.search(pattern, ocr_text.lower()):
-                return color
-    
-    # Default if no color is detected
-    return "UNKNOWN"
+    return parse_ocr_page(ocr_text).guide_color
 
 def extract_permit_number(ocr_text=None, ptw_summary=None):
     """Extract permit number from OCR text or summary."""
-    # Look for patterns like "PT-12345", "PTW-12345", or just numbers
-    pt_patterns = [
-        r'PT[W]?[-\s]?(\d+[-\d]*)',  # Matches PT-12345, PTW-12345, PT 12345
-        r'Permit.*?(\d{3}[-\s]?\d{5})',  # Matches Permit... followed by number like 123-45678
-        r'Permissão.*?(\d{3}[-\s]?\d{5})'  # Same in Portuguese
-    ]
-    
-    # First try OCR text if available
+    # First try OCR text if available, then the summary
     if ocr_text:
-        for pattern in pt_patterns:
-            match = re.search(pattern, ocr_text, re.IGNORECASE)
-            if match:
-                return match.group(1)
-    
-    # Then try summary
-    if ptw_summary:
-        for pattern in pt_patterns:
-            match = re.search(pattern, ptw_summary, re.IGNORECASE)
-            if match:
-                return match.group(1)
-    
-    # Return None if not found
-    return None
+        permit_number = parse_ocr_page(ocr_text).permit_number
+        if permit_number:
+            return permit_number
+    return find_permit_number(ptw_summary) if ptw_summary else None
 
 # Worker function for parallel page processing
 def process_page_worker(page_num, page_image, ptw_summary):
@@ -2846,7 +2206,7 @@ def process_page_worker(page_num, page_image, ptw_summary):
             "ocr_status": "pending",
             "analysis_status": "pending",
             "ocr_text": "",
-            "analysis_result": "",
+            "analysis_result": [],
             "error": None,
             "completed": False
         }
@@ -2856,7 +2216,7 @@ def process_page_worker(page_num, page_image, ptw_summary):
         ocr_text = process_page_with_claude_ocr(page_image, page_num)
         
         # Check if OCR was successful
-        if "Error:" in ocr_text or "failed" in ocr_text:
+        if ocr_text.startswith(OCR_FAILURE_PREFIX):
             status["ocr_status"] = "error"
             status["error"] = ocr_text
         else:
@@ -2896,13 +2256,233 @@ def process_page_worker(page_num, page_image, ptw_summary):
             "ocr_status": "error" if "ocr_status" not in status else status["ocr_status"],
             "analysis_status": "error",
             "ocr_text": "",
-            "analysis_result": f"""
-| Desconhecido | {page_num} | Página {page_num} | Conteúdo do Documento | REPROVADO | Deficiência crítica: Ocorreu um erro durante o processamento: {str(e)}. A imagem original deve ser revisada manualmente. |
-""",
+            "analysis_result": page_failure_row(page_num, e),
             "error": str(e),
             "completed": True  # Mark as completed even though it failed
         }
 
+def page_failure_row(page_num, error):
+    """Build the result rows (a single REPROVADO row) recorded for a page whose processing failed."""
+    return [result_row(
+        None, page_num, f"Página {page_num}", "Conteúdo do Documento", STATUS_REPROVED,
+        f"Deficiência crítica: Ocorreu um erro durante o processamento: {str(error)}. A imagem original deve ser revisada manualmente."
+    )]
+
+def run_analysis_job(job):
+    """
+    Analyse every page of a document on a job runner thread.
+    
+    Pages go through the OCR -> analysis pipeline, one page at a time in
+    sequential mode. Near-identical pages reuse their twin's result. Progress,
+    results and the permit number are reported through the job (never st.*),
+    so the analysis continues when the browser tab is closed.
+    
+    Every OCR text and page result is also saved to the document checkpoint:
+    pages completed by an earlier run are taken from it, pages whose OCR was
+    saved only run the analysis, and missing or failed pages run again.
+    
+    Args:
+        job: AnalysisJob whose inputs hold page_images, ptw_summary,
+            page_index, permit_number, parallel_processing, doc_key, and the
+            owner and priority the page scheduler shares call slots by
+    """
+    page_images = job.inputs["page_images"]
+    ptw_summary = job.inputs["ptw_summary"]
+    page_index = job.inputs.get("page_index") or PageIndex()
+    doc_key = job.inputs.get("doc_key")
+    checkpoints = get_checkpoint_store()
+    checkpoint = checkpoints.load(doc_key)
+    job.set_context("permit_number", job.inputs.get("permit_number") or (checkpoint.permit_number if checkpoint else None))
+    
+    # Pages completed by an earlier run of this document
+    resumed_pages = checkpoint.completed_pages() if checkpoint else {}
+    for page_num, result in resumed_pages.items():
+        if page_num <= job.total_pages:
+            job.set_result(page_num, result, status="completed", ocr_status="completed", analysis_status="completed")
+    if resumed_pages:
+        job.message("info", f"{len(resumed_pages)} página(s) recuperada(s) da análise anterior deste documento")
+        # Duplicates of resumed pages are derived again rather than processed
+        for derived_page, twin_page in page_index.twins().items():
+            if twin_page in resumed_pages and derived_page not in resumed_pages:
+                resumed_pages[derived_page] = derive_page_result(resumed_pages[twin_page], derived_page, twin_page)
+                job.set_result(derived_page, resumed_pages[derived_page],
+                               status="completed", ocr_status="completed", analysis_status="completed")
+    
+    def resolve_permit_number(ocr_text):
+        # The first page carries the permit number for the whole document
+        if job.context.get("permit_number"):
+            return
+        permit_number = extract_permit_number(ocr_text, ptw_summary)
+        if permit_number:
+            job.set_context("permit_number", permit_number)
+            job.message("info", f"Número da PT detectado: {permit_number}")
+            if doc_key:
+                checkpoints.save_document(doc_key, permit_number=permit_number)
+    
+    async def ocr_stage(page_num, page_image, events):
+        job.check_cancelled()
+        saved_text = checkpoint.ocr_text(page_num) if checkpoint else None
+        # Checkpoints written by older versions may hold an OCR failure message as the page's text
+        if saved_text and not saved_text.startswith(OCR_FAILURE_PREFIX):
+            events.message("info", f"OCR da página {page_num} recuperado da análise anterior")
+            ocr_text = saved_text
+        else:
+            job.update_page(page_num, status="processing", ocr_status="processing")
+            ocr_text = await ocr_page_async(page_image, page_num, events=events)
+        if page_num == 1:
+            await asyncio.to_thread(resolve_permit_number, ocr_text)
+        return ocr_text
+    
+    # Analyses wait for page 1's OCR (see analysis_gate below), so every page of the
+    # document is analysed, and its analysis cached, with the same permit number
+    fallback_permit_number = extract_permit_number(None, ptw_summary) or "Unknown"
+    
+    async def analysis_stage(page_num, ocr_text, events):
+        job.check_cancelled()
+        return await analyze_page_async(
+            ocr_text,
+            ptw_summary,
+            page_num,
+            job.context.get("permit_number") or fallback_permit_number,
+            events=events
+        )
+    
+    # Runs on the job thread for every stage transition
+    def on_pipeline_event(page_num, stage, event_status, payload):
+        # Pages stopped by a cancellation did not fail: no failure row, message or checkpoint
+        if event_status == "error" and isinstance(payload, JobCancelled):
+            job.update_page(page_num, status="cancelled")
+            return
+        if stage == "ocr" and event_status == "completed":
+            if doc_key:
+                checkpoints.save_page(doc_key, page_num, "ocr_done", ocr_text=payload)
+            job.update_page(page_num, ocr_status="completed", analysis_status="processing", ocr_preview=payload[:500])
+            return
+        
+        if event_status == "completed":
+            result = payload
+            job.set_result(page_num, result, status="completed", analysis_status="completed")
+        else:
+            # OCR and analysis failures raise, so a failure is never taken for the page's text or verdict
+            job.message("error", f"Erro ao processar página {page_num} ({'OCR' if stage == 'ocr' else 'análise'}): {str(payload)}")
+            result = page_failure_row(page_num, payload)
+            failed_stages = {"ocr_status": "error", "analysis_status": "error"} if stage == "ocr" else {"analysis_status": "error"}
+            job.set_result(page_num, result, status="error", error=str(payload), **failed_stages)
+        if doc_key:
+            # Failed pages are saved as such, so the next run processes them again
+            checkpoints.save_page(doc_key, page_num, "completed" if event_status == "completed" else "error", result=result)
+        
+        for derived_page in page_index.derived_from(page_num):
+            if derived_page in resumed_pages:
+                continue
+            if event_status == "completed":
+                job.set_result(
+                    derived_page,
+                    derive_page_result(result, derived_page, page_num),
+                    status="completed", ocr_status="completed", analysis_status="completed"
+                )
+            else:
+                # Duplicates of a failed page failed with it
+                job.set_result(derived_page, page_failure_row(derived_page, payload),
+                               status="error", error=str(payload), **failed_stages)
+    
+    def on_pipeline_message(kind, payload):
+        if kind == "message":
+            job.message(*payload)
+    
+    scheduling = {
+        "owner": job.inputs.get("owner"),
+        "priority": job.inputs.get("priority", PRIORITY_INTERACTIVE),
+        "analysis_gate": 1
+    }
+    if job.inputs.get("parallel_processing"):
+        pipeline = PagePipeline(ocr_stage, analysis_stage, **scheduling)
+    else:
+        pipeline = PagePipeline(ocr_stage, analysis_stage, ocr_workers=1, analysis_workers=1, **scheduling)
+    
+    pipeline.run(
+        [
+            (page_num, page_image)
+            for page_num, page_image in enumerate(page_images, 1)
+            if page_index.twin_of(page_num) is None and page_num not in resumed_pages
+        ],
+        on_event=on_pipeline_event,
+        on_message=on_pipeline_message
+    )
+
+def start_analysis_job():
+    """
+    Submit the document loaded in the session to the background job runner.
+    
+    The job id is also put in the page URL, so reopening the link (e.g. after
+    closing the tab) attaches to the running analysis.
+    
+    Returns:
+        AnalysisJob: The submitted job
+    """
+    job = get_job_runner().submit(
+        st.session_state.total_pages,
+        run_analysis_job,
+        inputs={
+            "page_images": st.session_state.page_images,
+            "ptw_summary": st.session_state.ptw_summary,
+            "page_index": st.session_state.page_index,
+            "permit_number": st.session_state.get('permit_number', None),
+            "parallel_processing": st.session_state.parallel_processing,
+            "doc_key": st.session_state.get('doc_key'),
+            # Pages of one browser session share call slots fairly with other sessions
+            "owner": st.session_state.user_id,
+            "priority": PRIORITY_INTERACTIVE,
+            # Keeps the session's page files alive while the job needs them
+            "page_store": st.session_state.page_store
+        }
+    )
+    st.session_state.job_id = job.job_id
+    st.experimental_set_query_params(job=job.job_id)
+    return job
+
+def attach_analysis_job(job):
+    """Restore the session state of a document from its background job."""
+    st.session_state.processing = True
+    st.session_state.parallel_processing = job.inputs.get("parallel_processing", False)
+    st.session_state.page_images = job.inputs["page_images"]
+    st.session_state.ptw_summary = job.inputs["ptw_summary"]
+    st.session_state.page_index = job.inputs.get("page_index")
+    st.session_state.page_store = job.inputs.get("page_store")
+    st.session_state.doc_key = job.inputs.get("doc_key")
+    st.session_state.total_pages = job.total_pages
+    st.session_state.current_page = 0
+    st.session_state.job_id = job.job_id
+
+def sync_analysis_job(snapshot):
+    """
+    Copy a job snapshot into the session state read by the progress and results views.
+    
+    Args:
+        snapshot: Dictionary returned by AnalysisJob.snapshot()
+    """
+    st.session_state.analysis_results = snapshot["results"]
+    st.session_state.analyses_completed = snapshot["completed"]
+    st.session_state.parallel_status = {
+        "total": snapshot["total_pages"],
+        "completed": snapshot["completed"],
+        "in_progress": snapshot["in_progress"],
+        "page_status": snapshot["page_status"]
+    }
+    if snapshot["context"].get("permit_number"):
+        st.session_state.permit_number = snapshot["context"]["permit_number"]
+    if snapshot["status"] in ("completed", "error", "cancelled"):
+        st.session_state.analyses_completed = snapshot["total_pages"]
+        st.session_state.current_page = snapshot["total_pages"]
+
+def discard_analysis_job():
+    """Cancel the session's background job, if still running, and forget it."""
+    job = get_job_runner().get(st.session_state.get('job_id'))
+    if job is not None and not job.done:
+        job.cancel()
+    st.session_state.job_id = None
+    st.experimental_set_query_params()
+
 # Render dashboard page
 def render_dashboard_page():
     """Render the dashboard page"""
@@ -2975,7 +2555,93 @@ def render_settings_page():
         # Save performance settings button
         if st.button("Salvar Configurações de Performance"):
             st.success("✅ Configurações de performance salvas com sucesso!")
-    
+
+    # Persistent cache section
+    with st.container(border=True):
+        st.markdown("### Cache Persistente")
+        st.caption("Páginas já transcritas e analisadas são reaproveitadas em novos uploads, evitando novas chamadas ao modelo. Após uma alteração de prompt, apenas as páginas afetadas são reprocessadas.")
+
+        caches = [
+            ("OCR", get_ocr_cache()),
+            ("Análise", get_analysis_cache())
+        ]
+
+        for cache_label, cache in caches:
+            cache_stats = cache.stats()
+            st.markdown(f"**{cache_label}**")
+            cache_cols = st.columns(4)
+            with cache_cols[0]:
+                st.metric("Páginas em Cache", cache_stats["entries"])
+            with cache_cols[1]:
+                st.metric("Tamanho", f"{cache_stats['size_mb']:.1f}/{cache_stats['max_mb']:.0f} MB")
+            with cache_cols[2]:
+                st.metric("Acertos / Falhas", f"{cache_stats['hits']} / {cache_stats['misses']}")
+            with cache_cols[3]:
+                st.metric("Taxa de Acerto", f"{cache_stats['hit_rate']:.0%}")
+
+            if st.button(f"Limpar Cache de {cache_label}", key=f"clear_cache_{cache.namespace}"):
+                cache.clear()
+                st.success(f"✅ Cache de {cache_label} limpo com sucesso!")
+
+        st.markdown("### Controle de Taxa da API")
+        st.caption("O limite de chamadas simultâneas ao modelo aumenta enquanto as chamadas têm sucesso e é reduzido automaticamente quando a API sinaliza limite de taxa ou sobrecarga.")
+
+        rate_stats = model_engine.controller.stats()
+        rate_cols = st.columns(4)
+        with rate_cols[0]:
+            st.metric("Chamadas Simultâneas", f"{rate_stats['in_flight']}/{rate_stats['limit']}")
+        with rate_cols[1]:
+            st.metric("Requisições / min", rate_stats["rpm"])
+        with rate_cols[2]:
+            st.metric("Tokens / min", f"{rate_stats['tpm']:,}")
+        with rate_cols[3]:
+            st.metric("Limitadas / Sucesso", f"{rate_stats['throttled']} / {rate_stats['successes']}")
+
+        if rate_stats["paused_for"] > 0:
+            st.warning(f"Chamadas pausadas por {rate_stats['paused_for']:.0f}s a pedido da API (retry-after)")
+
+        st.markdown("### Fila de Páginas")
+        st.caption(f"As páginas de todos os documentos em análise compartilham as chamadas de forma justa entre usuários. Análises interativas têm prioridade sobre auditorias em lote, e cada usuário pode ter no máximo {get_page_scheduler().user_max_in_flight} páginas em processamento ao mesmo tempo.")
+
+        scheduler_stats = get_page_scheduler().stats()
+        scheduler_cols = st.columns(4)
+        with scheduler_cols[0]:
+            st.metric("Páginas em Processamento", scheduler_stats["in_flight"])
+        with scheduler_cols[1]:
+            st.metric("Usuários Ativos", scheduler_stats["users"])
+        with scheduler_cols[2]:
+            st.metric("Na Fila (Interativas)", scheduler_stats["queued_interactive"])
+        with scheduler_cols[3]:
+            st.metric("Na Fila (Lote)", scheduler_stats["queued_bulk"])
+
+        st.markdown("### Triagem de Páginas")
+        st.caption("Um modelo pequeno e rápido classifica cada página antes do OCR. JSAs de terceiros, guias verdes/amarelas e páginas em branco identificadas com confiança recebem a linha N/A diretamente, sem OCR nem análise completos.")
+
+        triage_stats = get_triage_stats().snapshot()
+        triage_cols = st.columns(4)
+        with triage_cols[0]:
+            st.metric("Páginas Classificadas", triage_stats["triaged"])
+        with triage_cols[1]:
+            st.metric("Dispensadas", triage_stats["skipped"])
+        with triage_cols[2]:
+            st.metric("Tempo da Triagem", f"{triage_stats['triage_seconds']:.0f}s")
+        with triage_cols[3]:
+            st.metric("Tempo Economizado", f"{triage_stats['saved_seconds']:.0f}s")
+
+        st.markdown("### Cache de Prompt")
+        st.caption("Os prompts fixos de OCR e análise, e o resumo de cada PT, são reaproveitados pela API entre páginas. Tokens lidos do cache custam uma fração do preço normal e reduzem o tempo até a primeira resposta.")
+
+        usage_stats = model_engine.usage.snapshot()
+        usage_cols = st.columns(4)
+        with usage_cols[0]:
+            st.metric("Chamadas", usage_stats["calls"])
+        with usage_cols[1]:
+            st.metric("Lidos do Cache", f"{usage_stats['cache_read_tokens']:,}")
+        with usage_cols[2]:
+            st.metric("Gravados no Cache", f"{usage_stats['cache_write_tokens']:,}")
+        with usage_cols[3]:
+            st.metric("Taxa de Acerto", f"{usage_stats['cache_hit_rate']:.0%}")
+
     # Coming soon features
     with st.expander("Funcionalidades Futuras", expanded=True):
         st.markdown("""
@@ -3185,8 +2851,11 @@ def render_analyzer_page():
                     st.session_state.parallel_processing = parallel_button  # Flag for parallel processing
                     
                     # Reset session state variables
+                    discard_analysis_job()
+                    st.session_state.doc_key = None
                     st.session_state.ptw_summary = None
                     st.session_state.page_images = []
+                    st.session_state.page_index = None
                     st.session_state.analysis_results = []
                     st.session_state.current_page = 0
                     st.session_state.analyses_completed = 0
@@ -3210,231 +2879,22 @@ def render_analyzer_page():
                             compressed_pdf = pdf_bytes
                         
                         # Step 2: Extract pages as images with 250 DPI PNG format
-                        page_images = extract_pages_as_images(pdf_bytes, dpi=250)
+                        page_index = PageIndex()
+                        page_images = extract_pages_as_images(
+                            pdf_bytes, dpi=250, page_index=page_index, text_layer=True, store=get_session_pages()
+                        )
                         st.session_state.page_images = page_images
+                        st.session_state.page_index = page_index
                         st.session_state.total_pages = len(page_images)
                         
-                        # Step 3: Generate PTW summary using Wonder Wise
-                        st.info("Gerando resumo da PT com Wonder Wise...")
-                        ptw_summary = generate_ptw_summary(compressed_pdf)
-                        st.session_state.ptw_summary = ptw_summary
+                        # Resume an earlier, interrupted analysis of the same document
+                        doc_key = get_document_checkpoint_key(generate_document_hash(pdf_bytes))
+                        checkpoint = load_document_checkpoint(doc_key, len(page_images))
+                        use_document_checkpoint(doc_key, checkpoint)
                         
-                        # If parallel processing was selected, start it now
-                        if st.session_state.parallel_processing:
-                            st.info("Iniciando processamento em paralelo de todas as páginas...")
-                            
-                            # Set up ThreadPoolExecutor for concurrent processing
-                            # Use max_workers=4 to limit API calls and avoid rate limiting
-                            max_workers = min(8, st.session_state.total_pages)
-                            
-                            # Create a list to store all the futures
-                            st.session_state.parallel_results = []
-                            
-                            # Create status tracking dictionary
-                            st.session_state.parallel_status = {
-                                "total": st.session_state.total_pages,
-                                "completed": 0,
-                                "in_progress": 0,
-                                "page_status": {}
-                            }
-                            
-                            # Process pages in batches for parallel approach
-                            # Adjust batch size based on document size
-                            if st.session_state.total_pages <= 5:
-                                batch_size = st.session_state.total_pages  # For small documents, process all at once
-                            elif st.session_state.total_pages <= 15:
-                                batch_size = 5  # Medium-sized document
-                            else:
-                                batch_size = 8  # Large document
-                            
-                            # Calculate the number of batches needed
-                            num_batches = (st.session_state.total_pages + batch_size - 1) // batch_size
-                            
-                            # Configure and start the thread pool with optimal worker count
-                            if st.session_state.total_pages <= 5:
-                                thread_count = min(2, st.session_state.total_pages)  # 1-2 workers for small docs
-                            elif st.session_state.total_pages <= 15:
-                                thread_count = 3  # 3 workers for medium docs
-                            else:
-                                thread_count = 4  # 4 workers for large docs (avoid too many API calls)
-                            
-                            with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
-                                # First process pages in batches for OCR
-                                st.info("Processando OCR em lotes paralelos para melhor performance...")
-                                batch_futures = {}
-                                
-                                # Function to process a batch in parallel
-                                def process_batch_worker(batch_start, batch_size):
-                                    try:
-                                        # Process the batch
-                                        return process_pages_batch(
-                                            st.session_state.page_images,
-                                            batch_start,
-                                            batch_size,
-                                            st.session_state.ptw_summary
-                                        )
-                                    except Exception as e:
-                                        st.error(f"Erro no processamento do lote {batch_start}-{batch_start+batch_size}: {str(e)}")
-                                        return {}
-                                
-                                # Submit batches for processing
-                                for i in range(0, st.session_state.total_pages, batch_size):
-                                    batch_start = i
-                                    current_batch_size = min(batch_size, st.session_state.total_pages - i)
-                                    
-                                    # Update status for these pages
-                                    for page_num in range(batch_start + 1, batch_start + current_batch_size + 1):
-                                        st.session_state.parallel_status["page_status"][page_num] = {
-                                            "status": "submitted",
-                                            "ocr_status": "batch_processing",
-                                            "analysis_status": "pending"
-                                        }
-                                    
-                                    # Submit this batch
-                                    batch_future = executor.submit(process_batch_worker, batch_start, current_batch_size)
-                                    batch_futures[batch_future] = (batch_start, current_batch_size)
-                                    
-                                # Process batch results as they come in
-                                all_ocr_results = {}
-                                for future in concurrent.futures.as_completed(batch_futures):
-                                    batch_start, current_batch_size = batch_futures[future]
-                                    
-                                    try:
-                                        # Get batch OCR results
-                                        batch_results = future.result()
-                                        
-                                        # Update OCR status for the pages in this batch
-                                        for page_num in range(batch_start + 1, batch_start + current_batch_size + 1):
-                                            if page_num in batch_results:
-                                                st.session_state.parallel_status["page_status"][page_num]["ocr_status"] = "completed"
-                                                # Store OCR results for later analysis
-                                                all_ocr_results[page_num] = batch_results[page_num]
-                                            else:
-                                                st.session_state.parallel_status["page_status"][page_num]["ocr_status"] = "error"
-                                    except Exception as e:
-                                        # Mark all pages in this batch as having OCR errors
-                                        for page_num in range(batch_start + 1, batch_start + current_batch_size + 1):
-                                            st.session_state.parallel_status["page_status"][page_num]["ocr_status"] = "error"
-                                    
-                                # Now submit individual page analysis tasks
-                                futures = {}
-                                for page_num, page_image in enumerate(st.session_state.page_images, 1):
-                                    # Update status for analysis phase
-                                    st.session_state.parallel_status["page_status"][page_num]["analysis_status"] = "submitted"
-                                    st.session_state.parallel_status["in_progress"] += 1
-                                    
-                                    # Get OCR text from batched results if available
-                                    ocr_text = all_ocr_results.get(page_num, None)
-                                    
-                                    # Define an analysis worker function that uses pre-computed OCR results
-                                    def analyze_page_with_ocr(page_num, page_image, ptw_summary, ocr_text):
-                                        try:
-                                            # Set up status
-                                            status = {
-                                                "page_num": page_num,
-                                                "ocr_status": "completed" if ocr_text else "pending",
-                                                "analysis_status": "pending",
-                                                "ocr_text": ocr_text or "",
-                                                "analysis_result": "",
-                                                "error": None,
-                                                "completed": False
-                                            }
-                                            
-                                            # Get OCR text if not provided
-                                            if not ocr_text:
-                                                status["ocr_status"] = "processing"
-                                                ocr_text = process_page_with_claude_ocr(page_image, page_num)
-                                                
-                                                if "Error:" in ocr_text or "failed" in ocr_text:
-                                                    status["ocr_status"] = "error"
-                                                    status["error"] = ocr_text
-                                                else:
-                                                    status["ocr_status"] = "completed"
-                                                    status["ocr_text"] = ocr_text
-                                            
-                                            # Get shared permit number or extract it from the first page
-                                            permit_number = None
-                                            if page_num == 1:
-                                                # Extract from first page
-                                                permit_number = extract_permit_number(ocr_text, ptw_summary)
-                                                if permit_number:
-                                                    # Store for other workers to use
-                                                    st.session_state.permit_number = permit_number
-                                            else:
-                                                # Try to get from session state (if first page has already been processed)
-                                                permit_number = st.session_state.get('permit_number', None)
-                                            
-                                            # Analyze the page
-                                            status["analysis_status"] = "processing"
-                                            analysis_result = analyze_page_with_claude(
-                                                ocr_text, 
-                                                ptw_summary, 
-                                                page_num,
-                                                permit_number
-                                            )
-                                            
-                                            status["analysis_status"] = "completed"
-                                            status["analysis_result"] = analysis_result
-                                            status["completed"] = True
-                                            
-                                            return status
-                                        
-                                        except Exception as e:
-                                            return {
-                                                "page_num": page_num,
-                                                "ocr_status": "completed" if ocr_text else "error",
-                                                "analysis_status": "error",
-                                                "ocr_text": ocr_text or "",
-                                                "analysis_result": f"""
-| Desconhecido | {page_num} | Página {page_num} | Conteúdo do Documento | REPROVADO | Deficiência crítica: Ocorreu um erro durante o processamento: {str(e)}. A imagem original deve ser revisada manualmente. |
-""",
-                                                "error": str(e),
-                                                "completed": True
-                                            }
-                                    
-                                    # Submit the analysis work
-                                    future = executor.submit(
-                                        analyze_page_with_ocr, 
-                                        page_num, 
-                                        page_image, 
-                                        st.session_state.ptw_summary,
-                                        ocr_text
-                                    )
-                                    futures[future] = page_num
-                                    
-                                # Initialize empty results list with the right size
-                                st.session_state.analysis_results = [""] * st.session_state.total_pages
-                                
-                                # Process results as they complete
-                                for future in concurrent.futures.as_completed(futures):
-                                    page_num = futures[future]
-                                    try:
-                                        # Get the result from this future
-                                        result = future.result()
-                                        
-                                        # Update status
-                                        st.session_state.parallel_status["page_status"][page_num] = {
-                                            "status": "completed",
-                                            "ocr_status": result["ocr_status"],
-                                            "analysis_status": result["analysis_status"]
-                                        }
-                                        st.session_state.parallel_status["in_progress"] -= 1
-                                        st.session_state.parallel_status["completed"] += 1
-                                        
-                                        # Store result (index is 0-based but page_num is 1-based)
-                                        st.session_state.analysis_results[page_num-1] = result["analysis_result"]
-                                        
-                                        # Update overall completion status
-                                        st.session_state.analyses_completed = st.session_state.parallel_status["completed"]
-                                        
-                                    except Exception as exc:
-                                        # Update status to reflect the error
-                                        st.session_state.parallel_status["page_status"][page_num] = {
-                                            "status": "error",
-                                            "error": str(exc)
-                                        }
-                                        st.session_state.parallel_status["in_progress"] -= 1
-                                        st.session_state.parallel_status["completed"] += 1
+                        # Step 3: Generate PTW summary using Wonder Wise (unless already saved)
+                        ptw_summary = get_checkpointed_summary(checkpoint, compressed_pdf)
+                        st.session_state.ptw_summary = ptw_summary
     
     # Photo Capture Tab - only show if enabled in settings
     if st.session_state.enable_photo_capture:
@@ -3492,7 +2952,9 @@ def render_analyzer_page():
                     
                     # Add to session state when add button is clicked
                     if st.button("Adicionar Página", key=f"add_page_{page_number}"):
-                        st.session_state.captured_photos.append(img)
+                        st.session_state.captured_photos.append(
+                            get_session_pages().add(RenderedPage.from_image(img, page_number))
+                        )
                         st.session_state.photo_captions.append(caption)
                         st.success(f"✅ Página {page_number} adicionada com sucesso!")
                         st.session_state.clear_uploads = True
@@ -3510,10 +2972,10 @@ def render_analyzer_page():
                 cols = st.columns(min(3, num_photos))
                 
                 # Display each photo with options
-                for i, img in enumerate(st.session_state.captured_photos):
+                for i, photo in enumerate(st.session_state.captured_photos):
                     col_idx = i % len(cols)
                     with cols[col_idx]:
-                        st.image(img, caption=f"Página {i+1}: {st.session_state.photo_captions[i]}", use_container_width=True)
+                        render_page_image(photo, caption=f"Página {i+1}: {st.session_state.photo_captions[i]}", rendition="thumbnail")
                         
                         # Remove button
                         if st.button("Remover", key=f"remove_{i}"):
@@ -3565,8 +3027,11 @@ def render_analyzer_page():
                     st.session_state.parallel_processing = False
                     
                     # Reset session state variables
+                    discard_analysis_job()
+                    st.session_state.doc_key = None
                     st.session_state.ptw_summary = None
                     st.session_state.page_images = []
+                    st.session_state.page_index = None
                     st.session_state.analysis_results = []
                     st.session_state.current_page = 0
                     st.session_state.analyses_completed = 0
@@ -3577,7 +3042,11 @@ def render_analyzer_page():
                     # Process immediately without rerun - like app_Old_Visual.py
                     with st.spinner("Preparando fotos capturadas para análise..."):
                         # Transfer captured photos to page_images
-                        st.session_state.page_images = st.session_state.captured_photos.copy()
+                        # (photos were encoded and stored when captured; only their page numbers change)
+                        for page_num, photo in enumerate(st.session_state.captured_photos, 1):
+                            photo.page_num = page_num
+                        st.session_state.page_images = list(st.session_state.captured_photos)
+                        st.session_state.page_index = build_page_index([page.thumbnail for page in st.session_state.page_images])
                         st.session_state.total_pages = len(st.session_state.page_images)
                         
                         # Create a PDF from the images for the summary generation
@@ -3589,18 +3058,13 @@ def render_analyzer_page():
                         # Create a new PDF document
                         pdf = fitz.open()
                         
-                        # Add each image as a new page
-                        for i, img in enumerate(st.session_state.captured_photos):
-                            # Convert PIL Image to bytes
-                            img_buffer = io.BytesIO()
-                            img.save(img_buffer, format="PNG")
-                            img_buffer.seek(0)
-                            
+                        # Add each image as a new page, reusing the PNG encoded for the page
+                        for i, photo_page in enumerate(st.session_state.page_images):
                             # Add page to PDF with the image's aspect ratio
-                            width, height = img.size
+                            width, height = photo_page.size
                             page = pdf.new_page(width=width, height=height)
                             rect = fitz.Rect(0, 0, width, height)
-                            page.insert_image(rect, stream=img_buffer.getvalue())
+                            page.insert_image(rect, stream=photo_page.data)
                             
                             # Add caption if available
                             if i < len(st.session_state.photo_captions) and st.session_state.photo_captions[i]:
@@ -3617,9 +3081,16 @@ def render_analyzer_page():
                         pdf_buffer.seek(0)
                         pdf_bytes = pdf_buffer.getvalue()
                         
-                        # Generate PTW summary using Wonder Wise
-                        st.info("Gerando resumo da PT com Wonder Wise...")
-                        ptw_summary = generate_ptw_summary(pdf_bytes)
+                        # Photos are the same document when their pixels and captions are
+                        doc_key = get_document_checkpoint_key(hash_bytes(
+                            *[photo.page_hash for photo in st.session_state.page_images],
+                            *st.session_state.photo_captions
+                        ))
+                        checkpoint = load_document_checkpoint(doc_key, st.session_state.total_pages)
+                        use_document_checkpoint(doc_key, checkpoint)
+                        
+                        # Generate PTW summary using Wonder Wise (unless already saved)
+                        ptw_summary = get_checkpointed_summary(checkpoint, pdf_bytes)
                         st.session_state.ptw_summary = ptw_summary
             
             # Option to cancel photo collection mode
@@ -3635,6 +3106,12 @@ def render_analyzer_page():
     # This matches how app_Old_Visual.py works - processing happens immediately when buttons are clicked
     # No need for any processing here
     
+    # A new session opened on the link of a running analysis (e.g. after the tab was closed) attaches to it
+    if not st.session_state.processing and st.session_state.job_id is None:
+        linked_job = get_job_runner().get(st.experimental_get_query_params().get("job", [None])[0])
+        if linked_job is not None:
+            attach_analysis_job(linked_job)
+    
     # Display processing interface if processing has started
     if st.session_state.processing:
         # Display PTW summary with enhanced table display
@@ -3666,186 +3143,69 @@ def render_analyzer_page():
                     # If no table format detected, just display the entire summary
                     st.markdown(summary_text)
             
+            # The pages are analysed by a background job; this run only shows its progress
+            job = get_job_runner().get(st.session_state.job_id)
+            if job is None and st.session_state.total_pages > 0 and \
+               st.session_state.analyses_completed < st.session_state.total_pages:
+                job = start_analysis_job()
+            
+            snapshot = job.snapshot() if job is not None else None
+            if snapshot is not None:
+                sync_analysis_job(snapshot)
+            
             # Display progress based on processing mode (sequential or parallel)
             progress_value = st.session_state.analyses_completed / st.session_state.total_pages if st.session_state.total_pages > 0 else 0
             
-            # Different progress display for parallel vs sequential
-            if st.session_state.parallel_processing:
-                # For parallel processing, show overall progress
-                progress_text = f"Processando em paralelo: {st.session_state.analyses_completed}/{st.session_state.total_pages} páginas concluídas"
-                st.progress(progress_value, text=progress_text)
-                
-                # Add detailed status display for parallel processing
-                if st.session_state.analyses_completed < st.session_state.total_pages:
+            if snapshot is not None and snapshot["status"] == "error":
+                st.error(f"O processamento foi interrompido: {snapshot['error']}")
+            
+            if snapshot is not None and snapshot["status"] in ("queued", "running"):
+                # Different progress display for parallel vs sequential
+                if st.session_state.parallel_processing:
+                    progress_text = f"Processando em paralelo: {st.session_state.analyses_completed}/{st.session_state.total_pages} páginas concluídas"
+                    st.progress(progress_value, text=progress_text)
+                    
                     status_cols = st.columns(3)
                     with status_cols[0]:
                         st.metric("Páginas Concluídas", st.session_state.analyses_completed)
                     with status_cols[1]:
-                        st.metric("Em Processamento", st.session_state.parallel_status.get("in_progress", 0))
+                        st.metric("Em Processamento", snapshot["in_progress"])
                     with status_cols[2]:
                         st.metric("Total de Páginas", st.session_state.total_pages)
+                else:
+                    # Sequential mode shows the page being processed and its OCR preview
+                    current_page_num = next(
+                        (page_num for page_num in range(1, st.session_state.total_pages + 1)
+                         if snapshot["page_status"][page_num]["status"] not in ("completed", "error")),
+                        st.session_state.total_pages
+                    )
+                    progress_text = f"Processando página {current_page_num}/{st.session_state.total_pages}"
+                    st.progress(progress_value, text=progress_text)
                     
-                    # Add a refresh button to update the progress
-                    if st.button("Atualizar Status", key="refresh_parallel"):
-                        st.rerun()
-                    
-                    # Show message that processing is happening in background
-                    st.info("O processamento em paralelo está ocorrendo em segundo plano. Você pode atualizar o status clicando no botão acima ou aguardar a conclusão.")
-                    
-                    # Auto refresh - at a slower pace to avoid UI issues
-                    st.empty().info("Esta página será atualizada automaticamente em alguns segundos...")
-                    time.sleep(10)  # Longer wait time to give UI time to stabilize
-                    st.rerun()
-                
-                # If all pages are processed, skip the sequential processing section
-                if st.session_state.analyses_completed >= st.session_state.total_pages:
-                    st.success("Todas as páginas foram processadas com sucesso!")
+                    st.markdown(f"### Processando Página {current_page_num} de {st.session_state.total_pages}")
+                    render_page_image(st.session_state.page_images[current_page_num - 1],
+                                      caption=f"Página {current_page_num}",
+                                      key=f"zoom_processing_{current_page_num}")
                     
-                    # Jump to results section
-                    st.session_state.current_page = st.session_state.total_pages
-            else:
-                # For sequential processing, show current page progress
-                progress_text = f"Processando página {st.session_state.analyses_completed + 1}/{st.session_state.total_pages}"
-                st.progress(progress_value, text=progress_text)
-            
-            # Process pages in batch (for sequential processing)
-            if not st.session_state.parallel_processing and st.session_state.current_page < st.session_state.total_pages:
-                # Add batch processing state variables if not present
-                if 'batch_size' not in st.session_state:
-                    st.session_state.batch_size = 3  # Default batch size of 3 pages
-                if 'batch_start' not in st.session_state:
-                    st.session_state.batch_start = 0
-                if 'batch_ocr_results' not in st.session_state:
-                    st.session_state.batch_ocr_results = {}
+                    page_status = snapshot["page_status"][current_page_num]
+                    if page_status.get("ocr_preview"):
+                        st.markdown("**Prévia do Texto OCR:**")
+                        st.code(page_status["ocr_preview"], language=None)
                 
-                # Determine if we need to process a new batch
-                current_batch_start = (st.session_state.current_page // st.session_state.batch_size) * st.session_state.batch_size
-                
-                # Process a new batch if needed
-                if current_batch_start != st.session_state.batch_start or not st.session_state.batch_ocr_results:
-                    st.session_state.batch_start = current_batch_start
-                    
-                    # Create a header for the current batch processing status
-                    batch_end = min(st.session_state.batch_start + st.session_state.batch_size, st.session_state.total_pages)
-                    st.markdown(f"### Processando Lote de Páginas {st.session_state.batch_start + 1} a {batch_end} de {st.session_state.total_pages}")
-                    
-                    # Process the batch
-                    with st.spinner(f"Processando lote de páginas {st.session_state.batch_start + 1} a {batch_end}..."):
-                        st.session_state.batch_ocr_results = process_pages_batch(
-                            st.session_state.page_images, 
-                            st.session_state.batch_start, 
-                            st.session_state.batch_size, 
-                            st.session_state.ptw_summary
-                        )
+                # Status messages reported by the OCR and analysis stages
+                if snapshot["messages"]:
+                    with st.expander("Mensagens do processamento"):
+                        for level, text in snapshot["messages"][-10:]:
+                            getattr(st, level, st.info)(text)
                 
-                # Display the current page from the batch
-                st.markdown(f"### Processando Página {st.session_state.current_page + 1} de {st.session_state.total_pages}")
+                st.info("O processamento está ocorrendo em segundo plano e continua mesmo se esta aba for fechada. Reabra este endereço para acompanhar o progresso.")
                 
-                with st.spinner(f"Analisando página {st.session_state.current_page + 1}..."):
-                    try:
-                        # Display current page image
-                        current_image = st.session_state.page_images[st.session_state.current_page]
-                        st.image(current_image, caption=f"Página {st.session_state.current_page + 1}", use_container_width=True)
-                        
-                        # Add a separator for clarity
-                        st.markdown("---")
-                        
-                        # Create columns for the processing steps
-                        col1, col2 = st.columns(2)
-                        
-                        # Get OCR text from batch results
-                        current_page_num = st.session_state.current_page + 1  # 1-based page number
-                        
-                        # Process page with Wonder Wise OCR
-                        with col1:
-                            st.subheader("Processamento OCR")
-                            
-                            # Create a placeholder for the status
-                            status_placeholder = st.empty()
-                            
-                            # Check if OCR result exists in batch
-                            if current_page_num in st.session_state.batch_ocr_results:
-                                ocr_text = st.session_state.batch_ocr_results[current_page_num]
-                                status_placeholder.success("Processamento OCR em lote completo")
-                                
-                                # Show a preview of the OCR text
-                                st.markdown("**Prévia do Texto OCR:**")
-                                preview = ocr_text[:500] + "..." if len(ocr_text) > 500 else ocr_text
-                                st.code(preview, language=None)
-                            else:
-                                # Fallback to individual OCR processing if batch failed for this page
-                                status_placeholder.warning("Processamento em lote falhou. Tentando OCR individual...")
-                                
-                                # Show a spinner while processing
-                                with st.spinner("Executando processamento OCR individual..."):
-                                    # Run the OCR processing
-                                    ocr_text = process_page_with_claude_ocr(current_image, current_page_num)
-                                
-                                # Check if OCR was successful or if there was an error
-                                if "Error:" in ocr_text or "failed" in ocr_text:
-                                    status_placeholder.error("Processamento OCR teve problemas. Análise continuará com dados limitados.")
-                                else:
-                                    status_placeholder.success("Processamento OCR individual completo")
-                                    # Show a preview of the OCR text
-                                    st.markdown("**Prévia do Texto OCR:**")
-                                    preview = ocr_text[:500] + "..." if len(ocr_text) > 500 else ocr_text
-                                    st.code(preview, language=None)
-                        
-                        # Analyze page with Wonder Wise
-                        with col2:
-                            st.subheader("Análise de IA")
-                            # Create a placeholder for the status
-                            ai_status = st.empty()
-                            ai_status.info("Iniciando análise com Wonder Wise...")
-                            
-                            # Extract or get permit number for consistency
-                            permit_number = st.session_state.get('permit_number', None)
-                            
-                            # Try to extract permit number from first page if not already available
-                            if not permit_number and current_page_num == 1:
-                                permit_number = extract_permit_number(ocr_text, st.session_state.ptw_summary)
-                                if permit_number:
-                                    st.session_state.permit_number = permit_number
-                                    st.info(f"Número da PT detectado: {permit_number}")
-                                    
-                            # Show a spinner while processing
-                            with st.spinner("Analisando conteúdo do documento..."):
-                                analysis_result = analyze_page_with_claude(
-                                    ocr_text, 
-                                    st.session_state.ptw_summary, 
-                                    current_page_num,
-                                    permit_number
-                                )
-                            
-                            # Update status once complete
-                            ai_status.success("Análise completa")
-                        
-                        # Add result to session state
-                        st.session_state.analysis_results.append(analysis_result)
-                        
-                        # Show a success message
-                        st.success(f"Página {current_page_num} processada com sucesso!")
-                        
-                    except Exception as page_error:
-                        st.error(f"Erro ao processar página {current_page_num}: {str(page_error)}")
-                        # Add a failure result to maintain the flow
-                        failure_result = f"""
-| Desconhecido | {current_page_num} | Página {current_page_num} | Conteúdo do Documento | REPROVADO | Deficiência crítica: Ocorreu um erro durante o processamento: {str(page_error)}. A imagem original deve ser revisada manualmente. |
-"""
-                        st.session_state.analysis_results.append(failure_result)
-                    
-                    finally:
-                        # Always update progress, even if there was an error
-                        st.session_state.analyses_completed += 1
-                        st.session_state.current_page += 1
-                        
-                        # Add a button to continue to the next page
-                        if st.button("Continuar para Próxima Página", key=f"continue_btn_{st.session_state.current_page}"):
-                            st.rerun()
-                        else:
-                            # Auto-continue after a short delay
-                            time.sleep(1.5)
-                            st.rerun()
+                # Poll the job; processing itself does not depend on these reruns
+                time.sleep(JOB_POLL_INTERVAL)
+                st.rerun()
+            
+            if snapshot is not None and snapshot["status"] == "completed":
+                st.success("Todas as páginas foram processadas com sucesso!")
             
             # All pages processed, show results
             if (st.session_state.parallel_processing and st.session_state.analyses_completed == st.session_state.total_pages) or \
@@ -3859,48 +3219,20 @@ def render_analyzer_page():
                 </div>
                 """, unsafe_allow_html=True)
                 
-                # Combine all results
-                combined_results = ""
-                
-                # Process the analysis results to extract tables
-                for page_num, result in enumerate(st.session_state.analysis_results, 1):
-                    # Add the processed result to the combined results
-                    combined_results += result + "\n\n"
+                # Combine the result rows of every page
+                all_rows = [
+                    row
+                    for result in st.session_state.analysis_results
+                    for row in result or []
+                ]
                 
                 # Create a clean table
                 try:
-                    st.info("Gerando tabela de análise...")
-                    
-                    # DEBUG - Let's see what data we're getting from each page
+                    # DEBUG - Rows recorded for each page
                     with st.expander("Análise de Dados (DEBUG)", expanded=False):
-                        # Track identified tables and rows
-                        debug_data = {
-                            "header_found": False,
-                            "rows_per_page": {},
-                            "tables_found": 0,
-                            "excluded_rows": 0
-                        }
-                        
-                        for page_num, result in enumerate(st.session_state.analysis_results, 1):
-                            # Check if the page has analysis data
-                            if result and "|" in result:
-                                st.write(f"**Página {page_num} tem tabela:** {result[:100]}...")
-                                
-                                # Count table rows in this page's result
-                                table_rows = sum(1 for line in result.split('\n') if line.strip().startswith('|') and line.strip().endswith('|'))
-                                debug_data["rows_per_page"][page_num] = table_rows
-                            else:
-                                st.write(f"**Página {page_num}:** Sem dados de tabela")
-                        
-                        # After processing all pages, display debug stats
-                        st.write("---")
                         st.write("### Estatísticas da Tabela:")
-                        st.write(f"- Páginas com tabelas: {len(debug_data['rows_per_page'])}")
-                        for page, rows in debug_data['rows_per_page'].items():
-                            st.write(f"  - Página {page}: {rows} linhas de tabela")
-                        
-                        # We'll update these stats after parsing
-                        debug_info_placeholder = st.empty()
+                        for page_num, result in enumerate(st.session_state.analysis_results, 1):
+                            st.write(f"  - Página {page_num}: {len(result or [])} linhas de resultado")
                     
                     # Create a clean header
                     table_header = """
@@ -3910,149 +3242,11 @@ def render_analyzer_page():
                     """
                     st.markdown(table_header, unsafe_allow_html=True)
                     
-                    # Parse the table data from the markdown, focusing only on the main summary table
-                    all_rows = []
-                    current_headers = None
-                    header_line_found = False
-                    in_main_table = False
-                    
-                    # Expected headers for the main summary table - expanded to cover more variations
-                    expected_main_headers = [
-                        'Número da Permissão', 'Permit Number', 'Número da PT', 'PT Number', 'PTW Number',
-                        'Número da Página', 'Page Number', 'Página', 'Page', 
-                        'Resumo da Página', 'Page Summary', 'Resumo', 'Summary',
-                        'Seção', 'Section', 
-                        'Status', 'Comentários', 'Comments', 'Desconhecido', 'Unknown',
-                        'Completa', 'Complete'
-                    ]
-                                           
-                    # Process each line in the combined results
-                    for line in combined_results.split('\n'):
-                        line = line.strip()
-                        
-                        # Skip empty lines
-                        if not line:
-                            continue
-                        
-                        # Check if we're starting a new section/table
-                        if not line.startswith('|') and header_line_found and in_main_table:
-                            # We've finished the main table
-                            in_main_table = False
-                            continue
-                            
-                        # Parse only table rows
-                        if line.startswith('|') and line.endswith('|'):
-                            # Split the line by | and clean up cells
-                            cells = [cell.strip() for cell in line.split('|')[1:-1]]
-                            
-                            # Skip separator rows (contain only dashes)
-                            if all('-' in cell and cell.replace('-', '') == '' for cell in cells):
-                                continue
-                                
-                            # If this looks like a header row (either first time or new table with same structure)
-                            if not header_line_found or not in_main_table:
-                                # Look for header patterns
-                                # We need to detect both table headers for the first time AND
-                                # new tables from subsequent pages with the same structure
-                                
-                                # Count how many expected header columns we have
-                                header_matches = sum(1 for cell in cells if cell in expected_main_headers)
-                                
-                                # First header detection - needs stricter criteria
-                                if not header_line_found and header_matches >= 3:
-                                    # This is our first main table header
-                                    current_headers = cells
-                                    header_line_found = True
-                                    in_main_table = True
-                                    continue
-                                
-                                # Subsequent header detection - must match first header structure
-                                elif header_line_found and not in_main_table and current_headers:
-                                    # If this has the same structure as our known header
-                                    if len(cells) == len(current_headers) and header_matches >= 2:
-                                        # This is a new table with the same structure
-                                        in_main_table = True
-                                        continue
-                            
-                            # Skip if we're not in the main table or don't have headers yet
-                            if not in_main_table or not current_headers:
-                                continue
-                                
-                            # Check for column count match - if this row doesn't have the same number of columns
-                            # as the header row, it's likely not part of our main table
-                            if len(cells) != len(current_headers):
-                                continue
-                            
-                            # This is a data row in our main table - create a clean dictionary
-                            row_data = {}
-                            valid_data = True
-                            has_status = False
-                            
-                            for i, cell in enumerate(cells):
-                                if i < len(current_headers):
-                                    header_key = current_headers[i].strip()
-                                    row_value = cell.strip()
-                                    row_data[header_key] = row_value
-                                    
-                                    # Check for invalid row indicators - these are likely secondary tables
-                                    if any(bad_marker in cell for bad_marker in ["Linha ", "Cargo/Função", "Tabela "]):
-                                        valid_data = False
-                                    
-                                    # Check if this row has a status field with expected values
-                                    if header_key in ['Status'] and row_value in ['APROVADO', 'REPROVADO', 'APPROVED', 'REPROVED', 'INCONCLUSIVO', 'CHECAGEM HUMANA NECESSARIA', 'HUMAN CHECK REQUIRED']:
-                                        has_status = True
-                            
-                            # Add the row if:
-                            # 1. It has valid data
-                            # 2. It has a valid Status value (indicating it's a result row)
-                            # 3. It has complete data (not empty)
-                            if valid_data and has_status and len(row_data) >= 3:
-                                # Check if this row has the same structure as our main table
-                                # We should have page number and section information
-                                page_col = 'Número da Página' if 'Número da Página' in row_data else 'Page Number'
-                                section_col = 'Seção' if 'Seção' in row_data else 'Section'
-                                
-                                if (page_col in row_data and row_data[page_col]) and (section_col in row_data and row_data[section_col]):
-                                    all_rows.append(row_data)
-                    
                     # Check if we have any rows to display
-                    if all_rows and current_headers:
-                        # Create a new DataFrame with proper column order
-                        df = pd.DataFrame(all_rows)
-                        
-                        # Clean up page number columns - ensure they only contain numeric values
-                        page_columns = ['Número da Página', 'Page Number']
-                        for col in page_columns:
-                            if col in df.columns:
-                                # Extract only numeric characters from the page number column
-                                df[col] = df[col].apply(lambda x: ''.join(filter(str.isdigit, str(x))) if x else '')
-                                # Drop rows with empty page numbers after cleaning
-                                df = df[df[col] != '']
+                    if all_rows:
+                        # Build the table straight from the result rows
+                        df = pd.DataFrame(all_rows, columns=list(RESULT_COLUMNS)).rename(columns=RESULT_COLUMN_LABELS)
                         
-                        # Update debug info
-                        if 'debug_info_placeholder' in locals():
-                            # Get unique page numbers in our final table
-                            if 'Número da Página' in df.columns:
-                                pages_included = df['Número da Página'].unique()
-                            elif 'Page Number' in df.columns:
-                                pages_included = df['Page Number'].unique()
-                            else:
-                                pages_included = []
-                                
-                            debug_info_placeholder.write("### Resultados da Análise:")
-                            debug_info_placeholder.write(f"- Linhas incluídas na tabela final: {len(df)}")
-                            debug_info_placeholder.write(f"- Páginas representadas: {len(pages_included)}")
-                            debug_info_placeholder.write(f"- Números das páginas incluídas: {', '.join(str(p) for p in sorted(pages_included))}")
-                        
-                        # Remove duplicate headers that might have been appended during analysis
-                        # Keep only data rows, filter out header rows
-                        headers_pattern = "|".join([re.escape(header.strip()) for header in current_headers])
-                        if 'Permit Number' in df.columns or 'Número da Permissão' in df.columns:
-                            # Get the column with permit numbers
-                            permit_col = 'Permit Number' if 'Permit Number' in df.columns else 'Número da Permissão'
-                            # Filter out rows that have a header as permit number value
-                            df = df[~df[permit_col].str.contains(headers_pattern, regex=True, case=False, na=False)]
-
                         # Apply conditional styling to highlight status items with appropriate colors
                         def style_status(val):
                             if val in ['REPROVED', 'REPROVADO']:
@@ -4160,10 +3354,10 @@ def render_analyzer_page():
                             # Display the selected page image
                             with col2:
                                 if 1 <= selected_page <= len(st.session_state.page_images):
-                                    st.image(
+                                    render_page_image(
                                         st.session_state.page_images[selected_page-1], 
                                         caption=f"Página {selected_page}", 
-                                        use_container_width=True
+                                        key=f"zoom_results_{selected_page}"
                                     )
                                     
                                     # Get the analysis results for this page
@@ -4290,19 +3484,18 @@ def render_analyzer_page():
                             
                     else:
                         st.warning("Não há dados de análise para exibir")
-                        # Show the raw markdown as fallback
-                        st.markdown(combined_results)
                 
                 except Exception as e:
                     st.error(f"Erro ao processar resultados: {str(e)}")
-                    # Show the raw results as fallback
-                    st.markdown(combined_results)
                 
                 # Reset button
                 if st.button("Processar Outro Documento"):
+                    discard_analysis_job()
+                    st.session_state.doc_key = None
                     st.session_state.processing = False
                     st.session_state.ptw_summary = None
                     st.session_state.page_images = []
+                    st.session_state.page_index = None
                     st.session_state.analysis_results = []
                     st.session_state.current_page = 0
                     st.session_state.analyses_completed = 0
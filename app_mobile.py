@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import tempfile
 import base64
 import io
 import time
@@ -10,12 +9,14 @@ import pandas as pd
 import uuid
 import concurrent.futures
 import threading
-from PIL import Image, ImageEnhance
+from PIL import Image
 from anthropic import Anthropic
 from pathlib import Path
 
 # Import UI helper functions
-from ui_helpers import load_css, init_session_state, render_sidebar, render_welcome_message, get_image_base64
+from ui_helpers import load_css, init_session_state, render_sidebar, render_welcome_message, get_image_base64, get_session_pages, render_page_image
+from pdf_compress import compress_pdf_images
+from page_raster import PageRasterizer, RenderedPage, encode_image, encode_page_for_api
 
 # Set page configuration
 st.set_page_config(
@@ -148,183 +149,50 @@ def get_file_size_mb(file_bytes):
     return len(file_bytes) / (1024 * 1024)
 
 def compress_pdf(input_bytes, target_size_mb=4.0):
-    """Compress PDF to target size."""
-    # Save input bytes to a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_input:
-        temp_input.write(input_bytes)
-        temp_input_path = temp_input.name
-    
-    # Create a temporary output file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_output:
-        temp_output_path = temp_output.name
-    
-    # Check if input already meets the requirement
-    input_size = get_file_size_mb(input_bytes)
-    if input_size <= target_size_mb:
-        # Already under target size, just return the original
-        os.unlink(temp_input_path)
-        os.unlink(temp_output_path)
-        return input_bytes
+    """
+    Compress PDF to target size.
     
+    Only the embedded raster images are recompressed (in parallel, with the
+    quality chosen in a single pass), so text, vector content and the PDF
+    text layer are preserved.
+    """
     try:
-        # Open the PDF
-        input_pdf = fitz.open(temp_input_path)
-        output_pdf = fitz.open()
-        
-        # Try different compression levels until we achieve target size
-        for quality in [95, 90, 80, 70, 60, 50, 40]:
-            # Clear output PDF
-            output_pdf.close()
-            output_pdf = fitz.open()
-            
-            # Process each page
-            for page_num in range(len(input_pdf)):
-                page = input_pdf[page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(1, 1))
-                
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                img_stream = io.BytesIO()
-                img.save(img_stream, format="JPEG", quality=quality)
-                img_stream.seek(0)
-                
-                # Add the compressed image as a new page
-                new_page = output_pdf.new_page(width=page.rect.width, height=page.rect.height)
-                new_page.insert_image(page.rect, stream=img_stream.getvalue())
-            
-            # Save to the temporary output file
-            output_pdf.save(temp_output_path, garbage=4, deflate=True)
-            
-            # Check if we achieved the target size
-            with open(temp_output_path, 'rb') as f:
-                output_bytes = f.read()
-                if get_file_size_mb(output_bytes) <= target_size_mb:
-                    break
-        
-        # Close PDF objects
-        input_pdf.close()
-        output_pdf.close()
-        
-        # Read the final output file
-        with open(temp_output_path, 'rb') as f:
-            output_bytes = f.read()
-        
-        return output_bytes
-        
+        return compress_pdf_images(input_bytes, target_size_mb)
     except Exception as e:
         st.error(f"Error compressing PDF: {str(e)}")
         return input_bytes
-    
-    finally:
-        # Clean up temporary files
-        try:
-            os.unlink(temp_input_path)
-            os.unlink(temp_output_path)
-        except:
-            pass
-
-def extract_pages_as_images(pdf_bytes, dpi=300):
-    """Extract pages from PDF as PNG images with specified resolution."""
-    images = []
-    
-    # Save to a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-        temp_file.write(pdf_bytes)
-        temp_path = temp_file.name
+
+def extract_pages_as_images(pdf_bytes, dpi=300, store=None):
+    """Render PDF pages one at a time from memory, keeping them as encoded PNG pages (see page_raster), optionally spilled to a SessionPages store."""
+    pages = []
     
     try:
-        # Open the PDF
-        pdf = fitz.open(temp_path)
-        total_pages = len(pdf)
-        
-        # Add a progress indicator for large documents
-        if total_pages > 5:
-            progress_bar = st.progress(0)
-            progress_text = st.empty()
-        
-        # Convert each page to an image
-        for page_num in range(total_pages):
-            # Update progress for large documents
-            if total_pages > 5:
-                progress = (page_num + 1) / total_pages
-                progress_bar.progress(progress, text=f"Extraindo página {page_num + 1}/{total_pages}")
-            
-            page = pdf[page_num]
-            
-            # Starting with higher DPI for better text clarity, especially for scanned documents
-            initial_dpi = dpi  # Start with a higher DPI for better quality
-            zoom = initial_dpi / 72  # 72 is the default PDF dpi
-            matrix = fitz.Matrix(zoom, zoom)
+        with PageRasterizer(pdf_bytes, dpi) as rasterizer:
+            total_pages = len(rasterizer)
             
-            # Always use RGB for better OCR results
-            pix = page.get_pixmap(matrix=matrix)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Apply slight sharpening to improve text clarity (especially for scanned docs)
-            enhancer = ImageEnhance.Sharpness(img)
-            img = enhancer.enhance(1.2)  # Slight sharpening
-            
-            # Adjust contrast slightly to improve readability
-            contrast_enhancer = ImageEnhance.Contrast(img)
-            img = contrast_enhancer.enhance(1.1)  # Slight contrast boost
-            
-            # Create a PNG buffer with high quality
-            buf = io.BytesIO()
-            img.save(buf, format="PNG", optimize=True)
-            buf.seek(0)
-            
-            # Check size and compress if needed
-            img_size_mb = len(buf.getvalue()) / (1024 * 1024)
+            # Add a progress indicator for large documents
+            if total_pages > 5:
+                progress_bar = st.progress(0)
             
-            # If image is too large, try to reduce size while maintaining quality
-            if img_size_mb > 4:
-                st.warning(f"Página {page_num + 1} tem {img_size_mb:.2f}MB, comprimindo para processamento...")
+            for page in rasterizer:
+                # Update progress for large documents
+                if total_pages > 5:
+                    progress_bar.progress(page.page_num / total_pages, text=f"Extraindo página {page.page_num}/{total_pages}")
                 
-                # Try reducing the resolution in smaller steps to maintain readability
-                for reduce_dpi in [250, 200, 175, 150, 125]:
-                    reduce_matrix = fitz.Matrix(reduce_dpi / 72, reduce_dpi / 72)
-                    reduced_pix = page.get_pixmap(matrix=reduce_matrix)
-                    reduced_img = Image.frombytes("RGB", [reduced_pix.width, reduced_pix.height], reduced_pix.samples)
-                    
-                    # Apply enhancement to maintain readability at lower resolution
-                    enhancer = ImageEnhance.Sharpness(reduced_img)
-                    reduced_img = enhancer.enhance(1.3)  # Slightly stronger sharpening at lower resolution
-                    
-                    # Adjust contrast slightly to improve readability
-                    contrast_enhancer = ImageEnhance.Contrast(reduced_img)
-                    reduced_img = contrast_enhancer.enhance(1.2)
-                    
-                    # Try saving with this reduced resolution
-                    reduced_buf = io.BytesIO()
-                    reduced_img.save(reduced_buf, format="PNG", optimize=True, quality=95)  # High quality
-                    reduced_buf.seek(0)
-                    
-                    reduced_size_mb = len(reduced_buf.getvalue()) / (1024 * 1024)
-                    if reduced_size_mb <= 4.0:
-                        st.info(f"Página {page_num + 1} reduzida para {reduced_size_mb:.2f}MB em {reduce_dpi} DPI")
-                        img = reduced_img
-                        break
+                if page.dpi != dpi:
+                    st.info(f"Página {page.page_num} renderizada em {page.dpi} DPI para respeitar o limite de resolução")
+                
+                pages.append(store.add(page) if store is not None else page)
             
-            # Add image to list
-            images.append(img)
-        
-        # Clear progress display
-        if total_pages > 5:
-            progress_bar.empty()
-            progress_text.empty()
+            # Clear progress display
+            if total_pages > 5:
+                progress_bar.empty()
         
-        pdf.close()
-        return images
+        return pages
     
     except Exception as e:
         st.error(f"Error extracting pages: {str(e)}")
         return []
-    
-    finally:
-        # Clean up temporary file
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
 
 def generate_ptw_summary(pdf_bytes):
     """Generate a summary of the PTW document using Wonder Wise with robust fallback."""
@@ -379,20 +247,17 @@ def generate_ptw_summary(pdf_bytes):
             content = [{"type": "text", "text": "Please provide a summary of this Permit to Work document based on all pages. Format your response in Brazilian Portuguese. Include the table of page descriptions as specified."}]
             
             # Add each image to the content array
-            for i, img in enumerate(preview_images):
-                # Convert image to base64 with PNG format for better text clarity
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format="PNG", optimize=True)
-                img_buffer.seek(0)
-                img_base64 = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
+            for i, page in enumerate(preview_images):
+                # The stored PNG is sent as is when it fits the API limit
+                payload = encode_page_for_api(page)
                 
                 # Add image to content
                 content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
-                        "data": img_base64
+                        "media_type": payload.media_type,
+                        "data": payload.base64()
                     }
                 })
             
@@ -518,19 +383,17 @@ def generate_ptw_summary(pdf_bytes):
                 content = [{"type": "text", "text": "This is a sample of pages from a Permit to Work document. Please provide a summary including a table of page descriptions as best you can from these samples."}]
                 
                 # Add each sample image to the content array
-                for i, img in enumerate(sample_images):
-                    # Convert to PNG for better text clarity
-                    buffered = io.BytesIO()
-                    img.save(buffered, format="PNG", optimize=True)
-                    img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+                for i, page in enumerate(sample_images):
+                    # The stored PNG is sent as is when it fits the API limit
+                    payload = encode_page_for_api(page)
                     
                     # Add image to content
                     content.append({
                         "type": "image",
                         "source": {
                             "type": "base64",
-                            "media_type": "image/png",
-                            "data": img_base64
+                            "media_type": payload.media_type,
+                            "data": payload.base64()
                         }
                     })
                 
@@ -585,39 +448,16 @@ def generate_ptw_summary(pdf_bytes):
 def process_page_with_claude_ocr(page_image, page_num=None):
     """Process page image with Wonder Wise OCR."""
     try:
-        # Optimize image for Wonder Wise
-        img_buffer = io.BytesIO()
-        page_image.save(img_buffer, format='PNG', optimize=True)
-        img_buffer.seek(0)
-        
-        # Check if image is too large (>4.5MB)
-        img_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-        if img_size_mb > 3.5:
-            if page_num:
-                st.warning(f"Imagem da página {page_num} muito grande ({img_size_mb:.2f}MB). Redimensionando para processamento OCR.")
-            else:
-                st.warning(f"Imagem muito grande ({img_size_mb:.2f}MB). Redimensionando para processamento OCR.")
-            
-            # Determine a new size that maintains aspect ratio
-            width, height = page_image.size
-            ratio = min(1.0, 2000 / width, 2000 / height)  # Limit to max 2000px on either dimension
-            
-            # Create resized image
-            resized_img = page_image.resize((int(width * ratio), int(height * ratio)), Image.LANCZOS)
-            
-            # Save optimized version
-            img_buffer = io.BytesIO()
-            resized_img.save(img_buffer, format='PNG', optimize=True, quality=85)
-            img_buffer.seek(0)
-            
-            new_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
+        # Reuse the stored PNG when it fits, otherwise encode once within the limit
+        payload = encode_page_for_api(page_image, max_mb=3.5)
+        if payload.media_type != "image/png":
             if page_num:
-                st.info(f"Imagem da página {page_num} redimensionada para {new_size_mb:.2f}MB para permitir processamento adequado")
+                st.info(f"Imagem da página {page_num} comprimida para {payload.size_mb:.2f}MB para permitir processamento adequado")
             else:
-                st.info(f"Imagem redimensionada para {new_size_mb:.2f}MB para permitir processamento adequado")
+                st.info(f"Imagem comprimida para {payload.size_mb:.2f}MB para permitir processamento adequado")
         
         # Base64 encode for Wonder Wise
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        img_base64 = payload.base64()
         
         # Call Wonder Wise for OCR (keeping prompt in English)
         ocr_response = anthropic_client.messages.create(
@@ -683,7 +523,7 @@ def process_page_with_claude_ocr(page_image, page_num=None):
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/png",
+                                "media_type": payload.media_type,
                                 "data": img_base64
                             }
                         },
@@ -1342,28 +1182,13 @@ def process_pages_batch(page_images, batch_start, batch_size, ptw_summary):
         
         # Add each page to the batch content
         for page_num, page_image in batch_pages:
-            # Optimize image
-            img_buffer = io.BytesIO()
-            page_image.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            
-            # Check if image is too large (>4.5MB)
-            img_size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-            if img_size_mb > 3.5:
-                # Resize image if too large
-                width, height = page_image.size
-                ratio = min(1.0, 2000 / width, 2000 / height)
-                
-                resized_img = page_image.resize((int(width * ratio), int(height * ratio)), Image.LANCZOS)
-                
-                img_buffer = io.BytesIO()
-                resized_img.save(img_buffer, format='PNG', optimize=True, quality=85)
-                img_buffer.seek(0)
-                
-                st.info(f"Imagem da página {page_num} redimensionada para processamento em lote")
+            # Reuse the stored PNG when it fits, otherwise encode once within the limit
+            payload = encode_page_for_api(page_image, max_mb=3.5)
+            if payload.media_type != "image/png":
+                st.info(f"Imagem da página {page_num} comprimida para processamento em lote")
             
             # Base64 encode
-            img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+            img_base64 = payload.base64()
             
             # Add to batch content with page number in title
             batch_content.append({
@@ -1375,7 +1200,7 @@ def process_pages_batch(page_images, batch_start, batch_size, ptw_summary):
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/png",
+                    "media_type": payload.media_type,
                     "data": img_base64
                 }
             })
@@ -1446,59 +1271,15 @@ def prepare_image_for_claude(image, max_size_mb=3.75):
         new_size = (int(image.size[0]*ratio), int(image.size[1]*ratio))
         image = image.resize(new_size, Image.LANCZOS)
     
-    # Try to convert and compress the image
-    quality = 90
-    image_format = "PNG"
-    media_type = "image/png"
+    # PNG first, then the best JPEG quality/scale within the limit (base64 adds a third)
+    encoded = encode_image(image, int(max_size_mb * 1024 * 1024 * 3 / 4), min_quality=60)
+    img_base64 = encoded.base64()
     
-    # Function to check final base64 size
-    def get_base64_size(img_bytes):
-        base64_bytes = len(base64.b64encode(img_bytes.getvalue()))
-        return base64_bytes / (1024 * 1024)
-    
-    while True:
-        img_byte_arr = io.BytesIO()
-        
-        if image_format == "PNG":
-            image.save(img_byte_arr, format=image_format, optimize=True)
-            media_type = "image/png"
-            
-            base64_size = get_base64_size(img_byte_arr)
-            
-            if base64_size > 4.9:
-                image_format = "JPEG"
-                media_type = "image/jpeg"
-                continue
-        else:
-            image.save(img_byte_arr, format=image_format, quality=quality, optimize=True)
-            media_type = "image/jpeg"
-            
-            base64_size = get_base64_size(img_byte_arr)
-        
-        if base64_size <= 4.9:
-            break
-            
-        quality -= 15
-        
-        if quality < 40:
-            quality = 60
-            max_dimension = int(max_dimension * 0.7)
-            ratio = min(max_dimension/image.size[0], max_dimension/image.size[1])
-            new_size = (int(image.size[0]*ratio), int(image.size[1]*ratio))
-            image = image.resize(new_size, Image.LANCZOS)
-            
-        if max_dimension < 500:
-            raise ValueError("Could not compress image below 5MB limit while maintaining usable quality")
-    
-    img_byte_arr.seek(0)
-    img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode()
-    
-    img_byte_arr.seek(0)
-    processed_image = Image.open(img_byte_arr)
+    processed_image = Image.open(io.BytesIO(encoded.data))
     
     base64_size_mb = len(img_base64) / (1024 * 1024)
     
-    return processed_image, img_base64, media_type, base64_size_mb
+    return processed_image, img_base64, encoded.media_type, base64_size_mb
 
 def extract_permit_number(ocr_text=None, ptw_summary=None):
     """Extract permit number from OCR text or summary."""
@@ -1866,7 +1647,7 @@ def render_analyzer_page():
                             compressed_pdf = pdf_bytes
                         
                         # Step 2: Extract pages as images with 250 DPI PNG format
-                        page_images = extract_pages_as_images(pdf_bytes, dpi=250)
+                        page_images = extract_pages_as_images(pdf_bytes, dpi=250, store=get_session_pages())
                         st.session_state.page_images = page_images
                         st.session_state.total_pages = len(page_images)
                         
@@ -2148,7 +1929,9 @@ def render_analyzer_page():
                     
                     # Add to session state when add button is clicked
                     if st.button("Adicionar Página", key=f"add_page_{page_number}"):
-                        st.session_state.captured_photos.append(img)
+                        st.session_state.captured_photos.append(
+                            get_session_pages().add(RenderedPage.from_image(img, page_number))
+                        )
                         st.session_state.photo_captions.append(caption)
                         st.success(f"✅ Página {page_number} adicionada com sucesso!")
                         st.session_state.clear_uploads = True
@@ -2166,10 +1949,10 @@ def render_analyzer_page():
                 cols = st.columns(min(3, num_photos))
                 
                 # Display each photo with options
-                for i, img in enumerate(st.session_state.captured_photos):
+                for i, photo in enumerate(st.session_state.captured_photos):
                     col_idx = i % len(cols)
                     with cols[col_idx]:
-                        st.image(img, caption=f"Página {i+1}: {st.session_state.photo_captions[i]}", use_container_width=True)
+                        render_page_image(photo, caption=f"Página {i+1}: {st.session_state.photo_captions[i]}", rendition="thumbnail")
                         
                         # Remove button
                         if st.button("Remover", key=f"remove_{i}"):
@@ -2233,7 +2016,10 @@ def render_analyzer_page():
                     # Process immediately without rerun - like app_Old_Visual.py
                     with st.spinner("Preparando fotos capturadas para análise..."):
                         # Transfer captured photos to page_images
-                        st.session_state.page_images = st.session_state.captured_photos.copy()
+                        # (photos were encoded and stored when captured; only their page numbers change)
+                        for page_num, photo in enumerate(st.session_state.captured_photos, 1):
+                            photo.page_num = page_num
+                        st.session_state.page_images = list(st.session_state.captured_photos)
                         st.session_state.total_pages = len(st.session_state.page_images)
                         
                         # Create a PDF from the images for the summary generation
@@ -2245,18 +2031,13 @@ def render_analyzer_page():
                         # Create a new PDF document
                         pdf = fitz.open()
                         
-                        # Add each image as a new page
-                        for i, img in enumerate(st.session_state.captured_photos):
-                            # Convert PIL Image to bytes
-                            img_buffer = io.BytesIO()
-                            img.save(img_buffer, format="PNG")
-                            img_buffer.seek(0)
-                            
+                        # Add each image as a new page, reusing the PNG encoded for the page
+                        for i, photo_page in enumerate(st.session_state.page_images):
                             # Add page to PDF with the image's aspect ratio
-                            width, height = img.size
+                            width, height = photo_page.size
                             page = pdf.new_page(width=width, height=height)
                             rect = fitz.Rect(0, 0, width, height)
-                            page.insert_image(rect, stream=img_buffer.getvalue())
+                            page.insert_image(rect, stream=photo_page.data)
                             
                             # Add caption if available
                             if i < len(st.session_state.photo_captions) and st.session_state.photo_captions[i]:
@@ -2401,7 +2182,8 @@ def render_analyzer_page():
                     try:
                         # Display current page image
                         current_image = st.session_state.page_images[st.session_state.current_page]
-                        st.image(current_image, caption=f"Página {st.session_state.current_page + 1}", use_container_width=True)
+                        render_page_image(current_image, caption=f"Página {st.session_state.current_page + 1}",
+                                          key=f"zoom_processing_{st.session_state.current_page}")
                         
                         # Add a separator for clarity
                         st.markdown("---")
@@ -2758,10 +2540,10 @@ def render_analyzer_page():
                             # Display the selected page image
                             with col2:
                                 if 1 <= selected_page <= len(st.session_state.page_images):
-                                    st.image(
+                                    render_page_image(
                                         st.session_state.page_images[selected_page-1], 
                                         caption=f"Página {selected_page}", 
-                                        use_container_width=True
+                                        key=f"zoom_results_{selected_page}"
                                     )
                                     
                                     # Get the analysis results for this page
@@ -0,0 +1,69 @@
+"""
+Regression checks for the deterministic section rules (section_rules.py).
+
+Each case is an OCR transcription and the status expected for one section:
+APROVADO, REPROVADO, or None when the rule must leave the section to the
+model. Run with `python check_section_rules.py`; it needs no API key.
+"""
+
+import sys
+
+from section_rules import evaluate_section_rules
+
+CASES = [
+    (
+        "Section 20 with every closure reason unchecked is not approved",
+        "Seção 20 - Encerramento\n"
+        "[Unchecked: Término do trabalho]\n"
+        "[Unchecked: Acidente]\n"
+        "[Unchecked: Outros]",
+        "20", "REPROVADO"
+    ),
+    (
+        "Section 20 reason written as 'desmarcado' is not approved",
+        "Seção 20 - Encerramento\n"
+        "Término do trabalho: desmarcado\n"
+        "[Unchecked: Outros]",
+        "20", "REPROVADO"
+    ),
+    (
+        "Section 20 with a checked closure reason is approved",
+        "Seção 20 - Encerramento\n"
+        "[Checked: Término do trabalho]\n"
+        "[Unchecked: Acidente]",
+        "20", "APROVADO"
+    ),
+    (
+        "Section 18 without OCR markup is left to the model",
+        "Seção 18 - Ciência da PT\n"
+        "Nome: João Silva  Função: Sondador\n"
+        "Seção 14 - Operações Simultâneas\n"
+        "[Checked: Não]",
+        "18", None
+    ),
+    (
+        "Text layer pages are left to the model",
+        "[TEXT LAYER: transcribed from the PDF's embedded text]\n"
+        "Seção 20 - Encerramento\n"
+        "[Unchecked: Término do trabalho]",
+        "20", None
+    )
+]
+
+
+def check_section_rules() -> bool:
+    """Run every case and print the failures; return True if all pass."""
+    passed = True
+    for description, ocr_text, section, expected in CASES:
+        decisions = {decision.rule.section: decision for decision in evaluate_section_rules(ocr_text)}
+        status = decisions[section].status if section in decisions else None
+        if status != expected:
+            passed = False
+            print(f"FAIL: {description}: expected {expected}, got {status}")
+        else:
+            print(f"ok: {description}")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_section_rules() else 1)
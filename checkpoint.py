@@ -0,0 +1,266 @@
+"""
+Crash-safe analysis checkpoints for PTW Analyzer
+
+An analysis interrupted by a process restart, or with a page that failed,
+used to be redone from scratch: summary, OCR and every analysis call. This
+module records the progress of every document in a local SQLite database,
+keyed by a hash of the document (and of the model and prompt versions that
+produced the results):
+
+- the document summary and permit number
+- for every page, its OCR text once read, and its result rows and status
+  once analysed
+
+Re-opening the same document loads its checkpoint: completed pages are shown
+as they were, pages whose OCR was saved only run the analysis, and missing or
+failed pages are processed again. Checkpoints are kept for
+CHECKPOINT_RETENTION_DAYS.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from page_cache import CACHE_DIR, hash_bytes
+
+CHECKPOINT_DB_NAME = "ptw_checkpoints.sqlite3"
+
+# Checkpoints not updated for this long are deleted (days)
+CHECKPOINT_RETENTION_DAYS = float(os.environ.get("PTW_CHECKPOINT_RETENTION_DAYS", "7"))
+
+
+def document_key(*parts) -> str:
+    """
+    Build the checkpoint key of a document.
+
+    Args:
+        *parts: Document content (PDF bytes or page hashes) followed by the
+            model and prompt versions the results depend on
+
+    Returns:
+        str: Hexadecimal document key
+    """
+    return hash_bytes("document", *parts)
+
+
+class DocumentCheckpoint:
+    """Saved progress of one document."""
+
+    def __init__(self, doc_key: str, total_pages: int, summary: Optional[str],
+                 permit_number: Optional[str], pages: Dict[int, dict]):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            doc_key: Document key (see document_key)
+            total_pages: Number of pages in the document
+            summary: Saved document summary, if generated
+            permit_number: Permit number detected on the first page, if any
+            pages: page_num -> {"status", "ocr_text", "result"}
+        """
+        self.doc_key = doc_key
+        self.total_pages = total_pages
+        self.summary = summary
+        self.permit_number = permit_number
+        self.pages = pages
+
+    def completed_pages(self) -> Dict[int, List[dict]]:
+        """Return page_num -> result rows of the pages analysed successfully."""
+        return {
+            page_num: page["result"]
+            for page_num, page in self.pages.items()
+            if page["status"] == "completed" and page["result"]
+        }
+
+    def ocr_text(self, page_num: int) -> Optional[str]:
+        """Return the saved OCR text of a page, if it was read successfully."""
+        page = self.pages.get(page_num)
+        return page["ocr_text"] if page and page["ocr_text"] else None
+
+
+class CheckpointStore:
+    """SQLite database of document checkpoints shared by every session and thread."""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        Initialize the store.
+
+        Args:
+            db_path: Optional database file path (defaults to CACHE_DIR/CHECKPOINT_DB_NAME)
+        """
+        self.db_path = Path(db_path) if db_path else CACHE_DIR / CHECKPOINT_DB_NAME
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # One connection per thread; SQLite handles cross-process locking
+        self._local = threading.local()
+        self._init_schema()
+        self._prune()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Every checkpoint must survive a crash of the process that wrote it
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        """Create the checkpoint tables if they don't exist."""
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_key       TEXT PRIMARY KEY,
+                total_pages   INTEGER NOT NULL,
+                summary       TEXT,
+                permit_number TEXT,
+                updated       REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                doc_key  TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                status   TEXT NOT NULL,
+                ocr_text TEXT,
+                result   TEXT,
+                updated  REAL NOT NULL,
+                PRIMARY KEY (doc_key, page_num)
+            )
+        """)
+
+    def _prune(self):
+        """Delete checkpoints older than CHECKPOINT_RETENTION_DAYS."""
+        cutoff = time.time() - CHECKPOINT_RETENTION_DAYS * 86400
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM pages WHERE doc_key IN (SELECT doc_key FROM documents WHERE updated < ?)", (cutoff,))
+            conn.execute("DELETE FROM documents WHERE updated < ?", (cutoff,))
+        except Exception as e:
+            print(f"Warning: Could not prune checkpoints: {str(e)}")
+
+    def start(self, doc_key: str, total_pages: int):
+        """
+        Register a document, keeping any checkpoint it already has.
+
+        Args:
+            doc_key: Document key
+            total_pages: Number of pages in the document
+        """
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR IGNORE INTO documents (doc_key, total_pages, updated) VALUES (?, ?, ?)",
+                (doc_key, total_pages, time.time())
+            )
+        except Exception as e:
+            print(f"Warning: Could not save checkpoint: {str(e)}")
+
+    def save_document(self, doc_key: str, **fields):
+        """
+        Save document-level values.
+
+        Args:
+            doc_key: Document key
+            **fields: summary and/or permit_number
+        """
+        fields = {name: value for name, value in fields.items() if name in ("summary", "permit_number")}
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        try:
+            conn = self._connect()
+            conn.execute(
+                f"UPDATE documents SET {assignments}, updated = ? WHERE doc_key = ?",
+                (*fields.values(), time.time(), doc_key)
+            )
+        except Exception as e:
+            print(f"Warning: Could not save checkpoint: {str(e)}")
+
+    def save_page(self, doc_key: str, page_num: int, status: str,
+                  ocr_text: Optional[str] = None, result: Optional[List[dict]] = None):
+        """
+        Save the progress of a page.
+
+        Args:
+            doc_key: Document key
+            page_num: Page number (1-based)
+            status: "ocr_done", "completed" or "error"
+            ocr_text: OCR text (kept from an earlier save when omitted)
+            result: Result rows (kept from an earlier save when omitted)
+        """
+        now = time.time()
+        if result is not None:
+            result = json.dumps(result, ensure_ascii=False)
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO pages (doc_key, page_num, status, ocr_text, result, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (doc_key, page_num) DO UPDATE SET status = excluded.status, "
+                    "ocr_text = COALESCE(excluded.ocr_text, pages.ocr_text), "
+                    "result = COALESCE(excluded.result, pages.result), updated = excluded.updated",
+                    (doc_key, page_num, status, ocr_text, result, now)
+                )
+                conn.execute("UPDATE documents SET updated = ? WHERE doc_key = ?", (now, doc_key))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"Warning: Could not save checkpoint of page {page_num}: {str(e)}")
+
+    def load(self, doc_key: Optional[str]) -> Optional[DocumentCheckpoint]:
+        """
+        Load the checkpoint of a document.
+
+        Args:
+            doc_key: Document key
+
+        Returns:
+            DocumentCheckpoint or None: The saved progress, if any
+        """
+        if not doc_key:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT total_pages, summary, permit_number FROM documents WHERE doc_key = ?",
+                (doc_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            pages = {
+                page_num: {"status": status, "ocr_text": ocr_text, "result": json.loads(result) if result else None}
+                for page_num, status, ocr_text, result in conn.execute(
+                    "SELECT page_num, status, ocr_text, result FROM pages WHERE doc_key = ?",
+                    (doc_key,)
+                )
+            }
+        except Exception as e:
+            print(f"Warning: Could not read checkpoint: {str(e)}")
+            return None
+        return DocumentCheckpoint(doc_key, row[0], row[1], row[2], pages)
+
+
+# Process-wide store, created lazily
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Return the shared checkpoint store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CheckpointStore()
+        return _store
@@ -0,0 +1,174 @@
+"""
+Visual guide colour classifier for PTW Analyzer
+
+Permit packs are printed on carbonless sets: only the white copy (GUIA BRANCA)
+is audited, while the green and yellow copies (GUIA VERDE / GUIA AMARELA) get an
+N/A row. This module tells the copies apart from the rendered page image alone,
+using the hue and saturation of the paper pixels. Pages it is not confident
+about return a low score and follow the normal OCR path, where
+detect_guide_color() decides.
+
+Paper color alone is not trusted to skip a page: a white copy photographed
+under warm light, or aged cream paper, is tinted yellow almost uniformly, and a
+wrongly skipped page is never audited. The classifier's verdict only names a
+candidate, which must be confirmed by the page's own header text (GUIA/VIA/
+CÓPIA VERDE or AMARELA) before the page skips OCR. Photos, whose colors
+depend on the lighting, are not classified at all.
+"""
+
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Minimum confidence for a VERDE/AMARELA page to become a skip candidate (set above 1 to disable)
+GUIDE_COLOR_THRESHOLD = float(os.environ.get("PTW_GUIDE_COLOR_THRESHOLD", "0.85"))
+
+# Long edge of the thumbnail the classifier works on (pixels)
+CLASSIFIER_SIZE = 256
+
+# Brightness (HSV value, 0-255) above which a pixel counts as paper rather than ink
+PAPER_MIN_VALUE = 150
+
+# Saturation (0-255) above which a paper pixel counts as tinted rather than white
+TINT_MIN_SATURATION = 28
+
+# Share of the page height treated as the header band
+HEADER_FRACTION = 0.15
+
+# Weight of the header band in the final score (the rest is the whole page)
+HEADER_WEIGHT = 0.3
+
+# Header wording naming a copy ("GUIA VERDE", "Via amarela", "CÓPIA VERDE")
+COPY_HEADER_PATTERN = re.compile(r"\b(?:guia|via|c[oó]pia)\s+(verde|amarela)\b", re.IGNORECASE)
+
+# Paper hue ranges on PIL's 0-255 hue scale (0-360 degrees scaled)
+HUE_RANGES = {
+    "AMARELA": (25, 55),   # ~35-78 degrees
+    "VERDE": (55, 130)     # ~78-183 degrees
+}
+
+
+def _to_hsv(image: Image.Image) -> np.ndarray:
+    """
+    Downscale a page image and convert it to an HSV array.
+
+    Args:
+        image: PIL.Image object of the rendered page
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (height, width, 3) with H, S, V channels
+    """
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((CLASSIFIER_SIZE, CLASSIFIER_SIZE))
+    return np.asarray(thumbnail.convert("HSV"))
+
+
+def _paper_scores(hsv: np.ndarray) -> Optional[Dict[str, float]]:
+    """
+    Score each copy colour by the share of paper pixels that match it.
+
+    Args:
+        hsv: HSV array of (part of) a page
+
+    Returns:
+        dict or None: colour -> share of paper pixels, None if there is no paper
+    """
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+
+    paper = value >= PAPER_MIN_VALUE
+    paper_pixels = int(paper.sum())
+    if paper_pixels == 0:
+        return None
+
+    tinted = paper & (saturation >= TINT_MIN_SATURATION)
+    hue_histogram = np.bincount(hue[tinted], minlength=256)
+
+    scores = {
+        color: hue_histogram[low:high].sum() / paper_pixels
+        for color, (low, high) in HUE_RANGES.items()
+    }
+    scores["BRANCA"] = 1.0 - tinted.sum() / paper_pixels
+    return scores
+
+
+def classify_guide_color(image: Image.Image) -> Tuple[str, float]:
+    """
+    Classify a rendered page as a white, green or yellow copy.
+
+    The score of each colour blends its share of the paper pixels over the
+    whole page with its share in the header band, where the copy colour is
+    usually clearest (and where form headers name the copy).
+
+    Args:
+        image: PIL.Image object of the rendered page
+
+    Returns:
+        tuple: (color, confidence) where color is "BRANCA", "VERDE",
+            "AMARELA" or "UNKNOWN" and confidence is between 0 and 1
+    """
+    try:
+        hsv = _to_hsv(image)
+        page_scores = _paper_scores(hsv)
+        if page_scores is None:
+            return "UNKNOWN", 0.0
+
+        header_rows = max(1, int(hsv.shape[0] * HEADER_FRACTION))
+        header_scores = _paper_scores(hsv[:header_rows]) or page_scores
+
+        scores = {
+            color: (1.0 - HEADER_WEIGHT) * page_scores[color] + HEADER_WEIGHT * header_scores[color]
+            for color in page_scores
+        }
+        color = max(scores, key=scores.get)
+        confidence = float(scores[color])
+
+        # Tinted paper of another hue (pink, blue copies...) or mixed pages
+        if confidence < 0.5:
+            return "UNKNOWN", confidence
+        return color, confidence
+    except Exception as e:
+        print(f"Warning: Could not classify guide color: {str(e)}")
+        return "UNKNOWN", 0.0
+
+
+def is_skippable_copy(image: Image.Image, photo: bool = False,
+                      threshold: float = GUIDE_COLOR_THRESHOLD) -> Tuple[Optional[str], float]:
+    """
+    Decide whether a page is confidently a green or yellow copy by its paper color.
+
+    A positive answer is only a candidate: the page may skip the API once
+    header_names_copy() confirms the same color.
+
+    Args:
+        image: PIL.Image object of the rendered page
+        photo: True for photographed pages, which are never candidates
+        threshold: Minimum confidence required for a candidate
+
+    Returns:
+        tuple: (color, confidence) with color "VERDE" or "AMARELA" for a
+            candidate, or (None, confidence) otherwise
+    """
+    if photo:
+        return None, 0.0
+    color, confidence = classify_guide_color(image)
+    if color in ("VERDE", "AMARELA") and confidence >= threshold:
+        return color, confidence
+    return None, confidence
+
+
+def header_names_copy(text: Optional[str], color: str) -> bool:
+    """
+    Check whether a page's text names it as a copy of the given color.
+
+    Args:
+        text: Text of the page (e.g. its PDF text layer), None if unknown
+        color: "VERDE" or "AMARELA"
+
+    Returns:
+        bool: True if the text names the copy color and no other
+    """
+    named = {match.upper() for match in COPY_HEADER_PATTERN.findall(text or "")}
+    return named == {color}
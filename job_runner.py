@@ -0,0 +1,244 @@
+"""
+Background analysis jobs for PTW Analyzer
+
+Analysing a document used to happen inside the Streamlit script run: the
+sequential mode processed one page per run and then slept and reran the whole
+app, and the parallel mode blocked the script thread for the entire document.
+Closing the browser tab stopped the analysis with it.
+
+Jobs run on a process-wide pool of worker threads, outside any script run.
+The model calls themselves still go through the shared engine and its rate
+controller, so a thread per job is enough: the worker only orchestrates. Each
+job keeps its state (per-page status, results, recent messages) in memory
+behind a lock; the UI only reads cheap snapshots and reruns at its own polling
+pace. Finished jobs are forgotten after JOB_RETENTION_HOURS.
+
+A job lives as long as the server process. What outlives it is the progress
+of each document, saved page by page to the checkpoint store (see
+checkpoint): analysing the same document again resumes from there.
+"""
+
+import os
+import time
+import uuid
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# Documents analysed at the same time by the process (model calls are bounded separately by the engine)
+JOB_WORKERS = int(os.environ.get("PTW_JOB_WORKERS", "4"))
+
+# Finished jobs are dropped from memory after this long (hours)
+JOB_RETENTION_HOURS = 6
+
+# Status messages kept per job for the UI
+JOB_MAX_MESSAGES = 50
+
+# How often the UI refreshes the view of a running job (seconds)
+JOB_POLL_INTERVAL = 2.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once the job has been cancelled."""
+
+
+class AnalysisJob:
+    """State of one document analysis running in the background."""
+
+    def __init__(self, total_pages: int, inputs: Optional[Dict[str, Any]] = None,
+                 job_id: Optional[str] = None):
+        """
+        Initialize the job.
+
+        Args:
+            total_pages: Number of pages in the document
+            inputs: Objects the job works on (pages, summary, ...); kept alive
+                with the job so a session can attach to it again
+            job_id: Identifier (generated if omitted)
+        """
+        self.job_id = job_id or uuid.uuid4().hex
+        self.total_pages = total_pages
+        self.inputs = inputs or {}
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.completed = 0
+        self.results: List[List[dict]] = [[] for _ in range(total_pages)]
+        self.page_status: Dict[int, Dict[str, Any]] = {
+            page_num: {"status": "submitted", "ocr_status": "pending", "analysis_status": "pending"}
+            for page_num in range(1, total_pages + 1)
+        }
+        self.context: Dict[str, Any] = {}
+        self.messages = deque(maxlen=JOB_MAX_MESSAGES)
+        self._cancelled = threading.Event()
+        self._lock = threading.RLock()
+
+    @property
+    def done(self) -> bool:
+        """Return True once the job has finished, failed or been cancelled."""
+        return self.status in ("completed", "error", "cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        """Return True if cancel() was called."""
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the job to stop; pages not started yet are not processed."""
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled (call between units of work)."""
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Job {self.job_id} cancelled")
+
+    def update_page(self, page_num: int, **fields):
+        """
+        Update the status fields of a page.
+
+        Args:
+            page_num: Page number (1-based)
+            **fields: Status fields to set (status, ocr_status, analysis_status, ...)
+        """
+        with self._lock:
+            self.page_status[page_num].update(fields)
+
+    def set_result(self, page_num: int, result: List[dict], **fields):
+        """
+        Store the final result of a page and count it as completed.
+
+        Args:
+            page_num: Page number (1-based)
+            result: Result rows of the page (see analysis_rows)
+            **fields: Status fields to set along with it
+        """
+        with self._lock:
+            self.results[page_num - 1] = result
+            self.page_status[page_num].update(fields)
+            self.completed += 1
+
+    def set_context(self, key: str, value: Any):
+        """Store a document-level value (e.g. the permit number)."""
+        with self._lock:
+            self.context[key] = value
+
+    def message(self, level: str, text: str):
+        """
+        Record a user-facing status message.
+
+        Args:
+            level: Streamlit message level ("info", "success", "warning" or "error")
+            text: Message text
+        """
+        with self._lock:
+            self.messages.append((level, text))
+
+    def finish(self, status: str, error: Optional[str] = None):
+        """Mark the job as completed, failed or cancelled."""
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return a copy of the job state for display.
+
+        Returns:
+            dict: job_id, status, error, total_pages, completed, in_progress,
+                results, page_status, context and messages
+        """
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "error": self.error,
+                "total_pages": self.total_pages,
+                "completed": self.completed,
+                "in_progress": self.total_pages - self.completed,
+                "results": list(self.results),
+                "page_status": {page_num: dict(status) for page_num, status in self.page_status.items()},
+                "context": dict(self.context),
+                "messages": list(self.messages)
+            }
+
+
+class JobRunner:
+    """Process-wide pool of threads running analysis jobs."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        """
+        Initialize the runner.
+
+        Args:
+            max_workers: Jobs running at the same time (more are queued)
+        """
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                                               thread_name_prefix="ptw-job")
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, total_pages: int, work: Callable[..., None], *args,
+               inputs: Optional[Dict[str, Any]] = None, **kwargs) -> AnalysisJob:
+        """
+        Start a job in the background.
+
+        Args:
+            total_pages: Number of pages in the document
+            work: Function work(job, *args, **kwargs) doing the analysis and
+                reporting progress through the job
+            inputs: Objects kept alive with the job (see AnalysisJob)
+            *args, **kwargs: Extra arguments for work
+
+        Returns:
+            AnalysisJob: The queued job
+        """
+        job = AnalysisJob(total_pages, inputs)
+        with self._lock:
+            self._forget_finished()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, work, args, kwargs)
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[AnalysisJob]:
+        """Return a job by identifier, if it is still known."""
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def _run(self, job: AnalysisJob, work: Callable[..., None], args: tuple, kwargs: dict):
+        """Worker thread: run a job and record how it ended."""
+        if job.cancelled:
+            job.finish("cancelled")
+            return
+        job.status = "running"
+        try:
+            work(job, *args, **kwargs)
+            job.finish("cancelled" if job.cancelled else "completed")
+        except JobCancelled:
+            job.finish("cancelled")
+        except Exception as e:
+            print(f"Warning: Job {job.job_id} failed: {str(e)}")
+            job.finish("error", str(e))
+
+    def _forget_finished(self):
+        """Drop jobs finished more than JOB_RETENTION_HOURS ago (lock held)."""
+        cutoff = time.time() - JOB_RETENTION_HOURS * 3600
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished < cutoff:
+                del self._jobs[job_id]
+
+
+# Process-wide runner, created lazily
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Return the shared job runner."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
@@ -0,0 +1,338 @@
+"""
+Async model execution engine for PTW Analyzer
+
+This module owns every Anthropic model call made by the analyzer. Calls run as
+coroutines on a single background event loop using the AsyncAnthropic client,
+and all of them draw from the process-wide adaptive rate controller, so any
+number of Streamlit sessions can fan out page calls without spawning an OS
+thread per call. Rate-limited and overloaded calls are retried by the engine
+after the pause the controller imposes. Progress produced inside coroutines
+travels back to the Streamlit script thread through a ProgressEvents queue;
+coroutines never call st.* directly.
+"""
+
+import os
+import queue
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Callable, Optional
+
+from anthropic import AsyncAnthropic
+
+from rate_limiter import AdaptiveRateController, classify_error, estimate_request_tokens, get_rate_controller
+
+# Attempts after the first for throttled (429/529) and transient (5xx, connection) failures
+MAX_CALL_RETRIES = int(os.environ.get("PTW_MAX_RETRIES", "4"))
+
+# First backoff for transient failures; doubled on every attempt (seconds)
+TRANSIENT_RETRY_DELAY = 2.0
+
+# How often the script thread wakes up to forward queued events (seconds)
+EVENT_POLL_INTERVAL = 0.1
+
+
+class ProgressEvents:
+    """Thread-safe channel carrying progress events from coroutines to the script thread."""
+
+    def __init__(self):
+        """Initialize an empty event queue."""
+        self._queue = queue.Queue()
+
+    def message(self, level: str, text: str):
+        """
+        Queue a user-facing status message.
+
+        Args:
+            level: Streamlit message level ("info", "success", "warning" or "error")
+            text: Message text
+        """
+        self._queue.put(("message", (level, text)))
+
+    def emit(self, kind: str, payload: Any):
+        """
+        Queue an arbitrary event.
+
+        Args:
+            kind: Event type understood by the consumer (e.g. "stage")
+            payload: Event data
+        """
+        self._queue.put((kind, payload))
+
+    def drain(self, timeout: Optional[float] = None):
+        """
+        Collect queued events, waiting up to timeout for the first one.
+
+        Args:
+            timeout: Seconds to wait when the queue is empty (None = don't wait)
+
+        Returns:
+            list: (kind, payload) tuples in the order they were queued
+        """
+        events = []
+        try:
+            if timeout:
+                events.append(self._queue.get(timeout=timeout))
+            while True:
+                events.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+
+class NullEvents(ProgressEvents):
+    """Event sink that discards everything, for callers without a UI."""
+
+    def message(self, level: str, text: str):
+        pass
+
+    def emit(self, kind: str, payload: Any):
+        pass
+
+
+class UsageStats:
+    """Thread-safe running totals of token usage, including prompt cache reads and writes."""
+
+    def __init__(self):
+        """Initialize empty totals."""
+        self._lock = threading.Lock()
+        self._totals = {
+            "calls": 0,
+            "input_tokens": 0,
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+            "output_tokens": 0
+        }
+
+    def record(self, label: Optional[str], message) -> dict:
+        """
+        Add the usage of one response to the totals and log it.
+
+        Args:
+            label: Short description of the call (e.g. "OCR page 3")
+            message: Message returned by the API
+
+        Returns:
+            dict: Token breakdown of this call
+        """
+        usage = getattr(message, "usage", None)
+        call = {
+            "input_tokens": getattr(usage, "input_tokens", None) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+            "output_tokens": getattr(usage, "output_tokens", None) or 0
+        }
+
+        with self._lock:
+            self._totals["calls"] += 1
+            for field, tokens in call.items():
+                self._totals[field] += tokens
+
+        print(
+            f"Usage [{label or 'model call'}]: input={call['input_tokens']} "
+            f"cache_read={call['cache_read_tokens']} cache_write={call['cache_write_tokens']} "
+            f"output={call['output_tokens']}"
+        )
+        return call
+
+    def snapshot(self) -> dict:
+        """
+        Return the totals and the share of prompt tokens served from the cache.
+
+        Returns:
+            dict: calls, input_tokens, cache_read_tokens, cache_write_tokens,
+                output_tokens and cache_hit_rate
+        """
+        with self._lock:
+            totals = dict(self._totals)
+        prompt_tokens = totals["input_tokens"] + totals["cache_read_tokens"] + totals["cache_write_tokens"]
+        totals["cache_hit_rate"] = totals["cache_read_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        return totals
+
+
+class LLMEngine:
+    """Background asyncio loop with a shared AsyncAnthropic client and rate controller."""
+
+    def __init__(self, api_key: Optional[str] = None,
+                 controller: Optional[AdaptiveRateController] = None,
+                 max_retries: int = MAX_CALL_RETRIES):
+        """
+        Start the engine loop in a daemon thread.
+
+        Args:
+            api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY)
+            controller: Rate controller bounding calls (defaults to the shared controller)
+            max_retries: Retries for throttled and transient failures
+        """
+        self.controller = controller or get_rate_controller()
+        self.max_retries = max(0, max_retries)
+        self.usage = UsageStats()
+        # Retries are driven by the engine so every 429/529 reaches the controller
+        self.client = AsyncAnthropic(api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"), max_retries=0)
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="ptw-llm-engine", daemon=True)
+        self._thread.start()
+
+    async def _call(self, request: dict, send, label: Optional[str] = None):
+        """
+        Send a request under the rate controller, retrying throttled and transient failures.
+
+        Args:
+            request: Keyword arguments of the request (used for the token estimate)
+            send: Zero-argument coroutine function performing the API call
+            label: Short description of the call for usage reporting
+
+        Returns:
+            Message: The API response
+        """
+        estimated_tokens = estimate_request_tokens(request)
+
+        for attempt in range(self.max_retries + 1):
+            ticket = await self.controller.acquire_async(estimated_tokens)
+            try:
+                message = await send()
+            except Exception as e:
+                outcome, retry_after = classify_error(e)
+                self.controller.release(ticket, outcome, retry_after)
+                if outcome == "error" or attempt == self.max_retries:
+                    raise
+                print(f"Warning: Model call failed ({outcome}), retrying ({attempt + 1}/{self.max_retries}): {str(e)}")
+                if outcome == "transient":
+                    await asyncio.sleep(retry_after or TRANSIENT_RETRY_DELAY * (2 ** attempt))
+                # Throttled calls wait in acquire_async() until the controller's pause ends
+                continue
+
+            ticket.record_usage(message)
+            self.controller.release(ticket, "success")
+            self.usage.record(label, message)
+            return message
+
+    async def create_message(self, beta: bool = False, label: Optional[str] = None, **kwargs):
+        """
+        Send a non-streaming Messages API request under the rate controller.
+
+        Args:
+            beta: Use the beta Messages endpoint (e.g. for the Files API)
+            label: Short description of the call for usage reporting
+            **kwargs: Arguments for messages.create()
+
+        Returns:
+            Message: The API response
+        """
+        messages_api = self.client.beta.messages if beta else self.client.messages
+        return await self._call(kwargs, lambda: messages_api.create(**kwargs), label)
+
+    async def stream_message(self, label: Optional[str] = None, **kwargs):
+        """
+        Send a streaming Messages API request under the rate controller.
+
+        Streaming keeps long generations (large max_tokens) within the API's
+        request time limits; the final assembled message is returned.
+
+        Args:
+            label: Short description of the call for usage reporting
+            **kwargs: Arguments for messages.stream()
+
+        Returns:
+            Message: The final message once the stream completes
+        """
+        async def send():
+            async with self.client.messages.stream(**kwargs) as stream:
+                return await stream.get_final_message()
+
+        return await self._call(kwargs, send, label)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the engine loop from any thread.
+
+        Args:
+            coro: Coroutine to run
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the coroutine result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, events: Optional[ProgressEvents] = None,
+            on_event: Optional[Callable[[str, Any], None]] = None):
+        """
+        Run a coroutine to completion, forwarding its events on the calling thread.
+
+        This is how the Streamlit script thread waits for engine work: the
+        coroutine executes on the engine loop while queued events are handed
+        to on_event here, where st.* calls are safe.
+
+        Args:
+            coro: Coroutine to run
+            events: Queue the coroutine reports progress to (optional)
+            on_event: Callback on_event(kind, payload) for each queued event
+
+        Returns:
+            The coroutine result (exceptions are re-raised)
+        """
+        future = self.submit(coro)
+
+        while True:
+            finished = future.done()
+            if events is not None:
+                for kind, payload in events.drain(None if finished else EVENT_POLL_INTERVAL):
+                    if on_event:
+                        on_event(kind, payload)
+            else:
+                concurrent.futures.wait([future], timeout=EVENT_POLL_INTERVAL)
+            if finished:
+                return future.result()
+
+    def create_message_sync(self, beta: bool = False, label: Optional[str] = None, **kwargs):
+        """Blocking wrapper around create_message() for script-thread callers."""
+        return self.submit(self.create_message(beta=beta, label=label, **kwargs)).result()
+
+
+def cacheable_text_block(text: str) -> dict:
+    """
+    Build a text content block marked as a prompt cache breakpoint.
+
+    Everything up to and including this block is cached by the API, so it
+    should close the static part of a request (system prompt, instructions,
+    per-document context) and precede the per-page content.
+
+    Args:
+        text: Block text
+
+    Returns:
+        dict: Text block with an ephemeral cache_control marker
+    """
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def message_tool_input(message, name: str) -> Optional[Any]:
+    """
+    Return the input of the first call of a tool in a Messages API response.
+
+    Args:
+        message: Message returned by the API
+        name: Tool name
+
+    Returns:
+        The tool input (parsed JSON), or None if the tool was not called
+    """
+    for block in message.content:
+        if getattr(block, "type", None) == "tool_use" and block.name == name:
+            return block.input
+    return None
+
+
+# Process-wide engine, created lazily
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> LLMEngine:
+    """Return the shared engine, starting it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LLMEngine()
+        return _engine
@@ -0,0 +1,245 @@
+"""
+Parsed OCR page model for PTW Analyzer
+
+The OCR prompts transcribe every page with a fixed markup: "[Checked: Sim]",
+"[Signed]", "[Empty field: Nome]", "[Stamp: ...]", "[DOCUMENT TYPE: GUIA
+VERDE]" and so on. The section verifiers, the guide color detection and the
+permit number extraction used to lowercase and re-split the whole OCR text and
+scan it with their own substring checks.
+
+parse_ocr_page() reads the text once, line by line, and builds an OCRPage: the
+form sections found (by their "Seção N" heading or title), the markup tags of
+each section with the line they sit on, the document type header, the guide
+color and the permit number. Pages are memoized by their text, so the
+verifiers of one page all query the same model.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# First line of the transcriptions built from a PDF's text layer (see text_layer)
+TEXT_LAYER_MARKER = "[TEXT LAYER: transcribed from the PDF's embedded text]"
+
+# Parsed pages kept in memory (one per distinct OCR text)
+OCR_PAGE_CACHE_SIZE = 256
+
+# Section titles recognized as headings ("14 - Operações Simultâneas"), normalized
+SECTION_TITLES = {
+    "14": "operacoes simultaneas",
+    "15": "co-emissor",
+    "18": "ciencia da pt",
+    "20": "encerramento"
+}
+
+# Tag labels written differently by the OCR model, mapped to one kind
+TAG_ALIASES = {
+    "assinado": "signed",
+    "filled": "filled field",
+    "empty signature": "empty"
+}
+
+# Guide color wording, in detection order (the first match wins)
+GUIDE_COLOR_PATTERNS = {
+    "BRANCA": [r'guia\s+branca', r'via\s+branca', r'copia\s+branca', r'branca'],
+    "VERDE": [r'guia\s+verde', r'via\s+verde', r'copia\s+verde', r'verde'],
+    "AMARELA": [r'guia\s+amarela', r'via\s+amarela', r'copia\s+amarela', r'amarela']
+}
+
+# Permit number patterns ("PT-12345", "PTW 12345", "Permissão ... 123-45678")
+PERMIT_NUMBER_PATTERNS = [
+    re.compile(r'PT[W]?[-\s]?(\d+[-\d]*)', re.IGNORECASE),
+    re.compile(r'Permit.*?(\d{3}[-\s]?\d{5})', re.IGNORECASE),
+    re.compile(r'Permissão.*?(\d{3}[-\s]?\d{5})', re.IGNORECASE)
+]
+
+# Document type header naming the copy ("GUIA AMARELA - FORM 123"), on the uppercased tag value
+DOCUMENT_COLOR_PATTERN = re.compile(r"GUIA (BRANCA|VERDE|AMARELA)")
+
+TAG_PATTERN = re.compile(r"\[([^\[\]\n]+)\]")
+SECTION_HEADING_PATTERN = re.compile(r"\b(?:secao|section)\s*(\d{1,2}(?:\.\d)?)(?![.\d])")
+TITLE_HEADING_PATTERN = re.compile(
+    r"\b(" + "|".join(SECTION_TITLES) + r")\s*-\s*(" + "|".join(re.escape(title) for title in SECTION_TITLES.values()) + r")"
+)
+
+
+def normalize_line(text: str) -> str:
+    """
+    Lowercase a line and strip its accents.
+
+    Args:
+        text: Line of OCR text
+
+    Returns:
+        str: Normalized line
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class OCRTag:
+    """One markup tag of the OCR text, such as [Checked: Sim] or [Signed]."""
+
+    def __init__(self, kind: str, value: str, line: str):
+        """
+        Initialize the tag.
+
+        Args:
+            kind: Normalized label ("checked", "signed", "filled field", ...)
+            value: Normalized text after the colon ("" if none)
+            line: Normalized line the tag sits on
+        """
+        self.kind = kind
+        self.value = value
+        self.line = line
+
+
+class OCRSection:
+    """A form section of the page and the tags transcribed under its heading."""
+
+    def __init__(self, number: str):
+        """
+        Initialize an empty section.
+
+        Args:
+            number: Section number ("14", "3.1", ...)
+        """
+        self.number = number
+        self.lines: List[str] = []
+        self.tags: List[OCRTag] = []
+
+    def find(self, kind: str, values: Optional[tuple] = None) -> List[OCRTag]:
+        """
+        Return the section's tags of a kind.
+
+        Args:
+            kind: Tag kind
+            values: Accepted tag values (any value if None)
+
+        Returns:
+            list: Matching tags, in page order
+        """
+        return [tag for tag in self.tags if tag.kind == kind and (values is None or tag.value in values)]
+
+    def count(self, kind: str, values: Optional[tuple] = None) -> int:
+        """Return the number of the section's tags of a kind (see find)."""
+        return len(self.find(kind, values))
+
+
+class OCRPage:
+    """Parsed OCR text of one page."""
+
+    def __init__(self, text: str):
+        """
+        Initialize an empty page model (see parse_ocr_page).
+
+        Args:
+            text: OCR text of the page
+        """
+        self.text = text
+        # Built from the PDF's text layer rather than transcribed by vision OCR
+        self.from_text_layer = text.lstrip().startswith(TEXT_LAYER_MARKER)
+        # Normalized lines (lowercase, without accents)
+        self.lines: List[str] = []
+        # Tags before the first section heading are kept in the preamble
+        self.preamble = OCRSection("")
+        self.sections: Dict[str, OCRSection] = {}
+        self.tags: List[OCRTag] = []
+        self.document_type: Optional[str] = None
+        self.guide_color = "UNKNOWN"
+        self.permit_number: Optional[str] = None
+
+    def section(self, number: str) -> Optional[OCRSection]:
+        """Return a section of the page, None if its heading was not found."""
+        return self.sections.get(number)
+
+
+def tokenize_line(line: str) -> List[OCRTag]:
+    """
+    Read the markup tags of a normalized line.
+
+    Args:
+        line: Normalized line of OCR text
+
+    Returns:
+        list: Tags of the line, in order
+    """
+    tags = []
+    for match in TAG_PATTERN.finditer(line):
+        label, _, value = match.group(1).partition(":")
+        kind = label.strip()
+        tags.append(OCRTag(TAG_ALIASES.get(kind, kind), value.strip(), line))
+    return tags
+
+
+@lru_cache(maxsize=OCR_PAGE_CACHE_SIZE)
+def parse_ocr_page(ocr_text: str) -> OCRPage:
+    """
+    Parse the OCR text of a page in a single pass.
+
+    The returned model is shared by every caller with the same text and must
+    not be modified.
+
+    Args:
+        ocr_text: OCR text of the page
+
+    Returns:
+        OCRPage: Sections, tags, document type, guide color and permit number
+    """
+    page = OCRPage(ocr_text or "")
+    current = page.preamble
+    # First match of each permit number pattern (earlier patterns take precedence)
+    permit_matches: Dict[int, str] = {}
+    for raw_line in page.text.split("\n"):
+        line = normalize_line(raw_line)
+        page.lines.append(line)
+        heading = SECTION_HEADING_PATTERN.search(line) or TITLE_HEADING_PATTERN.search(line)
+        if heading:
+            current = page.sections.setdefault(heading.group(1), OCRSection(heading.group(1)))
+        current.lines.append(line)
+        for tag in tokenize_line(line):
+            current.tags.append(tag)
+            page.tags.append(tag)
+            # The first document type naming a guide color wins over earlier ones (e.g. UNKNOWN)
+            if tag.kind == "document type" and not (page.document_type and DOCUMENT_COLOR_PATTERN.match(page.document_type)):
+                page.document_type = tag.value.upper()
+        for index, pattern in enumerate(PERMIT_NUMBER_PATTERNS):
+            if index not in permit_matches:
+                match = pattern.search(raw_line)
+                if match:
+                    permit_matches[index] = match.group(1)
+
+    if permit_matches:
+        page.permit_number = permit_matches[min(permit_matches)]
+
+    document_color = DOCUMENT_COLOR_PATTERN.match(page.document_type or "")
+    if document_color:
+        page.guide_color = document_color.group(1).upper()
+    else:
+        normalized_text = "\n".join(page.lines)
+        page.guide_color = next(
+            (
+                color for color, patterns in GUIDE_COLOR_PATTERNS.items()
+                if any(re.search(pattern, normalized_text) for pattern in patterns)
+            ),
+            "UNKNOWN"
+        )
+    return page
+
+
+def find_permit_number(text: str) -> Optional[str]:
+    """
+    Find a permit number in free text (e.g. the document summary).
+
+    Args:
+        text: Text to search
+
+    Returns:
+        str or None: The first permit number found
+    """
+    for pattern in PERMIT_NUMBER_PATTERNS:
+        match = pattern.search(text or "")
+        if match:
+            return match.group(1)
+    return None
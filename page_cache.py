@@ -0,0 +1,308 @@
+"""
+Persistent page cache for PTW Analyzer
+
+This module provides a content-addressed cache for expensive per-page model
+outputs (OCR text, analysis tables). Entries are stored in a single SQLite
+database shared by every Streamlit session, thread and worker process, and are
+keyed by a hash of everything that influenced the result (page image bytes,
+prompt version, model id). Re-uploading the same permit therefore skips the
+API calls for every page that was already processed.
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+# Cache location and size limits (overridable through environment variables)
+CACHE_DIR = Path(os.environ.get("PTW_CACHE_DIR", "./.cache"))
+CACHE_DB_NAME = "ptw_cache.sqlite3"
+OCR_CACHE_MAX_MB = float(os.environ.get("PTW_OCR_CACHE_MAX_MB", "256"))
+ANALYSIS_CACHE_MAX_MB = float(os.environ.get("PTW_ANALYSIS_CACHE_MAX_MB", "128"))
+
+
+def hash_bytes(*parts) -> str:
+    """
+    Hash an ordered sequence of values into a hexadecimal cache key.
+
+    Args:
+        *parts: bytes, str or any value convertible with str()
+
+    Returns:
+        str: SHA-256 hex digest of all parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            data = bytes(part)
+        else:
+            data = str(part).encode("utf-8")
+        # Length prefix keeps ("ab", "c") and ("a", "bc") from colliding
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize model-produced text so cosmetic differences don't change cache keys.
+
+    Line endings are unified, trailing whitespace is dropped and runs of blank
+    lines are collapsed.
+
+    Args:
+        text: Text to normalize (e.g. OCR output)
+
+    Returns:
+        str: Normalized text
+    """
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    normalized = []
+    for line in lines:
+        if not line and normalized and not normalized[-1]:
+            continue
+        normalized.append(line)
+    return "\n".join(normalized).strip()
+
+
+def hash_page_image(image) -> str:
+    """
+    Compute a content hash for a rendered page image.
+
+    The hash covers the raw pixel data plus mode and dimensions, so the same
+    page rendered at the same resolution always maps to the same key.
+
+    Args:
+        image: PIL.Image object
+
+    Returns:
+        str: SHA-256 hex digest of the image content
+    """
+    return hash_bytes(image.mode, image.size, image.tobytes())
+
+
+class PageCache:
+    """SQLite-backed, size-bounded LRU cache for per-page text results."""
+
+    def __init__(self, namespace: str, max_mb: float, db_path: Optional[Path] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            namespace: Logical partition inside the database (e.g. "ocr")
+            max_mb: Maximum stored (compressed) size for this namespace, in MB
+            db_path: Optional database file path (defaults to CACHE_DIR/CACHE_DB_NAME)
+        """
+        self.namespace = namespace
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.db_path = Path(db_path) if db_path else CACHE_DIR / CACHE_DB_NAME
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # One connection per thread; SQLite handles cross-process locking
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        """Create the cache tables if they don't exist."""
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace   TEXT NOT NULL,
+                key         TEXT NOT NULL,
+                value       BLOB NOT NULL,
+                size        INTEGER NOT NULL,
+                created     REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries (namespace, last_access)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                namespace TEXT PRIMARY KEY,
+                hits      INTEGER NOT NULL DEFAULT 0,
+                misses    INTEGER NOT NULL DEFAULT 0,
+                evictions INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO stats (namespace) VALUES (?)", (self.namespace,))
+
+    def make_key(self, *parts) -> str:
+        """
+        Build a cache key from the inputs that determine a result.
+
+        Args:
+            *parts: Values such as content hash, prompt version and model id
+
+        Returns:
+            str: Hexadecimal cache key
+        """
+        return hash_bytes(self.namespace, *parts)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached value and refresh its LRU position.
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            str or None: The cached text if present, None otherwise
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+
+            if row is None:
+                conn.execute("UPDATE stats SET misses = misses + 1 WHERE namespace = ?", (self.namespace,))
+                return None
+
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                (time.time(), self.namespace, key)
+            )
+            conn.execute("UPDATE stats SET hits = hits + 1 WHERE namespace = ?", (self.namespace,))
+            return zlib.decompress(row[0]).decode("utf-8")
+        except Exception as e:
+            # A broken cache must never break the analysis
+            print(f"Warning: Could not read {self.namespace} cache: {str(e)}")
+            return None
+
+    def put(self, key: str, value: str):
+        """
+        Store a value and evict least recently used entries if over budget.
+
+        Args:
+            key: Cache key from make_key()
+            value: Text to store
+        """
+        try:
+            blob = zlib.compress(value.encode("utf-8"), 6)
+            now = time.time()
+            conn = self._connect()
+            # Insert and evict in one write transaction so concurrent writers
+            # (threads or processes) never see a half-evicted namespace
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, size, created, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, blob, len(blob), now, now)
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"Warning: Could not write {self.namespace} cache: {str(e)}")
+
+    def _evict(self, conn):
+        """Delete least recently used entries until the namespace fits its budget."""
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?",
+            (self.namespace,)
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries WHERE namespace = ? ORDER BY last_access ASC",
+            (self.namespace,)
+        ):
+            victims.append((self.namespace, key))
+            freed += size
+            if freed >= excess:
+                break
+
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+        conn.execute(
+            "UPDATE stats SET evictions = evictions + ? WHERE namespace = ?",
+            (len(victims), self.namespace)
+        )
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hit/miss counters and current usage for this namespace.
+
+        Returns:
+            dict: entries, size_mb, max_mb, hits, misses, evictions and hit_rate
+        """
+        try:
+            conn = self._connect()
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?",
+                (self.namespace,)
+            ).fetchone()
+            hits, misses, evictions = conn.execute(
+                "SELECT hits, misses, evictions FROM stats WHERE namespace = ?",
+                (self.namespace,)
+            ).fetchone()
+        except Exception as e:
+            print(f"Warning: Could not read {self.namespace} cache stats: {str(e)}")
+            entries = size = hits = misses = evictions = 0
+
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "size_mb": size / (1024 * 1024),
+            "max_mb": self.max_bytes / (1024 * 1024),
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        """Remove every entry in this namespace and reset its counters."""
+        conn = self._connect()
+        conn.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+        conn.execute(
+            "UPDATE stats SET hits = 0, misses = 0, evictions = 0 WHERE namespace = ?",
+            (self.namespace,)
+        )
+
+
+# Process-wide cache instances, created lazily
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_cache(namespace, max_mb):
+    """Return the shared PageCache for a namespace, creating it on first use."""
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = PageCache(namespace, max_mb)
+        return _caches[namespace]
+
+
+def get_ocr_cache() -> PageCache:
+    """Return the shared OCR text cache."""
+    return _get_cache("ocr", OCR_CACHE_MAX_MB)
+
+
+def get_analysis_cache() -> PageCache:
+    """Return the shared page analysis cache."""
+    return _get_cache("analysis", ANALYSIS_CACHE_MAX_MB)
+
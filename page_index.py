@@ -0,0 +1,213 @@
+"""
+Perceptual page index for PTW Analyzer
+
+Permit packs often contain the same page more than once (rescans, duplicated
+sheets). This module gives every rendered page of an upload a perceptual
+fingerprint and finds near-identical twins so their OCR and analysis results
+can be reused instead of calling the API again.
+
+A fingerprint combines a 64-bit pHash (low-frequency DCT of a 32x32 grayscale
+thumbnail) and a 64-bit dHash (horizontal gradients of a 9x8 thumbnail) with a
+small grayscale thumbnail. The hashes find candidates; the thumbnail confirms a
+match tile by tile, so two pages of the same blank form that differ only by a
+signature or a handful of marks are not treated as twins. Pages classified as
+different guide copies (white, green, yellow) are never twins, since only the
+white copy is audited.
+
+PageIndex covers the pages of one upload only. Across uploads, a pack is often
+re-sent after one page was fixed (a signature added, a box ticked), a change
+the thumbnail comparison cannot be trusted to see; those pages only reuse OCR
+text of byte-identical pixels, through the content-addressed OCR cache.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from guide_color import classify_guide_color
+
+# Maximum Hamming distance (bits out of 64) on both hashes for a candidate twin
+DEDUP_MAX_DISTANCE = int(os.environ.get("PTW_DEDUP_MAX_DISTANCE", "3"))
+
+# Maximum mean absolute gray-level difference of any thumbnail tile for a confirmed twin
+DEDUP_MAX_TILE_DIFF = float(os.environ.get("PTW_DEDUP_MAX_TILE_DIFF", "6"))
+
+# Long edge of the verification thumbnail and side of its comparison tiles (pixels)
+THUMBNAIL_SIZE = 128
+TILE_SIZE = 8
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """Return the orthonormal DCT-II matrix of the given size."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    """Pack a flat boolean array into an integer (first element = most significant bit)."""
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Return the number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class PageFingerprint:
+    """Perceptual fingerprint of a rendered page."""
+
+    __slots__ = ("phash", "dhash", "thumbnail", "guide_color")
+
+    def __init__(self, phash: int, dhash: int, thumbnail: np.ndarray, guide_color: str):
+        """
+        Initialize the fingerprint.
+
+        Args:
+            phash: 64-bit DCT hash
+            dhash: 64-bit gradient hash
+            thumbnail: uint8 grayscale thumbnail used to confirm matches
+            guide_color: Visual guide copy class ("BRANCA", "VERDE", "AMARELA" or "UNKNOWN")
+        """
+        self.phash = phash
+        self.dhash = dhash
+        self.thumbnail = thumbnail
+        self.guide_color = guide_color
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "PageFingerprint":
+        """
+        Compute the fingerprint of a page image.
+
+        Args:
+            image: PIL.Image object of the rendered page
+
+        Returns:
+            PageFingerprint: The page fingerprint
+        """
+        gray = image.convert("L")
+
+        # pHash: sign of the 8x8 lowest DCT frequencies against their median (DC excluded)
+        pixels = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+        low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8].flatten()
+        phash = _bits_to_int(low > np.median(low[1:]))
+
+        # dHash: is each pixel brighter than its right neighbour
+        pixels = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+        dhash = _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+        thumbnail = gray.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+        guide_color, _ = classify_guide_color(image)
+        return cls(phash, dhash, np.asarray(thumbnail, dtype=np.uint8), guide_color)
+
+    def matches(self, other: "PageFingerprint",
+                max_distance: int = DEDUP_MAX_DISTANCE,
+                max_tile_diff: float = DEDUP_MAX_TILE_DIFF) -> bool:
+        """
+        Check whether another fingerprint belongs to a near-identical page.
+
+        Args:
+            other: Fingerprint to compare with
+            max_distance: Maximum Hamming distance on both hashes
+            max_tile_diff: Maximum mean absolute difference of any thumbnail tile
+
+        Returns:
+            bool: True if the pages are twins
+        """
+        if self.guide_color != other.guide_color:
+            return False
+        if hamming_distance(self.phash, other.phash) > max_distance:
+            return False
+        if hamming_distance(self.dhash, other.dhash) > max_distance:
+            return False
+        if self.thumbnail.shape != other.thumbnail.shape:
+            return False
+
+        # Local changes (a signature, a tick) must not be averaged away over the page
+        diff = np.abs(self.thumbnail.astype(np.int16) - other.thumbnail.astype(np.int16))
+        rows = diff.shape[0] // TILE_SIZE * TILE_SIZE
+        cols = diff.shape[1] // TILE_SIZE * TILE_SIZE
+        if rows == 0 or cols == 0:
+            return float(diff.mean()) <= max_tile_diff
+        tiles = diff[:rows, :cols].reshape(rows // TILE_SIZE, TILE_SIZE, cols // TILE_SIZE, TILE_SIZE)
+        return float(tiles.mean(axis=(1, 3)).max()) <= max_tile_diff
+
+
+class PageIndex:
+    """Fingerprints of the pages of one upload and the twin of each duplicated page."""
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._fingerprints: Dict[int, PageFingerprint] = {}
+        self._twins: Dict[int, int] = {}
+
+    def add(self, page_num: int, image: Image.Image) -> Optional[int]:
+        """
+        Fingerprint a page and look for an earlier twin.
+
+        Args:
+            page_num: Page number (1-based)
+            image: PIL.Image object of the page (its RenderedPage thumbnail is
+                enough, and all pages of an index should use the same source)
+
+        Returns:
+            int or None: Page number of the earliest near-identical page, if any
+        """
+        try:
+            fingerprint = PageFingerprint.from_image(image)
+        except Exception as e:
+            print(f"Warning: Could not fingerprint page {page_num}: {str(e)}")
+            return None
+
+        twin = None
+        for other_num, other in self._fingerprints.items():
+            # Only original pages are candidates, so every twin is a page that is actually processed
+            if other_num not in self._twins and fingerprint.matches(other):
+                twin = other_num
+                break
+
+        self._fingerprints[page_num] = fingerprint
+        if twin is not None:
+            self._twins[page_num] = twin
+        return twin
+
+    def twin_of(self, page_num: int) -> Optional[int]:
+        """Return the page whose results the given page reuses, if any."""
+        return self._twins.get(page_num)
+
+    def twins(self) -> Dict[int, int]:
+        """Return a mapping of derived page -> twin page."""
+        return dict(self._twins)
+
+    def derived_from(self, page_num: int) -> List[int]:
+        """Return the pages that reuse the results of the given page."""
+        return [derived for derived, twin in self._twins.items() if twin == page_num]
+
+
+def build_page_index(images: List[Image.Image]) -> PageIndex:
+    """
+    Build the page index for an ordered list of page images.
+
+    Args:
+        images: PIL.Image objects in page order
+
+    Returns:
+        PageIndex: Index with the twin of every duplicated page
+    """
+    index = PageIndex()
+    for page_num, image in enumerate(images, 1):
+        index.add(page_num, image)
+    return index
+
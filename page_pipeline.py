@@ -0,0 +1,134 @@
+"""
+Page pipeline for PTW Analyzer
+
+This module schedules the two per-page stages of a permit analysis (OCR, then
+analysis) as a dependency-aware pipeline: each page's analysis starts the
+moment its own OCR text is available instead of waiting for every OCR call to
+finish. Both stages run as coroutines on the shared model engine loop with
+separate per-stage limits, while the process-wide page scheduler decides which
+document's page runs next across all sessions (see page_scheduler). End-to-end
+latency therefore approaches max(OCR) + max(analysis) rather than the sum of
+two barriers.
+"""
+
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from llm_engine import LLMEngine, ProgressEvents, get_engine
+from page_scheduler import PRIORITY_INTERACTIVE, PageScheduler, get_page_scheduler
+
+# Default concurrent calls per stage for one document (overridable through environment variables)
+PIPELINE_OCR_WORKERS = int(os.environ.get("PTW_OCR_WORKERS", "8"))
+PIPELINE_ANALYSIS_WORKERS = int(os.environ.get("PTW_ANALYSIS_WORKERS", "8"))
+
+
+class PagePipeline:
+    """Runs OCR and analysis for a set of pages with per-stage concurrency limits."""
+
+    def __init__(self,
+                 ocr_fn: Callable[[int, Any, ProgressEvents], Awaitable[str]],
+                 analyze_fn: Callable[[int, str, ProgressEvents], Awaitable[Any]],
+                 ocr_workers: int = PIPELINE_OCR_WORKERS,
+                 analysis_workers: int = PIPELINE_ANALYSIS_WORKERS,
+                 engine: Optional[LLMEngine] = None,
+                 owner: Optional[str] = None,
+                 priority: str = PRIORITY_INTERACTIVE,
+                 scheduler: Optional[PageScheduler] = None,
+                 analysis_gate: Optional[int] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            ocr_fn: Coroutine function ocr_fn(page_num, page_image, events) returning the OCR text
+            analyze_fn: Coroutine function analyze_fn(page_num, ocr_text, events) returning the page result
+            ocr_workers: Maximum concurrent OCR calls for this run
+            analysis_workers: Maximum concurrent analysis calls for this run
+            engine: Engine whose loop runs the stages (defaults to the shared engine)
+            owner: User (or session) the document belongs to, for fair sharing
+            priority: Scheduling class of the pages (see page_scheduler)
+            scheduler: Scheduler admitting the page tasks (defaults to the shared scheduler)
+            analysis_gate: Page whose OCR must finish (or fail) before any page is
+                analysed, e.g. the page carrying document-level data such as the
+                permit number; pages waiting for it hold no call slot
+        """
+        self.ocr_fn = ocr_fn
+        self.analyze_fn = analyze_fn
+        self.ocr_workers = max(1, ocr_workers)
+        self.analysis_workers = max(1, analysis_workers)
+        self.engine = engine or get_engine()
+        self.owner = owner
+        self.priority = priority
+        self.scheduler = scheduler or get_page_scheduler()
+        self.analysis_gate = analysis_gate
+
+    def run(self,
+            pages: List[Tuple[int, Any]],
+            on_event: Optional[Callable[[int, str, str, Any], None]] = None,
+            on_message: Optional[Callable[[str, Any], None]] = None) -> Dict[int, Any]:
+        """
+        Process all pages and block until every page has a result.
+
+        The stages run on the engine loop; events are delivered on the calling
+        thread, so the callbacks may safely update Streamlit widgets and
+        session state.
+
+        Args:
+            pages: List of (page_num, page_image) tuples
+            on_event: Optional callback on_event(page_num, stage, status, payload) where
+                stage is "ocr" or "analysis" and status is "completed" or "error".
+                The payload is the OCR text, the page result or the exception.
+                A page whose OCR fails gets no analysis event.
+            on_message: Optional callback on_message(kind, payload) for status
+                messages reported by the stages through their events argument
+
+        Returns:
+            dict: page_num -> result returned by analyze_fn (or the exception raised by either stage)
+        """
+        events = ProgressEvents()
+
+        def dispatch(kind, payload):
+            if kind == "stage":
+                if on_event:
+                    on_event(*payload)
+            elif on_message:
+                on_message(kind, payload)
+
+        return self.engine.run(self._run_async(pages, events), events, dispatch)
+
+    async def _run_async(self, pages: List[Tuple[int, Any]], events: ProgressEvents) -> Dict[int, Any]:
+        """Run every page through both stages on the engine loop."""
+        ocr_slots = asyncio.Semaphore(self.ocr_workers)
+        analysis_slots = asyncio.Semaphore(self.analysis_workers)
+        document = self.scheduler.open_document(self.owner, self.priority)
+        gate = asyncio.Event()
+        if self.analysis_gate not in {page_num for page_num, _ in pages}:
+            gate.set()
+
+        async def process_page(page_num, page_image):
+            try:
+                async with ocr_slots, self.scheduler.slot(document):
+                    ocr_text = await self.ocr_fn(page_num, page_image, events)
+                events.emit("stage", (page_num, "ocr", "completed", ocr_text))
+            except Exception as e:
+                # Without its text the page cannot be analysed; the caller records the failure
+                events.emit("stage", (page_num, "ocr", "error", e))
+                return page_num, e
+            finally:
+                if page_num == self.analysis_gate:
+                    gate.set()
+
+            await gate.wait()
+
+            try:
+                async with analysis_slots, self.scheduler.slot(document):
+                    result = await self.analyze_fn(page_num, ocr_text, events)
+                events.emit("stage", (page_num, "analysis", "completed", result))
+            except Exception as e:
+                result = e
+                events.emit("stage", (page_num, "analysis", "error", e))
+
+            return page_num, result
+
+        results = await asyncio.gather(*(process_page(page_num, page_image) for page_num, page_image in pages))
+        return dict(results)
@@ -0,0 +1,769 @@
+"""
+Streaming page rasterizer for PTW Analyzer
+
+Rendering a whole permit pack up front and keeping every page as a decoded
+RGB image costs tens of megabytes per page at 250-300 DPI, for the life of the
+session. This module renders pages straight from the PDF bytes and keeps each
+page only as its encoded PNG plus a small thumbnail. Consumers decode a page when they need its pixels and drop the
+image afterwards, so peak memory no longer grows with the page count.
+
+PNG is lossless, so a decoded page has exactly the pixels that were rendered
+and content hashes of the page (e.g. the OCR cache key) are unchanged.
+
+Every page is rendered once, at a resolution derived from a pixel budget, and
+every image that has to fit a size limit (API payloads, OCR images) goes
+through encode_image(), which finds the encoding with a bounded search over
+JPEG quality and scale instead of re-encoding in open-ended loops.
+
+Rendering, enhancement and OCR standardization are CPU-bound, so they run in
+a shared process pool: each worker opens its own copy of the document from a
+temporary file, renders a range of pages and returns the encoded pages, which
+are handed back in page order.
+"""
+
+import io
+import os
+import math
+import base64
+import asyncio
+import tempfile
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from typing import FrozenSet, Iterator, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageEnhance, ImageFilter, features
+
+from page_cache import hash_page_image
+from text_layer import extract_text_layer, shared_image_xrefs
+
+# Most pixels a page is rendered with; larger pages get a lower resolution (~300 DPI on A4)
+RENDER_MAX_PIXELS = 9_000_000
+
+# Largest raw image per API image block, so its base64 form stays under the 5 MB limit
+API_MAX_IMAGE_MB = 3.75
+
+# JPEG quality range and granularity searched by encode_image()
+JPEG_MAX_QUALITY = 90
+JPEG_MIN_QUALITY = 40
+JPEG_QUALITY_STEP = 5
+
+# Downscaling rounds encode_image() may take, and the smallest long edge it accepts
+MAX_SCALE_STEPS = 3
+MIN_IMAGE_DIMENSION = 500
+
+# Long edge of the thumbnail kept with every page (pixels)
+THUMBNAIL_SIZE = 256
+
+# Display renditions created once per page, by long edge (pixels); full resolution is only sent on zoom
+RENDITION_SIZES = {"thumbnail": 320, "preview": 1280}
+RENDITION_QUALITY = 80
+RENDITION_FORMAT, RENDITION_MEDIA_TYPE = ("WEBP", "image/webp") if features.check("webp") else ("JPEG", "image/jpeg")
+
+# Worker processes for rendering and standardization (1 renders in-process)
+RASTER_WORKERS = int(os.environ.get("PTW_RASTER_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Page ranges handed to each worker per document, so progress keeps moving
+RANGES_PER_WORKER = 4
+
+# Resolution and size limit of the images sent to the OCR model
+OCR_TARGET_DPI = 250
+OCR_MAX_DIMENSION = 2500
+OCR_MAX_MB = 4.5
+
+
+def enhance_page_image(image: Image.Image, sharpness: float = 1.2, contrast: float = 1.1) -> Image.Image:
+    """
+    Apply the sharpening and contrast boost used for scanned documents.
+
+    Args:
+        image: PIL.Image object of the rendered page
+        sharpness: Sharpness enhancement factor
+        contrast: Contrast enhancement factor
+
+    Returns:
+        PIL.Image: The enhanced image
+    """
+    image = ImageEnhance.Sharpness(image).enhance(sharpness)
+    return ImageEnhance.Contrast(image).enhance(contrast)
+
+
+class RenderedPage:
+    """
+    A rendered page as it travels through the pipeline.
+
+    The page is carried as its encoded bytes plus everything the stages need
+    without decoding them again: dimensions, a content hash of the pixels (the
+    OCR cache key), a thumbnail (guide colour and duplicate detection) and a
+    base64 form computed on first use. Digitally generated pages also carry
+    their embedded text and crops of the areas without text (see text_layer).
+
+    Small display renditions (RENDITION_SIZES) are encoded at the same time,
+    so the UI never has to send the full page to the browser.
+
+    A page kept for a session can be spilled to a page store (see page_store),
+    after which its bytes are read back from the store on use.
+    """
+
+    __slots__ = ("page_num", "_data", "media_type", "width", "height", "dpi",
+                 "page_hash", "thumbnail", "text_layer", "text_regions", "_base64",
+                 "_store", "_key", "_renditions")
+
+    def __init__(self, page_num: int, data: bytes, media_type: str, width: int, height: int,
+                 dpi: Optional[int], page_hash: str, thumbnail: Image.Image,
+                 renditions: Optional[dict] = None):
+        """
+        Initialize the page.
+
+        Args:
+            page_num: Page number (1-based)
+            data: Encoded page (PNG for rendered pages)
+            media_type: MIME type of data
+            width: Width of the page image in pixels
+            height: Height of the page image in pixels
+            dpi: Resolution the page was rendered at (None for photos)
+            page_hash: Content hash of the decoded pixels (see hash_page_image)
+            thumbnail: RGB thumbnail with a long edge of THUMBNAIL_SIZE
+            renditions: Encoded display renditions by name (see encode_renditions)
+
+        The text_layer (OCR-equivalent text, None for pages that need vision
+        OCR) and text_regions (EncodedImage crops still to transcribe
+        visually) attributes are set by render_page().
+        """
+        self.page_num = page_num
+        self._data = data
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.page_hash = page_hash
+        self.thumbnail = thumbnail
+        self.text_layer = None
+        self.text_regions = ()
+        self._base64 = None
+        self._store = None
+        self._key = None
+        self._renditions = renditions or {}
+
+    @classmethod
+    def from_image(cls, image: Image.Image, page_num: int, dpi: Optional[int] = None,
+                   data: Optional[bytes] = None) -> "RenderedPage":
+        """
+        Build a page from a decoded image.
+
+        Args:
+            image: PIL.Image object of the page
+            page_num: Page number (1-based)
+            dpi: Resolution the image was rendered at, if known
+            data: The image already encoded as PNG, if available
+
+        Returns:
+            RenderedPage: The encoded page
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if data is None:
+            data = encode_png(image)
+        thumbnail = image.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        return cls(page_num, data, "image/png", image.width, image.height, dpi,
+                   hash_page_image(image), thumbnail, encode_renditions(image))
+
+    @property
+    def data(self) -> bytes:
+        """Return the encoded bytes of the page."""
+        if self._store is not None:
+            return self._store.get(self._key)
+        return self._data
+
+    def spill(self, store):
+        """
+        Move the encoded bytes to a page store, keeping only their key.
+
+        Args:
+            store: SessionPageStore receiving the bytes
+        """
+        if self._store is None:
+            self._key = store.put(self._data)
+            self._renditions = {name: store.put(data) for name, data in self._renditions.items()}
+            self._store = store
+            self._data = None
+            self._base64 = None
+
+    def rendition(self, name: str) -> bytes:
+        """
+        Return an encoded display rendition of the page.
+
+        Args:
+            name: Rendition name from RENDITION_SIZES ("thumbnail" or "preview")
+
+        Returns:
+            bytes: The rendition (RENDITION_MEDIA_TYPE), or the full page if it
+                has no renditions
+        """
+        value = self._renditions.get(name)
+        if value is None:
+            return self.data
+        return self._store.get(value) if self._store is not None else value
+
+    def rendition_media_type(self, name: str) -> str:
+        """Return the media type of the bytes returned by rendition(name)."""
+        return RENDITION_MEDIA_TYPE if name in self._renditions else self.media_type
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Return (width, height) of the page image."""
+        return self.width, self.height
+
+    @property
+    def size_mb(self) -> float:
+        """Return the encoded size of the page in MB."""
+        return len(self.data) / (1024 * 1024)
+
+    @property
+    def buffer(self) -> memoryview:
+        """Return a read-only view of the encoded bytes (no copy)."""
+        return memoryview(self.data)
+
+    def base64(self) -> str:
+        """Return the encoded bytes as base64, computing them once (every time for spilled pages)."""
+        if self._store is not None:
+            return base64.b64encode(self.data).decode("utf-8")
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("utf-8")
+        return self._base64
+
+    def image(self) -> Image.Image:
+        """
+        Decode the page.
+
+        Returns:
+            PIL.Image: RGB image of the page (a new object on every call)
+        """
+        if self._store is not None:
+            return self._store.image(self._key)
+        image = Image.open(io.BytesIO(self.data))
+        image.load()
+        return image if image.mode == "RGB" else image.convert("RGB")
+
+    def __getstate__(self):
+        # The base64 form is recomputed on demand rather than sent to or from worker
+        # processes, and spilled pages travel with their bytes rather than the store
+        state = {slot: getattr(self, slot) for slot in self.__slots__
+                 if slot not in ("_base64", "_store", "_key")}
+        state["_data"] = self.data
+        state["_renditions"] = {name: self.rendition(name) for name in self._renditions}
+        return (None, state)
+
+    def __setstate__(self, state):
+        for slot, value in state[1].items():
+            setattr(self, slot, value)
+        self._base64 = None
+        self._store = None
+        self._key = None
+
+
+def encode_png(image: Image.Image) -> bytes:
+    """Encode an image as an optimized PNG."""
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def encode_renditions(image: Image.Image) -> dict:
+    """
+    Encode the display renditions of a page image.
+
+    Args:
+        image: RGB PIL.Image of the page
+
+    Returns:
+        dict: Rendition name -> encoded bytes (RENDITION_FORMAT)
+    """
+    renditions = {}
+    # Largest first, so each smaller rendition is resized from the previous one
+    source = image
+    for name, size in sorted(RENDITION_SIZES.items(), key=lambda item: -item[1]):
+        source = source.copy()
+        source.thumbnail((size, size), Image.LANCZOS)
+        buf = io.BytesIO()
+        source.save(buf, format=RENDITION_FORMAT, quality=RENDITION_QUALITY)
+        renditions[name] = buf.getvalue()
+    return renditions
+
+
+def load_page_image(page: Union[RenderedPage, Image.Image]) -> Image.Image:
+    """
+    Return the decoded image of a page.
+
+    Args:
+        page: RenderedPage or an already decoded PIL.Image
+
+    Returns:
+        PIL.Image: The page image
+    """
+    return page.image() if isinstance(page, RenderedPage) else page
+
+
+def page_thumbnail(page: Union[RenderedPage, Image.Image]) -> Image.Image:
+    """Return the thumbnail of a page (a decoded image is returned as is)."""
+    return page.thumbnail if isinstance(page, RenderedPage) else page
+
+
+def page_content_hash(page: Union[RenderedPage, Image.Image]) -> str:
+    """Return the content hash of a page without decoding it when it is a RenderedPage."""
+    return page.page_hash if isinstance(page, RenderedPage) else hash_page_image(page)
+
+
+class EncodedImage:
+    """Image bytes ready to send to the API."""
+
+    __slots__ = ("data", "media_type", "width", "height")
+
+    def __init__(self, data: bytes, media_type: str, width: int, height: int):
+        """
+        Initialize the encoded image.
+
+        Args:
+            data: Encoded image bytes
+            media_type: MIME type ("image/png" or "image/jpeg")
+            width: Width in pixels
+            height: Height in pixels
+        """
+        self.data = data
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+
+    @property
+    def size_mb(self) -> float:
+        """Return the encoded size in MB."""
+        return len(self.data) / (1024 * 1024)
+
+    def base64(self) -> str:
+        """Return the bytes as a base64 string for an API image block."""
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    """Encode an image as an optimized JPEG."""
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _search_jpeg_quality(image: Image.Image, max_bytes: int, min_quality: int,
+                         max_quality: int) -> Tuple[Optional[bytes], int]:
+    """
+    Find the highest JPEG quality whose output fits max_bytes.
+
+    Args:
+        image: Image to encode
+        max_bytes: Size budget
+        min_quality: Lowest acceptable quality
+        max_quality: Highest quality tried
+
+    Returns:
+        tuple: (data, size) with the best fitting encoding, or (None, size at
+            min_quality) when even the lowest quality is too large
+    """
+    data = _encode_jpeg(image, max_quality)
+    if len(data) <= max_bytes:
+        return data, len(data)
+
+    best = _encode_jpeg(image, min_quality)
+    if len(best) > max_bytes:
+        return None, len(best)
+
+    # Binary search between a fitting (low) and a non-fitting (high) quality
+    low, high = min_quality, max_quality
+    while high - low > JPEG_QUALITY_STEP:
+        quality = (low + high) // 2
+        data = _encode_jpeg(image, quality)
+        if len(data) <= max_bytes:
+            low, best = quality, data
+        else:
+            high = quality
+    return best, len(best)
+
+
+def encode_image(image: Image.Image, max_bytes: int, lossless: bool = True,
+                 max_quality: int = JPEG_MAX_QUALITY, min_quality: int = JPEG_MIN_QUALITY) -> EncodedImage:
+    """
+    Encode an image within a size budget, emitting the final bytes once.
+
+    A lossless PNG is tried first (when allowed), then the highest JPEG
+    quality that fits. When even the lowest quality is too large, the image is
+    scaled down by the factor the measured size calls for (encoded size grows
+    roughly with the pixel count) and the search is repeated, at most
+    MAX_SCALE_STEPS times.
+
+    Args:
+        image: PIL.Image object
+        max_bytes: Size budget for the encoded image
+        lossless: Try PNG before JPEG
+        max_quality: Highest JPEG quality tried
+        min_quality: Lowest acceptable JPEG quality
+
+    Returns:
+        EncodedImage: The encoded image
+
+    Raises:
+        ValueError: If the image cannot fit the budget at a usable size
+    """
+    if lossless:
+        data = encode_png(image)
+        if len(data) <= max_bytes:
+            return EncodedImage(data, "image/png", image.width, image.height)
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    for _ in range(MAX_SCALE_STEPS + 1):
+        data, size = _search_jpeg_quality(image, max_bytes, min_quality, max_quality)
+        if data is not None:
+            return EncodedImage(data, "image/jpeg", image.width, image.height)
+
+        # 10% margin so the next round is not just over the budget again
+        scale = math.sqrt(max_bytes / size) * 0.9
+        new_size = (int(image.width * scale), int(image.height * scale))
+        if max(new_size) < MIN_IMAGE_DIMENSION:
+            break
+        image = image.resize(new_size, Image.LANCZOS)
+
+    raise ValueError("Could not compress image below the size limit while maintaining usable quality")
+
+
+def encode_page_for_api(page: Union[RenderedPage, Image.Image],
+                        max_mb: float = API_MAX_IMAGE_MB) -> Union[RenderedPage, EncodedImage]:
+    """
+    Return a page as an API image payload, reusing its stored PNG when it fits.
+
+    Args:
+        page: RenderedPage or PIL.Image object
+        max_mb: Size budget in MB
+
+    Returns:
+        RenderedPage or EncodedImage: The page itself when it fits, otherwise
+            a new encoding; both expose data, media_type, size_mb and base64()
+    """
+    max_bytes = int(max_mb * 1024 * 1024)
+    if isinstance(page, RenderedPage) and len(page.data) <= max_bytes:
+        return page
+    return encode_image(load_page_image(page), max_bytes)
+
+
+def render_zoom(page: "fitz.Page", dpi: int, max_pixels: int = RENDER_MAX_PIXELS) -> float:
+    """
+    Compute the render zoom for a page from its size and the pixel budget.
+
+    Args:
+        page: fitz.Page to render
+        dpi: Requested resolution
+        max_pixels: Largest pixel count allowed
+
+    Returns:
+        float: Zoom factor (72 DPI = 1.0)
+    """
+    zoom = dpi / 72  # 72 is the default PDF dpi
+    area = page.rect.width * page.rect.height
+    if area > 0 and area * zoom * zoom > max_pixels:
+        zoom = math.sqrt(max_pixels / area)
+    return zoom
+
+
+def render_page(page: "fitz.Page", page_num: int, dpi: int, enhance: bool = True,
+                template_xrefs: Optional[FrozenSet[int]] = None) -> RenderedPage:
+    """
+    Render one PDF page once and encode it.
+
+    The resolution is the requested DPI, lowered for oversized pages so the
+    image stays within RENDER_MAX_PIXELS.
+
+    Args:
+        page: fitz.Page to render
+        page_num: Page number (1-based)
+        dpi: Rendering resolution
+        enhance: Apply the sharpening/contrast boost for scanned documents
+        template_xrefs: Images shared across the document's pages; when given,
+            the page's text layer and its visual region crops are extracted too
+
+    Returns:
+        RenderedPage: The encoded page
+    """
+    zoom = render_zoom(page, dpi)
+    matrix = fitz.Matrix(zoom, zoom)
+    pix = page.get_pixmap(matrix=matrix)
+    image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    del pix
+    if enhance:
+        image = enhance_page_image(image)
+    rendered = RenderedPage.from_image(image, page_num, round(zoom * 72))
+
+    if template_xrefs is not None:
+        layer = extract_text_layer(page, template_xrefs)
+        if layer is not None:
+            rendered.text_layer = layer.text
+            regions = []
+            for region in layer.regions:
+                crop = page.get_pixmap(matrix=matrix, clip=region)
+                regions.append(EncodedImage(crop.tobytes("png"), "image/png", crop.width, crop.height))
+            rendered.text_regions = tuple(regions)
+
+    return rendered
+
+
+def _render_range(pdf_path: str, dpi: int, enhance: bool, template_xrefs: Optional[FrozenSet[int]],
+                  start: int, stop: int) -> List[RenderedPage]:
+    """Process pool worker: open the document and render pages [start, stop)."""
+    with fitz.open(pdf_path) as pdf:
+        return [render_page(pdf[index], index + 1, dpi, enhance, template_xrefs) for index in range(start, stop)]
+
+
+# Process-wide worker pool, created lazily
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_raster_pool() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    """Return the shared rasterization process pool, or None when RASTER_WORKERS is 1."""
+    global _pool
+    if RASTER_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers don't inherit the app's threads (engine loop, Streamlit)
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=RASTER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _discard_pool(error: Exception):
+    """Drop a broken pool so the next call starts a fresh one."""
+    global _pool
+    print(f"Warning: Rasterization worker pool failed, continuing in-process: {str(error)}")
+    with _pool_lock:
+        _pool = None
+
+
+def pool_map(func, *iterables) -> list:
+    """
+    Map a picklable module-level function over arguments in the worker pool.
+
+    Runs in-process when the pool is disabled or breaks, so callers always get
+    every result in order.
+
+    Args:
+        func: Module-level function to call
+        *iterables: Argument sequences, as for map()
+
+    Returns:
+        list: Results in argument order
+    """
+    arguments = [list(iterable) for iterable in iterables]
+    pool = get_raster_pool()
+    if pool is not None and arguments and len(arguments[0]) > 1:
+        try:
+            return list(pool.map(func, *arguments))
+        except BrokenProcessPool as e:
+            _discard_pool(e)
+    return [func(*args) for args in zip(*arguments)]
+
+
+class PageRasterizer:
+    """Renders the pages of an in-memory PDF, in order, one page range at a time."""
+
+    def __init__(self, pdf_bytes: bytes, dpi: int = 300, enhance: bool = True, text_layer: bool = False):
+        """
+        Open the PDF from memory.
+
+        Args:
+            pdf_bytes: The PDF content as bytes
+            dpi: Rendering resolution
+            enhance: Apply the sharpening/contrast boost
+            text_layer: Extract the text layer of digitally generated pages
+        """
+        self.pdf_bytes = pdf_bytes
+        self.pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
+        self.dpi = dpi
+        self.enhance = enhance
+        self.template_xrefs = shared_image_xrefs(self.pdf) if text_layer else None
+
+    def __len__(self) -> int:
+        return len(self.pdf)
+
+    def __enter__(self) -> "PageRasterizer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the PDF document."""
+        self.pdf.close()
+
+    def render(self, page_index: int) -> RenderedPage:
+        """
+        Render one page in this process.
+
+        Args:
+            page_index: 0-based page index
+
+        Returns:
+            RenderedPage: The encoded page
+        """
+        return render_page(self.pdf[page_index], page_index + 1, self.dpi, self.enhance, self.template_xrefs)
+
+    def __iter__(self) -> Iterator[RenderedPage]:
+        """
+        Render the pages in order.
+
+        With a worker pool, page ranges are rendered concurrently and yielded
+        as soon as every earlier page is done; otherwise pages are rendered
+        here one at a time.
+
+        Yields:
+            RenderedPage: Each page, in page order
+        """
+        total_pages = len(self.pdf)
+        pool = get_raster_pool() if total_pages > 1 else None
+        if pool is None:
+            for page_index in range(total_pages):
+                yield self.render(page_index)
+            return
+
+        # Workers open the document from a file rather than receiving a copy of the bytes per task
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+            temp_file.write(self.pdf_bytes)
+            pdf_path = temp_file.name
+
+        futures = []
+        next_page = 0
+        try:
+            range_size = max(1, math.ceil(total_pages / (RASTER_WORKERS * RANGES_PER_WORKER)))
+            futures += [
+                pool.submit(_render_range, pdf_path, self.dpi, self.enhance, self.template_xrefs,
+                            start, min(start + range_size, total_pages))
+                for start in range(0, total_pages, range_size)
+            ]
+            for future in futures:
+                for page in future.result():
+                    next_page += 1
+                    yield page
+        except BrokenProcessPool as e:
+            _discard_pool(e)
+            for page_index in range(next_page, total_pages):
+                yield self.render(page_index)
+        finally:
+            for future in futures:
+                future.cancel()
+            try:
+                os.unlink(pdf_path)
+            except OSError:
+                pass
+
+
+def _standardize(image: Image.Image, target_dpi: int) -> Tuple[Image.Image, bytes]:
+    """Resize, enhance and JPEG-encode an image for OCR (see standardize_image)."""
+    # Preserve original colors (especially blue ink for signatures)
+    # We'll keep the original color mode instead of converting to grayscale
+    # This ensures blue ink signatures remain clearly visible
+    
+    # Calculate target dimensions (assume 72 DPI source if unknown)
+    source_dpi = getattr(image, 'info', {}).get('dpi', (72, 72))[0]
+    width, height = image.size
+    
+    # Calculate scaling factor to reach target DPI
+    scale_factor = target_dpi / source_dpi
+    target_width = int(width * scale_factor)
+    target_height = int(height * scale_factor)
+    
+    # Limit dimensions to prevent excessively large images
+    if target_width > OCR_MAX_DIMENSION or target_height > OCR_MAX_DIMENSION:
+        ratio = min(OCR_MAX_DIMENSION / target_width, OCR_MAX_DIMENSION / target_height)
+        target_width = int(target_width * ratio)
+        target_height = int(target_height * ratio)
+    
+    # Resize using high-quality interpolation
+    resized_image = image.resize((target_width, target_height), Image.LANCZOS)
+    
+    # Apply contrast enhancement
+    enhancer = ImageEnhance.Contrast(resized_image)
+    enhanced_image = enhancer.enhance(1.5)  # Increase contrast by 50%
+    
+    # Apply mild sharpening for better text edges
+    enhanced_image = enhanced_image.filter(ImageFilter.SHARPEN)
+    
+    # Encode with consistent settings, keeping some margin below Claude's 5MB limit
+    encoded = encode_image(enhanced_image, int(OCR_MAX_MB * 1024 * 1024), lossless=False,
+                           max_quality=85, min_quality=35)
+    return enhanced_image, encoded.data
+
+
+def standardize_image(image: Image.Image, target_dpi: int = OCR_TARGET_DPI) -> Tuple[Image.Image, str]:
+    """
+    Standardize image for consistent OCR results:
+    - Resizes to consistent target DPI/resolution
+    - Enhances contrast and sharpens text edges
+    - Keeps the original colors (blue ink signatures stay visible)
+    - Ensures size is under Claude's limits
+    
+    Args:
+        image: PIL.Image object
+        target_dpi: Target resolution in DPI (250 is good for OCR)
+        
+    Returns:
+        standardized_image: PIL.Image object
+        img_base64: Base64 encoded JPEG for the API
+    """
+    standardized_image, data = _standardize(image, target_dpi)
+    return standardized_image, base64.b64encode(data).decode('utf-8')
+
+
+def _standardize_data(data: bytes, target_dpi: int) -> bytes:
+    """Process pool worker: decode an encoded page and return its standardized JPEG."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return _standardize(image if image.mode == "RGB" else image.convert("RGB"), target_dpi)[1]
+
+
+def standardize_pages(pages: List[Union[RenderedPage, Image.Image]], target_dpi: int = OCR_TARGET_DPI) -> List[bytes]:
+    """
+    Standardize several pages for OCR, in parallel when the worker pool is available.
+
+    Args:
+        pages: RenderedPage or PIL.Image objects
+        target_dpi: Target resolution in DPI
+
+    Returns:
+        list: Standardized JPEG bytes, in the order of pages
+    """
+    if all(isinstance(page, RenderedPage) for page in pages):
+        return pool_map(_standardize_data, [page.data for page in pages], [target_dpi] * len(pages))
+    return [_standardize(load_page_image(page), target_dpi)[1] for page in pages]
+
+
+async def standardize_page_async(page: Union[RenderedPage, Image.Image], target_dpi: int = OCR_TARGET_DPI) -> bytes:
+    """
+    Standardize one page for OCR without blocking the running event loop.
+
+    Encoded pages go to the worker pool; decoded images are standardized in a thread.
+
+    Args:
+        page: RenderedPage or PIL.Image object
+        target_dpi: Target resolution in DPI
+
+    Returns:
+        bytes: Standardized JPEG
+    """
+    pool = get_raster_pool()
+    if pool is not None and isinstance(page, RenderedPage):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, _standardize_data, page.data, target_dpi)
+        except BrokenProcessPool as e:
+            _discard_pool(e)
+    return (await asyncio.to_thread(_standardize, load_page_image(page), target_dpi))[1]
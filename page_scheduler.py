@@ -0,0 +1,203 @@
+"""
+Process-wide page scheduler for PTW Analyzer
+
+Every document used to run its pages through its own pipeline with its own
+per-stage limits, and all of them raced for the rate controller's call slots:
+whichever coroutine polled first got the next slot. Two auditors starting
+large permits at the same time competed blindly, and one big upload could take
+every slot while a single-page check waited behind it.
+
+All page tasks (the OCR and the analysis of a page) now ask this scheduler
+for a slot before calling the model. The scheduler admits as many tasks as the
+rate controller currently allows calls in flight, and picks the next task:
+
+1. from the most urgent priority class - interactive analyses started from
+   the app run ahead of bulk back-audits (see ptw_batch)
+2. of the user with the fewest tasks running, so users share the slots
+   evenly; a user at USER_MAX_IN_FLIGHT gets no more until one finishes
+3. of that user's document with the fewest tasks running
+
+Ties go to whoever was served longest ago. The scheduler lives on the engine
+loop: slots are only taken by coroutines running there.
+"""
+
+import os
+import asyncio
+import itertools
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from rate_limiter import AdaptiveRateController, get_rate_controller
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Page tasks one user may have running at the same time
+USER_MAX_IN_FLIGHT = int(os.environ.get("PTW_USER_MAX_IN_FLIGHT", "8"))
+
+
+class ScheduledDocument:
+    """A document whose page tasks are queued in the scheduler (see PageScheduler.open_document)."""
+
+    def __init__(self, owner: str, priority: str):
+        """
+        Initialize the document.
+
+        Args:
+            owner: User (or session) the document belongs to
+            priority: Priority class (one of PRIORITY_CLASSES)
+        """
+        self.owner = owner
+        self.priority = priority
+        self.rank = PRIORITY_CLASSES.index(priority) if priority in PRIORITY_CLASSES else len(PRIORITY_CLASSES)
+        self.in_flight = 0
+        self.last_served = 0
+        self.waiting = deque()
+
+
+class PageScheduler:
+    """Fair, priority-aware admission of page tasks to the model."""
+
+    def __init__(self, controller: Optional[AdaptiveRateController] = None,
+                 user_max_in_flight: int = USER_MAX_IN_FLIGHT):
+        """
+        Initialize the scheduler.
+
+        Args:
+            controller: Rate controller whose limit sets the tasks admitted
+                at once (defaults to the shared controller)
+            user_max_in_flight: Page tasks one user may have running at once
+        """
+        self.controller = controller or get_rate_controller()
+        self.user_max_in_flight = max(1, user_max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._user_in_flight: Dict[str, int] = {}
+        self._user_last_served: Dict[str, int] = {}
+        self._queued = set()
+        self._ticks = itertools.count(1)
+
+    def open_document(self, owner: Optional[str] = None, priority: str = PRIORITY_INTERACTIVE) -> ScheduledDocument:
+        """
+        Register a document whose pages will be scheduled.
+
+        Args:
+            owner: User (or session) the document belongs to (anonymous if omitted)
+            priority: Priority class (one of PRIORITY_CLASSES)
+
+        Returns:
+            ScheduledDocument: Handle to pass to slot()
+        """
+        return ScheduledDocument(owner or "anonymous", priority)
+
+    @asynccontextmanager
+    async def slot(self, document: ScheduledDocument):
+        """
+        Hold a page task slot for the duration of an async block.
+
+        Args:
+            document: Document the page belongs to
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            document.waiting.append(future)
+            self._queued.add(document)
+            self._dispatch()
+        try:
+            await future
+        except BaseException:
+            with self._lock:
+                if future.done() and not future.cancelled():
+                    # Granted just before the wait was cancelled
+                    self._release(document)
+                else:
+                    future.cancel()
+            raise
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(document)
+
+    def _dispatch(self):
+        """Grant slots to the next tasks while capacity remains (lock held)."""
+        while self._in_flight < max(1, self.controller.limit):
+            document = self._next_document()
+            if document is None:
+                return
+            future = document.waiting.popleft()
+            if not document.waiting:
+                self._queued.discard(document)
+            if future.cancelled():
+                continue
+            tick = next(self._ticks)
+            self._in_flight += 1
+            document.in_flight += 1
+            document.last_served = tick
+            self._user_in_flight[document.owner] = self._user_in_flight.get(document.owner, 0) + 1
+            self._user_last_served[document.owner] = tick
+            future.set_result(None)
+
+    def _next_document(self) -> Optional[ScheduledDocument]:
+        """Return the document whose task runs next, or None if no task may start (lock held)."""
+        candidates = [
+            document for document in self._queued
+            if self._user_in_flight.get(document.owner, 0) < self.user_max_in_flight
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda document: (
+            document.rank,
+            self._user_in_flight.get(document.owner, 0),
+            self._user_last_served.get(document.owner, 0),
+            document.in_flight,
+            document.last_served
+        ))
+
+    def _release(self, document: ScheduledDocument):
+        """Return a task's slot and start the next tasks (lock held)."""
+        self._in_flight -= 1
+        document.in_flight -= 1
+        remaining = self._user_in_flight.get(document.owner, 1) - 1
+        if remaining > 0:
+            self._user_in_flight[document.owner] = remaining
+        else:
+            self._user_in_flight.pop(document.owner, None)
+            if not any(queued.owner == document.owner for queued in self._queued):
+                self._user_last_served.pop(document.owner, None)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the current load.
+
+        Returns:
+            dict: in_flight, users (with tasks running), and queued tasks per
+                priority class (e.g. queued_interactive, queued_bulk)
+        """
+        with self._lock:
+            stats = {"in_flight": self._in_flight, "users": len(self._user_in_flight)}
+            for priority in PRIORITY_CLASSES:
+                stats[f"queued_{priority}"] = sum(
+                    sum(1 for future in document.waiting if not future.cancelled())
+                    for document in self._queued if document.priority == priority
+                )
+            return stats
+
+
+# Process-wide scheduler, created lazily
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_page_scheduler() -> PageScheduler:
+    """Return the shared page scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PageScheduler()
+        return _scheduler
@@ -0,0 +1,275 @@
+"""
+Disk-backed page store for PTW Analyzer
+
+Rendered pages and captured photos used to live in st.session_state for the
+life of the browser session, so every open session held every page of every
+document it analysed. With several auditors on one server the Streamlit
+process grew until it was killed.
+
+Pages added to a SessionPageStore are written once to a per-session temp
+directory. Only a bounded set of encoded pages stays in memory (least recently
+used first out), under both a per-session and a process-wide cap, plus a few
+decoded images for display. A page evicted from memory is read back from disk
+on its next use. The directory is removed when the session's store is garbage
+collected (the Streamlit session ended), at interpreter exit, or - for
+directories left behind by a crashed process - when the next process starts.
+"""
+
+import io
+import os
+import time
+import uuid
+import atexit
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from PIL import Image
+
+# Root directory of the per-session page directories
+PAGE_STORE_DIR = os.environ.get("PTW_PAGE_STORE_DIR", os.path.join(tempfile.gettempdir(), "ptw_page_store"))
+
+# Encoded page bytes kept in memory per session and for the whole process (MB)
+SESSION_PAGE_MEMORY_MB = float(os.environ.get("PTW_SESSION_PAGE_MEMORY_MB", "64"))
+PAGE_MEMORY_MB = float(os.environ.get("PTW_PAGE_MEMORY_MB", "512"))
+
+# Decoded page images kept per session for display
+DECODED_PAGES = int(os.environ.get("PTW_DECODED_PAGES", "4"))
+
+# Session directories untouched for longer than this are leftovers of a crashed process (hours)
+STALE_SESSION_HOURS = 24
+
+
+class SessionPageStore:
+    """Encoded pages of one session, on disk with a bounded in-memory LRU."""
+
+    def __init__(self, registry: "PageStoreRegistry", session_id: str, directory: str):
+        """
+        Initialize the store (use PageStoreRegistry.open_session()).
+
+        Args:
+            registry: Registry enforcing the process-wide memory cap
+            session_id: Identifier of the session
+            directory: Directory holding the session's page files
+        """
+        self.registry = registry
+        self.session_id = session_id
+        self.directory = directory
+        self._resident: "OrderedDict[str, bytes]" = OrderedDict()
+        self._decoded: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self.resident_bytes = 0
+
+    def _path(self, key: str) -> str:
+        """Return the file holding a page."""
+        return os.path.join(self.directory, key)
+
+    def put(self, data: bytes) -> str:
+        """
+        Store encoded page bytes.
+
+        Args:
+            data: Encoded page
+
+        Returns:
+            str: Key to read the page back with get()
+        """
+        key = uuid.uuid4().hex
+        with open(self._path(key), "wb") as f:
+            f.write(data)
+        with self.registry.lock:
+            self._remember(key, data)
+        return key
+
+    def get(self, key: str) -> bytes:
+        """
+        Return the encoded bytes of a page, reading them from disk if evicted.
+
+        Args:
+            key: Key returned by put()
+
+        Returns:
+            bytes: The encoded page
+        """
+        with self.registry.lock:
+            data = self._resident.get(key)
+            if data is not None:
+                self._resident.move_to_end(key)
+                return data
+        with open(self._path(key), "rb") as f:
+            data = f.read()
+        with self.registry.lock:
+            if key not in self._resident:
+                self._remember(key, data)
+        return data
+
+    def image(self, key: str) -> Image.Image:
+        """
+        Return the decoded RGB image of a page, keeping the last few decoded.
+
+        Args:
+            key: Key returned by put()
+
+        Returns:
+            PIL.Image: A copy of the decoded page (safe to modify)
+        """
+        with self.registry.lock:
+            image = self._decoded.get(key)
+            if image is not None:
+                self._decoded.move_to_end(key)
+                return image.copy()
+        image = Image.open(io.BytesIO(self.get(key)))
+        image.load()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        with self.registry.lock:
+            self._decoded[key] = image
+            while len(self._decoded) > DECODED_PAGES:
+                self._decoded.popitem(last=False)
+        return image.copy()
+
+    def _remember(self, key: str, data: bytes):
+        """Keep page bytes in memory and enforce the caps (registry lock held)."""
+        self._resident[key] = data
+        self.resident_bytes += len(data)
+        self.registry.resident_bytes += len(data)
+        self.evict(SESSION_PAGE_MEMORY_MB * 1024 * 1024)
+        self.registry.enforce_cap()
+
+    def evict(self, max_bytes: float) -> bool:
+        """
+        Drop least recently used pages from memory until under max_bytes (registry lock held).
+
+        Returns:
+            bool: True if anything was evicted
+        """
+        evicted = False
+        # The most recently used page always stays, so it is never read back immediately
+        while self.resident_bytes > max_bytes and len(self._resident) > 1:
+            key, data = self._resident.popitem(last=False)
+            self._decoded.pop(key, None)
+            self.resident_bytes -= len(data)
+            self.registry.resident_bytes -= len(data)
+            evicted = True
+        return evicted
+
+    def close(self):
+        """Release the session's memory and delete its directory."""
+        with self.registry.lock:
+            self.registry.resident_bytes -= self.resident_bytes
+            self.resident_bytes = 0
+            self._resident.clear()
+            self._decoded.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class PageStoreRegistry:
+    """All session page stores of the process and their shared memory cap."""
+
+    def __init__(self, root: str = PAGE_STORE_DIR):
+        """
+        Initialize the registry and remove directories left by crashed processes.
+
+        Args:
+            root: Directory holding the per-session directories
+        """
+        self.root = root
+        self.lock = threading.RLock()
+        self.resident_bytes = 0
+        self._sessions: Dict[str, SessionPageStore] = {}
+        os.makedirs(root, exist_ok=True)
+        self._remove_stale()
+
+    def _remove_stale(self):
+        """Delete session directories not modified for STALE_SESSION_HOURS."""
+        cutoff = time.time() - STALE_SESSION_HOURS * 3600
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def open_session(self, session_id: Optional[str] = None) -> SessionPageStore:
+        """
+        Create the page store of a new session.
+
+        Args:
+            session_id: Identifier of the session (generated if omitted)
+
+        Returns:
+            SessionPageStore: The session's store
+        """
+        session_id = session_id or uuid.uuid4().hex
+        directory = os.path.join(self.root, session_id)
+        os.makedirs(directory, exist_ok=True)
+        store = SessionPageStore(self, session_id, directory)
+        with self.lock:
+            self._sessions[session_id] = store
+        return store
+
+    def close_session(self, session_id: str):
+        """Delete the pages of a session that ended."""
+        with self.lock:
+            store = self._sessions.pop(session_id, None)
+        if store is not None:
+            store.close()
+
+    def enforce_cap(self):
+        """Evict pages of the largest sessions until the process-wide cap holds (lock held)."""
+        max_bytes = PAGE_MEMORY_MB * 1024 * 1024
+        while self.resident_bytes > max_bytes:
+            largest = max(self._sessions.values(), key=lambda store: store.resident_bytes, default=None)
+            if largest is None or not largest.evict(largest.resident_bytes - (self.resident_bytes - max_bytes)):
+                break
+
+    def close_all(self):
+        """Delete the pages of every session (interpreter exit)."""
+        for session_id in list(self._sessions):
+            self.close_session(session_id)
+
+
+# Process-wide registry, created lazily
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_page_store_registry() -> PageStoreRegistry:
+    """Return the shared page store registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PageStoreRegistry()
+            atexit.register(_registry.close_all)
+        return _registry
+
+
+class SessionPages:
+    """
+    Handle kept in st.session_state for a session's page store.
+
+    Streamlit drops the session state when a session ends; the handle is then
+    garbage collected and the session's pages are deleted.
+    """
+
+    def __init__(self):
+        """Open a new session store."""
+        registry = get_page_store_registry()
+        self.store = registry.open_session()
+        weakref.finalize(self, registry.close_session, self.store.session_id)
+
+    def add(self, page):
+        """
+        Move the encoded bytes of a RenderedPage to the store.
+
+        Args:
+            page: RenderedPage to spill
+
+        Returns:
+            RenderedPage: The same page, now reading its bytes from the store
+        """
+        page.spill(self.store)
+        return page
@@ -0,0 +1,277 @@
+"""
+Page triage for PTW Analyzer
+
+Every page used to get the same treatment: the full OCR prompt on the main
+model, then the full master analysis prompt. That includes third-party JSAs,
+which the prompts themselves short-circuit to "[THIRD-PARTY JSA - No analysis
+required]", carbon copies that end up as N/A rows and blank pages.
+
+Before the expensive OCR call, a small, fast model looks at the page preview
+(and the start of its text layer, if any) and classifies it. Pages it
+confidently identifies as a third-party JSA, a green/yellow copy or a blank
+page skip the OCR and analysis calls and get their N/A row directly; every
+other page - and any page the triage is unsure about or fails on - follows the
+normal path. Each decision is logged with the time it saved, estimated from
+the running average duration of the OCR and analysis calls it avoided.
+"""
+
+import os
+import re
+import base64
+import json
+import time
+import threading
+from typing import Dict, Optional
+
+from llm_engine import get_engine
+
+# Model used for triage (a small, fast model)
+TRIAGE_MODEL = os.environ.get("PTW_TRIAGE_MODEL", "claude-3-5-haiku-20241022")
+
+# Triage is skipped entirely when disabled
+TRIAGE_ENABLED = os.environ.get("PTW_TRIAGE", "1") != "0"
+
+# Minimum confidence for a page to skip the OCR and analysis calls
+TRIAGE_MIN_CONFIDENCE = float(os.environ.get("PTW_TRIAGE_MIN_CONFIDENCE", "0.85"))
+
+# Characters of the text layer sent along with the preview
+TRIAGE_TEXT_CHARS = 1500
+
+# Page types the triage model chooses from
+PAGE_TYPES = {
+    "constellation_pt": "Main Constellation Permit to Work form (or a page of it)",
+    "jsa": "Constellation JSA (Job Safety Analysis) with the Constellation flame/drop logo or name",
+    "lvcta": "LVCTA (Lista de Verificação de Cesto de Trabalho Aéreo) or another Constellation checklist/form",
+    "third_party_jsa": "JSA or risk analysis form of another company, with no Constellation logo or name",
+    "color_copy": "Green (GUIA VERDE) or yellow (GUIA AMARELA) carbon copy of a form",
+    "blank": "Blank page, or a page with no form content",
+    "other": "Anything else"
+}
+
+# Page types whose pages skip OCR and analysis
+SKIPPED_TYPES = ("third_party_jsa", "color_copy", "blank")
+
+# Marker the OCR and analysis prompts use for third-party JSAs
+THIRD_PARTY_JSA_MARKER = "[THIRD-PARTY JSA - No analysis required]"
+
+# Marker of pages with no form content
+BLANK_PAGE_MARKER = "[BLANK PAGE - No analysis required]"
+
+TRIAGE_PROMPT = """You classify single pages of offshore drilling Permit to Work (PTW) packs issued by Constellation, so that only pages needing an audit are sent to a detailed review.
+
+Page types:
+""" + "\n".join(f"- {name}: {description}" for name, description in PAGE_TYPES.items()) + """
+
+Rules:
+- Constellation forms carry the Constellation flame/drop logo (usually top right) and/or the name "Constellation".
+- Only use third_party_jsa when the page is clearly a JSA or risk analysis AND has no Constellation logo or name anywhere.
+- Only use color_copy when the page itself says GUIA/VIA/CÓPIA VERDE or AMARELA, or the paper is clearly tinted green or yellow; white copies (GUIA BRANCA) are never color_copy.
+- When unsure, use a lower confidence; a wrongly skipped page is much worse than a page reviewed for nothing.
+
+Answer with ONLY a JSON object, no other text:
+{"page_type": "<one of the page types>", "guide_color": "BRANCA" | "VERDE" | "AMARELA" | null, "confidence": <0.0-1.0>, "reason": "<a few words>"}"""
+
+
+class TriageDecision:
+    """Classification of one page by the triage model."""
+
+    def __init__(self, page_type: str, guide_color: Optional[str], confidence: float,
+                 reason: str = "", seconds: float = 0.0):
+        """
+        Initialize the decision.
+
+        Args:
+            page_type: One of PAGE_TYPES
+            guide_color: "BRANCA", "VERDE", "AMARELA" or None
+            confidence: Model confidence (0-1)
+            reason: Short justification from the model
+            seconds: Duration of the triage call
+        """
+        self.page_type = page_type
+        self.guide_color = guide_color
+        self.confidence = confidence
+        self.reason = reason
+        self.seconds = seconds
+
+    @property
+    def skip(self) -> bool:
+        """Return True if the page can skip OCR and analysis."""
+        if self.confidence < TRIAGE_MIN_CONFIDENCE or self.page_type not in SKIPPED_TYPES:
+            return False
+        # A copy is only routed when its color is known, so it gets the right N/A row
+        return self.page_type != "color_copy" or self.guide_color in ("VERDE", "AMARELA")
+
+    def ocr_text(self) -> str:
+        """
+        Build the placeholder OCR text of a skipped page.
+
+        The markers route the page to its N/A row in the analysis stage
+        (detect_guide_color() for copies), without calling the model.
+
+        Returns:
+            str: Placeholder OCR text
+        """
+        note = f"[OCR skipped: page triaged as {self.page_type}, confidence {self.confidence:.0%}]"
+        if self.page_type == "color_copy":
+            return f"[DOCUMENT TYPE: GUIA {self.guide_color}]\n{note}"
+        if self.page_type == "third_party_jsa":
+            return f"{THIRD_PARTY_JSA_MARKER}\n{note}"
+        return f"{BLANK_PAGE_MARKER}\n{note}"
+
+
+def parse_triage_response(text: str) -> Optional[TriageDecision]:
+    """
+    Read the triage model's JSON answer.
+
+    Args:
+        text: Response text
+
+    Returns:
+        TriageDecision or None: The decision, None if the answer is unusable
+    """
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        answer = json.loads(match.group(0))
+        page_type = answer.get("page_type")
+        if page_type not in PAGE_TYPES:
+            return None
+        guide_color = answer.get("guide_color")
+        guide_color = guide_color.upper() if isinstance(guide_color, str) else None
+        confidence = min(1.0, max(0.0, float(answer.get("confidence", 0))))
+        return TriageDecision(page_type, guide_color, confidence, str(answer.get("reason", "")))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class TriageStats:
+    """Thread-safe routing counters and the time saved by skipped pages."""
+
+    def __init__(self):
+        """Initialize empty counters."""
+        self._lock = threading.Lock()
+        self._types: Dict[str, int] = {}
+        self._skipped = 0
+        self._triage_seconds = 0.0
+        self._saved_seconds = 0.0
+        # Running average duration of the calls a skipped page avoids
+        self._stage_seconds: Dict[str, Optional[float]] = {"ocr": None, "analysis": None}
+
+    def record_stage(self, stage: str, seconds: float):
+        """
+        Record the duration of a full OCR or analysis call.
+
+        Args:
+            stage: "ocr" or "analysis"
+            seconds: Call duration
+        """
+        with self._lock:
+            average = self._stage_seconds.get(stage)
+            self._stage_seconds[stage] = seconds if average is None else 0.8 * average + 0.2 * seconds
+
+    def record_decision(self, decision: TriageDecision) -> float:
+        """
+        Count a triage decision.
+
+        Args:
+            decision: Decision of the triage model
+
+        Returns:
+            float: Estimated seconds saved by the decision (negative for pages
+                that still go through OCR and analysis: the triage call is extra)
+        """
+        with self._lock:
+            self._types[decision.page_type] = self._types.get(decision.page_type, 0) + 1
+            self._triage_seconds += decision.seconds
+            if decision.skip:
+                self._skipped += 1
+                saved = sum(seconds or 0.0 for seconds in self._stage_seconds.values()) - decision.seconds
+            else:
+                saved = -decision.seconds
+            self._saved_seconds += saved
+            return saved
+
+    def snapshot(self) -> dict:
+        """
+        Return the routing totals.
+
+        Returns:
+            dict: triaged, skipped, types (page_type -> pages), triage_seconds
+                and saved_seconds (net of the triage calls)
+        """
+        with self._lock:
+            return {
+                "triaged": sum(self._types.values()),
+                "skipped": self._skipped,
+                "types": dict(self._types),
+                "triage_seconds": self._triage_seconds,
+                "saved_seconds": self._saved_seconds
+            }
+
+
+# Process-wide stats, created lazily
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_triage_stats() -> TriageStats:
+    """Return the shared triage stats."""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = TriageStats()
+        return _stats
+
+
+async def triage_page(page, page_num: Optional[int] = None) -> Optional[TriageDecision]:
+    """
+    Classify a page with the triage model.
+
+    Args:
+        page: RenderedPage to classify (its preview rendition is sent)
+        page_num: Page number used in the log (optional)
+
+    Returns:
+        TriageDecision or None: The decision, None if the triage failed
+    """
+    content = [{
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": page.rendition_media_type("preview"),
+            "data": base64.b64encode(page.rendition("preview")).decode("utf-8")
+        }
+    }]
+    if page.text_layer:
+        content.append({"type": "text", "text": f"Start of the page's embedded text:\n{page.text_layer[:TRIAGE_TEXT_CHARS]}"})
+    content.append({"type": "text", "text": "Classify this page."})
+
+    label = f"triage page {page_num}" if page_num else "triage"
+    started = time.monotonic()
+    try:
+        response = await get_engine().create_message(
+            label=label,
+            model=TRIAGE_MODEL,
+            max_tokens=200,
+            timeout=60,
+            temperature=0,
+            system=TRIAGE_PROMPT,
+            messages=[{"role": "user", "content": content}]
+        )
+    except Exception as e:
+        print(f"Warning: Triage of page {page_num or '?'} failed: {str(e)}")
+        return None
+
+    decision = parse_triage_response(response.content[0].text)
+    if decision is None:
+        print(f"Warning: Triage of page {page_num or '?'} returned an unusable answer")
+        return None
+    decision.seconds = time.monotonic() - started
+
+    saved = get_triage_stats().record_decision(decision)
+    print(
+        f"Triage [{label}]: {decision.page_type} ({decision.confidence:.0%}) -> "
+        f"{'skipped' if decision.skip else 'full analysis'}, saved ~{saved:.1f}s"
+    )
+    return decision
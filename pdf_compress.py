@@ -0,0 +1,196 @@
+"""
+In-place PDF image recompression for PTW Analyzer
+
+Uploads above the API size limit used to be compressed by rasterizing every
+page to a JPEG and rebuilding the PDF, once per quality level tried. That
+renders a large scan up to seven times and throws away the text layer and
+vector content of digital PDFs.
+
+This module only touches the embedded raster images: each image XObject is
+decoded once in the shared worker pool, which measures its size at every
+compression level (JPEG quality, then downsampling). The output size for a
+level is estimated as the non-image bytes of the file plus the per-image
+results, so the level is chosen before the document is rewritten, and the
+PDF is saved a single time. Text, vector drawings, form fields and bilevel
+(fax/JBIG2) images are left as they are.
+"""
+
+import io
+import os
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from page_raster import pool_map
+
+# Images are downsampled to at most this resolution where they are displayed (pages are OCR'd at 250 DPI)
+COMPRESS_MAX_DPI = int(os.environ.get("PTW_COMPRESS_MAX_DPI", "300"))
+
+# (scale, JPEG quality) levels tried in order until the estimated output fits
+COMPRESSION_LEVELS = (
+    (1.0, 90), (1.0, 80), (1.0, 70), (1.0, 60), (1.0, 50), (1.0, 40),
+    (0.75, 40), (0.5, 40)
+)
+
+# Images whose stream is smaller than this are not worth recompressing
+MIN_IMAGE_BYTES = 16 * 1024
+
+# Filters of bilevel images, which JPEG would only make larger
+BILEVEL_FILTERS = ("JBIG2Decode", "CCITTFaxDecode")
+
+
+def _decode(data: bytes) -> Image.Image:
+    """Decode extracted image bytes as a grayscale or RGB image."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode in ("1", "L", "LA", "I", "I;16"):
+        return image.convert("L")
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def _resize(image: Image.Image, scale: float) -> Image.Image:
+    """Return the image scaled by the given factor (unchanged at 1.0)."""
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def _encode(image: Image.Image, quality: int) -> bytes:
+    """Encode an image as an optimized JPEG."""
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _level_sizes(data: bytes, max_scale: float) -> Optional[List[int]]:
+    """Process pool worker: return the JPEG size of an image at every compression level."""
+    try:
+        image = _decode(data)
+    except Exception:
+        return None
+    sizes = []
+    resized = {}
+    for scale, quality in COMPRESSION_LEVELS:
+        scale = min(1.0, scale * max_scale)
+        if scale not in resized:
+            resized[scale] = _resize(image, scale)
+        sizes.append(len(_encode(resized[scale], quality)))
+    return sizes
+
+
+def _recompress(data: bytes, scale: float, quality: int) -> Tuple[bytes, int, int, bool]:
+    """Process pool worker: return (jpeg, width, height, is_gray) of an image at one level."""
+    image = _resize(_decode(data), scale)
+    return _encode(image, quality), image.width, image.height, image.mode == "L"
+
+
+def _image_scale(pdf: fitz.Document, xref: int, width: int) -> float:
+    """Return the downsampling factor that caps an image at COMPRESS_MAX_DPI where it is displayed."""
+    lowest_dpi = None
+    for page in pdf:
+        for rect in page.get_image_rects(xref):
+            if rect.width > 0:
+                dpi = width * 72 / rect.width
+                lowest_dpi = dpi if lowest_dpi is None else min(lowest_dpi, dpi)
+    if not lowest_dpi or lowest_dpi <= COMPRESS_MAX_DPI:
+        return 1.0
+    return COMPRESS_MAX_DPI / lowest_dpi
+
+
+def _compressible_images(pdf: fitz.Document) -> List[Tuple[int, int, int]]:
+    """
+    List the image XObjects worth recompressing.
+
+    Args:
+        pdf: Open fitz.Document
+
+    Returns:
+        list: (xref, raw stream size, width) of every candidate image
+    """
+    images, seen, soft_masks = [], set(), set()
+    for page in pdf:
+        for info in page.get_images(full=True):
+            xref, smask, width, bpc, filter_name = info[0], info[1], info[2], info[4], info[8]
+            if smask:
+                soft_masks.add(smask)
+            if xref in seen:
+                continue
+            seen.add(xref)
+            if bpc == 1 or filter_name in BILEVEL_FILTERS:
+                continue
+            if pdf.xref_get_key(xref, "ImageMask")[1] == "true":
+                continue
+            raw_size = len(pdf.xref_stream_raw(xref) or b"")
+            if raw_size >= MIN_IMAGE_BYTES:
+                images.append((xref, raw_size, width))
+    # Soft masks hold transparency and stay lossless
+    return [image for image in images if image[0] not in soft_masks]
+
+
+def _replace_image(pdf: fitz.Document, xref: int, jpeg: bytes, width: int, height: int, gray: bool):
+    """Replace the stream of an image XObject with a JPEG, keeping its object number and soft mask."""
+    pdf.update_stream(xref, jpeg, compress=False)
+    pdf.xref_set_key(xref, "Filter", "/DCTDecode")
+    pdf.xref_set_key(xref, "Width", str(width))
+    pdf.xref_set_key(xref, "Height", str(height))
+    pdf.xref_set_key(xref, "ColorSpace", "/DeviceGray" if gray else "/DeviceRGB")
+    pdf.xref_set_key(xref, "BitsPerComponent", "8")
+    pdf.xref_set_key(xref, "DecodeParms", "null")
+    pdf.xref_set_key(xref, "Decode", "null")
+
+
+def compress_pdf_images(pdf_bytes: bytes, target_size_mb: float = 4.0) -> bytes:
+    """
+    Shrink a PDF by recompressing its embedded raster images.
+
+    Args:
+        pdf_bytes: The PDF content as bytes
+        target_size_mb: Size the output should fit in
+
+    Returns:
+        bytes: The compressed PDF, or the input when it cannot be made smaller
+    """
+    target_bytes = int(target_size_mb * 1024 * 1024)
+    if len(pdf_bytes) <= target_bytes:
+        return pdf_bytes
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        images = _compressible_images(pdf)
+        datas = [pdf.extract_image(xref)["image"] for xref, _, _ in images]
+        scales = [_image_scale(pdf, xref, width) for xref, _, width in images]
+
+        # Measure every image at every level once, in parallel
+        level_sizes = pool_map(_level_sizes, datas, scales)
+
+        # Estimate the output size per level; images that would grow keep their stream
+        fixed_bytes = len(pdf_bytes) - sum(raw_size for (_, raw_size, _), sizes in zip(images, level_sizes) if sizes)
+        level = len(COMPRESSION_LEVELS) - 1
+        for index in range(len(COMPRESSION_LEVELS)):
+            estimate = fixed_bytes + sum(
+                min(sizes[index], raw_size) for (_, raw_size, _), sizes in zip(images, level_sizes) if sizes
+            )
+            if estimate <= target_bytes:
+                level = index
+                break
+
+        scale, quality = COMPRESSION_LEVELS[level]
+        chosen = [
+            i for i, sizes in enumerate(level_sizes)
+            if sizes and sizes[level] < images[i][1]
+        ]
+        results = pool_map(
+            _recompress,
+            [datas[i] for i in chosen],
+            [min(1.0, scale * scales[i]) for i in chosen],
+            [quality] * len(chosen)
+        )
+        del datas
+
+        for i, (jpeg, width, height, gray) in zip(chosen, results):
+            _replace_image(pdf, images[i][0], jpeg, width, height, gray)
+
+        output = pdf.tobytes(garbage=4, deflate=True)
+
+    return output if len(output) < len(pdf_bytes) else pdf_bytes
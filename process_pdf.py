@@ -1,12 +1,9 @@
 import streamlit as st
 import os
-import tempfile
-import base64
-import io
-import fitz  # PyMuPDF
-from PIL import Image
 from anthropic import Anthropic
 
+from page_raster import PageRasterizer, RenderedPage, EncodedImage, encode_image, encode_png
+
 # Initialize API client
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
@@ -15,148 +12,66 @@ def extract_pages_as_images(pdf_bytes, dpi=220):
     """Extract pages from PDF as images with moderate resolution (default 220 DPI).
     
     Uses moderate DPI to ensure extracted images are more likely to be under 5MB limit.
+    Pages are rendered one at a time from memory and kept PNG-encoded (see page_raster),
+    so memory use does not grow with decoded page images.
     """
-    images = []
-    
-    # Save to a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-        temp_file.write(pdf_bytes)
-        temp_path = temp_file.name
+    pages = []
     
     try:
-        # Open the PDF
-        pdf = fitz.open(temp_path)
-        total_pages = len(pdf)
-        
-        # Add a progress indicator for large documents
-        if total_pages > 5:
-            progress_bar = st.progress(0)
-            progress_text = st.empty()
-        
-        # Convert each page to an image
-        for page_num in range(total_pages):
-            # Update progress for large documents
-            if total_pages > 5:
-                progress = (page_num + 1) / total_pages
-                progress_bar.progress(progress, text=f"Extracting page {page_num + 1}/{total_pages}")
-            
-            page = pdf[page_num]
+        with PageRasterizer(pdf_bytes, dpi, enhance=False) as rasterizer:
+            total_pages = len(rasterizer)
             
-            # Use moderate DPI to balance quality and size
-            zoom = dpi / 72  # 72 is the default PDF dpi
-            matrix = fitz.Matrix(zoom, zoom)
+            # Add a progress indicator for large documents
+            if total_pages > 5:
+                progress_bar = st.progress(0)
             
-            # Get pixmap and convert to PIL Image
-            pix = page.get_pixmap(matrix=matrix)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            for page in rasterizer:
+                # Update progress for large documents
+                if total_pages > 5:
+                    progress_bar.progress(page.page_num / total_pages, text=f"Extracting page {page.page_num}/{total_pages}")
+                
+                pages.append(page)
             
-            images.append(img)
-        
-        # Clear progress display
-        if total_pages > 5:
-            progress_bar.empty()
-            progress_text.empty()
+            # Clear progress display
+            if total_pages > 5:
+                progress_bar.empty()
         
-        pdf.close()
-        return images
+        return pages
     
     except Exception as e:
         st.error(f"Error extracting pages: {str(e)}")
         return []
-    
-    finally:
-        # Clean up temporary file
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
 
 def compress_image_for_claude(image, max_size_mb=4.5):
     """
     Compress image to fit under Claude's 5MB limit while preserving text quality.
     
-    Uses lossless PNG compression first, then progressive reduction strategies
-    to ensure image is under size limit while maintaining readability.
+    Uses lossless PNG compression first (color, then grayscale for documents),
+    then the best JPEG quality and scale that fit, found with a bounded search.
+    
+    Args:
+        image: RenderedPage (its stored PNG is reused when it fits) or PIL Image
+        max_size_mb: Size limit in MB
     
     Returns:
-        tuple: (compressed image, size in MB, media type)
+        RenderedPage or EncodedImage: The payload (bytes, media type and dimensions)
     """
-    # Work with a copy to avoid modifying original
-    img = image.copy()
-    
-    # Try PNG first with maximum compression for text readability
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG', optimize=True, compress_level=9)
-    img_buffer.seek(0)
-    size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
+    max_bytes = int(max_size_mb * 1024 * 1024)
+    if isinstance(image, RenderedPage):
+        if len(image.data) <= max_bytes:
+            return image
+        image = image.image()
     
-    # If PNG is small enough, use it
-    if size_mb <= max_size_mb:
-        return img, size_mb, "image/png"
+    # Try PNG first for text readability, then grayscale PNG (good for documents)
+    for candidate in (image, image.convert('L') if image.mode != 'L' else None):
+        if candidate is None:
+            continue
+        data = encode_png(candidate)
+        if len(data) <= max_bytes:
+            return EncodedImage(data, "image/png", candidate.width, candidate.height)
     
-    # If too large, try converting to grayscale first (good for documents)
-    if img.mode != 'L':  # Not already grayscale
-        gray_img = img.convert('L')
-        img_buffer = io.BytesIO()
-        gray_img.save(img_buffer, format='PNG', optimize=True, compress_level=9)
-        img_buffer.seek(0)
-        size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-        
-        if size_mb <= max_size_mb:
-            return gray_img, size_mb, "image/png"
-    
-    # If still too large, resize the image
-    width, height = img.size
-    scale_factors = [0.9, 0.8, 0.7, 0.6]
-    
-    for scale in scale_factors:
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-        
-        # Try PNG first
-        img_buffer = io.BytesIO()
-        resized_img.save(img_buffer, format='PNG', optimize=True, compress_level=9)
-        img_buffer.seek(0)
-        size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-        
-        if size_mb <= max_size_mb:
-            return resized_img, size_mb, "image/png"
-        
-        # If PNG still too large, try grayscale
-        if resized_img.mode != 'L':
-            gray_resized = resized_img.convert('L')
-            img_buffer = io.BytesIO()
-            gray_resized.save(img_buffer, format='PNG', optimize=True, compress_level=9)
-            img_buffer.seek(0)
-            size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-            
-            if size_mb <= max_size_mb:
-                return gray_resized, size_mb, "image/png"
-    
-    # Last resort: JPEG with progressively lower quality
     # Only use JPEG if absolutely necessary for text documents
-    qualities = [95, 90, 85, 80, 75, 70]
-    resized_img = img.resize((int(width * 0.7), int(height * 0.7)), Image.LANCZOS)
-    
-    for quality in qualities:
-        img_buffer = io.BytesIO()
-        resized_img.save(img_buffer, format='JPEG', quality=quality, optimize=True)
-        img_buffer.seek(0)
-        size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-        
-        if size_mb <= max_size_mb:
-            return Image.open(img_buffer), size_mb, "image/jpeg"
-    
-    # Extreme compression as last resort
-    img_buffer = io.BytesIO()
-    img.resize((int(width * 0.5), int(height * 0.5)), Image.LANCZOS).save(
-        img_buffer, format='JPEG', quality=60, optimize=True
-    )
-    img_buffer.seek(0)
-    size_mb = len(img_buffer.getvalue()) / (1024 * 1024)
-    
-    return Image.open(img_buffer), size_mb, "image/jpeg"
+    return encode_image(image, max_bytes, lossless=False, max_quality=95, min_quality=60)
 
 def process_page_with_claude_ocr(page_image, page_num):
     """
@@ -165,7 +80,7 @@ def process_page_with_claude_ocr(page_image, page_num):
     Compresses the image if needed and sends it to Claude for OCR processing.
     
     Args:
-        page_image: PIL Image object of the page
+        page_image: RenderedPage or PIL Image object of the page
         page_num: Page number for tracking
         
     Returns:
@@ -175,18 +90,13 @@ def process_page_with_claude_ocr(page_image, page_num):
         st.info(f"Processing page {page_num} with Claude OCR...")
         
         # Compress image if needed
-        compressed_img, size_mb, media_type = compress_image_for_claude(page_image)
-        
-        if size_mb > 4.5:
-            raise ValueError(f"Failed to compress image below 5MB limit: {size_mb:.2f}MB")
+        payload = compress_image_for_claude(page_image)
+        media_type = payload.media_type
             
-        st.info(f"Page {page_num} prepared at {size_mb:.2f}MB with format {media_type}")
+        st.info(f"Page {page_num} prepared at {payload.size_mb:.2f}MB with format {media_type}")
         
-        # Convert to base64
-        img_buffer = io.BytesIO()
-        compressed_img.save(img_buffer, format=media_type.split('/')[-1].upper())
-        img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        # The encoded bytes are sent as is
+        img_base64 = payload.base64()
         
         # Process with Claude
         claude_response = anthropic_client.messages.create(
@@ -276,7 +186,7 @@ def batch_process_pages(page_images, max_batch=3):
     Process pages in small batches to improve speed.
     
     Args:
-        page_images: List of PIL Image objects
+        page_images: List of RenderedPage or PIL Image objects
         max_batch: Maximum number of pages to process at once
         
     Returns:
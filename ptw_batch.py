@@ -0,0 +1,332 @@
+"""
+Headless batch analysis of PTW documents
+
+Auditing permits used to require uploading them one at a time in the app.
+This command runs the same pipeline as the app - page rendering with the text
+layer, document summary, OCR and page analysis, checkpoints and caches - on
+every PDF in a directory or zip file, without Streamlit:
+
+    python ptw_batch.py permits/ -o results.csv
+    python ptw_batch.py permits_q3.zip -o results.parquet --documents 8 --max-concurrency 16
+
+Several documents are analysed at the same time (--documents), and all their
+model calls share the engine's rate controller, so --max-concurrency is a
+global budget for the whole run. Pages are scheduled as bulk work by default,
+behind interactive analyses sharing the same process (see page_scheduler).
+Result rows are written as CSV, Parquet or JSONL (one row per audited item,
+with the document it came from), along with a per-document summary next to
+them. Documents interrupted by a crash or a failed page resume from their
+checkpoint when the command is run again.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import zipfile
+import argparse
+import concurrent.futures
+from typing import Callable, List, Tuple
+
+from llm_engine import ProgressEvents
+from analysis_rows import RESULT_STATUSES
+from job_runner import AnalysisJob, JOB_WORKERS
+from page_scheduler import PRIORITY_BULK, PRIORITY_CLASSES, get_page_scheduler
+from rate_limiter import get_rate_controller
+
+OUTPUT_FORMATS = ("csv", "parquet", "jsonl")
+
+# Documents are summarized from a copy compressed to fit the API request limit (MB)
+SUMMARY_PDF_MAX_MB = 4.0
+
+# Page scheduler owner of the documents analysed by this command
+BATCH_OWNER = "batch"
+
+
+class BatchEvents(ProgressEvents):
+    """Progress sink printing the status messages of one document to stderr."""
+
+    def __init__(self, name: str, verbose: bool = False):
+        """
+        Initialize the sink.
+
+        Args:
+            name: Document name used as the message prefix
+            verbose: Print info and success messages too (warnings and errors always are)
+        """
+        super().__init__()
+        self.name = name
+        self.verbose = verbose
+
+    def message(self, level: str, text: str):
+        if self.verbose or level in ("warning", "error"):
+            print(f"[{self.name}] {level}: {text}", file=sys.stderr, flush=True)
+
+    def emit(self, kind: str, payload):
+        pass
+
+
+class BatchJob(AnalysisJob):
+    """
+    Analysis job run directly on a batch worker thread.
+
+    Messages go to the document's events as they happen; the checkpoint
+    store keeps the progress of every page.
+    """
+
+    def __init__(self, total_pages: int, inputs: dict, events: ProgressEvents):
+        super().__init__(total_pages, inputs)
+        self.events = events
+
+    def message(self, level: str, text: str):
+        super().message(level, text)
+        self.events.message(level, text)
+
+
+def list_documents(path: str) -> List[Tuple[str, Callable[[], bytes]]]:
+    """
+    List the PDF files of a directory (recursively) or zip file.
+
+    Args:
+        path: Directory or .zip file
+
+    Returns:
+        list: (name, read) pairs sorted by name, where read() returns the PDF bytes
+    """
+    def reader(member_path, member=None):
+        if member is None:
+            def read():
+                with open(member_path, "rb") as f:
+                    return f.read()
+        else:
+            # Each call opens its own handle, so documents can be read from several threads
+            def read():
+                with zipfile.ZipFile(member_path) as archive:
+                    return archive.read(member)
+        return read
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = [
+                info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(".pdf")
+                and not os.path.basename(info.filename).startswith(".")
+            ]
+        return [(name, reader(path, name)) for name in sorted(names)]
+
+    if os.path.isdir(path):
+        documents = []
+        for root, _, files in os.walk(path):
+            for file_name in files:
+                if file_name.lower().endswith(".pdf") and not file_name.startswith("."):
+                    file_path = os.path.join(root, file_name)
+                    documents.append((os.path.relpath(file_path, path), reader(file_path)))
+        return sorted(documents, key=lambda document: document[0])
+
+    raise ValueError(f"{path} is neither a directory nor a zip file")
+
+
+def analyze_document(app, name: str, pdf_bytes: bytes, dpi: int, parallel: bool,
+                     priority: str, events: ProgressEvents) -> Tuple[List[dict], dict]:
+    """
+    Run the full analysis pipeline on one document.
+
+    Args:
+        app: The app module (imported lazily, as it sets up the Streamlit page)
+        name: Document name reported in the output
+        pdf_bytes: The PDF content as bytes
+        dpi: Page rendering resolution
+        parallel: Analyse several pages of the document at the same time
+        priority: Page scheduling class (see page_scheduler)
+        events: Sink for the document's status messages
+
+    Returns:
+        tuple: (result rows, document summary record)
+    """
+    started = time.time()
+    summary = {"document": name, "pages": 0, "permit_number": "", "status": "error", "error": ""}
+
+    page_index = app.PageIndex()
+    page_images = app.extract_pages_as_images(
+        pdf_bytes, dpi=dpi, page_index=page_index, text_layer=True, events=events
+    )
+    if not page_images:
+        summary["error"] = "No pages could be extracted"
+        summary["seconds"] = round(time.time() - started, 1)
+        return [], summary
+    summary["pages"] = len(page_images)
+
+    doc_key = app.get_document_checkpoint_key(app.generate_document_hash(pdf_bytes))
+    checkpoint = app.load_document_checkpoint(doc_key, len(page_images), events)
+
+    summary_pdf = pdf_bytes
+    if app.get_file_size_mb(pdf_bytes) > SUMMARY_PDF_MAX_MB:
+        summary_pdf = app.compress_pdf(pdf_bytes, SUMMARY_PDF_MAX_MB, events=events)
+    ptw_summary = app.get_checkpointed_summary(checkpoint, summary_pdf, events)
+
+    job = BatchJob(len(page_images), {
+        "page_images": page_images,
+        "ptw_summary": ptw_summary,
+        "page_index": page_index,
+        "permit_number": checkpoint.permit_number if checkpoint else None,
+        "parallel_processing": parallel,
+        "doc_key": doc_key,
+        "owner": BATCH_OWNER,
+        "priority": priority
+    }, events)
+    try:
+        app.run_analysis_job(job)
+        job.finish("completed")
+    except Exception as e:
+        job.finish("error", str(e))
+    snapshot = job.snapshot()
+
+    rows = []
+    for result in snapshot["results"]:
+        rows.extend({"document": name, **row} for row in result or [])
+
+    failed_pages = [
+        page_num for page_num, page in snapshot["page_status"].items() if page.get("status") == "error"
+    ]
+    missing_pages = [page_num for page_num, result in enumerate(snapshot["results"], 1) if not result]
+    summary.update({
+        "permit_number": snapshot["context"].get("permit_number") or "",
+        "status": "error" if snapshot["status"] == "error" else ("incomplete" if failed_pages or missing_pages else "completed"),
+        "error": snapshot["error"] or "",
+        "rows": len(rows),
+        "failed_pages": " ".join(str(page_num) for page_num in failed_pages + missing_pages),
+        "seconds": round(time.time() - started, 1)
+    })
+    for status in RESULT_STATUSES:
+        count = sum(1 for row in rows if row["status"] == status)
+        if count:
+            summary[status] = count
+    return rows, summary
+
+
+def write_records(records: List[dict], path: str, output_format: str):
+    """
+    Write records to a CSV, Parquet or JSONL file.
+
+    Args:
+        records: Dictionaries to write (columns in order of first appearance)
+        path: Output file
+        output_format: "csv", "parquet" or "jsonl"
+    """
+    columns = list(dict.fromkeys(column for record in records for column in record))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    if output_format == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    elif output_format == "parquet":
+        # Needs pyarrow (or fastparquet) next to pandas
+        import pandas as pd
+        pd.DataFrame(records, columns=columns).to_parquet(path, index=False)
+    else:
+        # utf-8-sig so spreadsheet tools read the Portuguese text correctly
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval="")
+            writer.writeheader()
+            writer.writerows(records)
+
+
+def summary_path(output: str, output_format: str) -> str:
+    """Return the default path of the per-document summary, next to the results."""
+    stem, _ = os.path.splitext(output)
+    return f"{stem}_documents.{output_format}"
+
+
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(
+        description="Audit every PTW PDF in a directory or zip file without the Streamlit UI."
+    )
+    parser.add_argument("input", help="Directory (searched recursively) or .zip file of PDF documents")
+    parser.add_argument("-o", "--output", required=True, help="Result rows file (.csv, .parquet or .jsonl)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS,
+                        help="Output format (default: from the output file extension, else csv)")
+    parser.add_argument("--summary", help="Per-document summary file (default: <output>_documents.<format>)")
+    parser.add_argument("--documents", type=int, default=JOB_WORKERS,
+                        help=f"Documents analysed at the same time (default: {JOB_WORKERS})")
+    parser.add_argument("--max-concurrency", type=int,
+                        help="Model calls in flight across all documents (default: PTW_MAX_CONCURRENCY)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Analyse the pages of each document one at a time")
+    parser.add_argument("--priority", choices=PRIORITY_CLASSES, default=PRIORITY_BULK,
+                        help="Page scheduling class (default: bulk, behind interactive analyses)")
+    parser.add_argument("--dpi", type=int, default=250, help="Page rendering resolution (default: 250)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every status message")
+    args = parser.parse_args(argv)
+
+    if not args.format:
+        extension = os.path.splitext(args.output)[1].lower().lstrip(".")
+        args.format = extension if extension in OUTPUT_FORMATS else "csv"
+    args.summary = args.summary or summary_path(args.output, args.format)
+    return args
+
+
+def main(argv=None) -> int:
+    """
+    Run the batch analysis.
+
+    Returns:
+        int: Exit status (1 if any document could not be fully analysed)
+    """
+    args = parse_args(argv)
+
+    # Every model call of the process goes through the shared controller
+    if args.max_concurrency:
+        get_rate_controller().set_max_concurrency(args.max_concurrency)
+    # The app's st.* page setup is a no-op outside `streamlit run`; keep its warnings quiet
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    import app
+
+    # The batch is a single scheduler user: unless capped explicitly, it may use the whole call budget
+    if "PTW_USER_MAX_IN_FLIGHT" not in os.environ:
+        get_page_scheduler().user_max_in_flight = app.model_engine.controller.max_concurrency
+
+    documents = list_documents(args.input)
+    if not documents:
+        print(f"No PDF documents found in {args.input}", file=sys.stderr)
+        return 1
+    print(f"Analysing {len(documents)} document(s) from {args.input}", file=sys.stderr, flush=True)
+
+    def process(name, read):
+        events = BatchEvents(name, args.verbose)
+        try:
+            return analyze_document(app, name, read(), args.dpi, not args.sequential, args.priority, events)
+        except Exception as e:
+            events.message("error", f"Document failed: {str(e)}")
+            return [], {"document": name, "pages": 0, "permit_number": "", "status": "error", "error": str(e)}
+
+    all_rows, summaries = [], {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.documents),
+                                               thread_name_prefix="ptw-batch") as executor:
+        futures = {executor.submit(process, name, read): name for name, read in documents}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            rows, summary = future.result()
+            all_rows.extend(rows)
+            summaries[futures[future]] = summary
+            print(
+                f"[{done}/{len(documents)}] {summary['document']}: {summary['status']}, "
+                f"{summary['pages']} page(s), {len(rows)} row(s)",
+                file=sys.stderr, flush=True
+            )
+
+    # Output in document order, whatever order the documents finished in
+    order = {name: index for index, (name, _) in enumerate(documents)}
+    all_rows.sort(key=lambda row: (order[row["document"]], int(row["page_number"] or 0)))
+    write_records(all_rows, args.output, args.format)
+    write_records([summaries[name] for name, _ in documents], args.summary, args.format)
+    print(f"Wrote {len(all_rows)} row(s) to {args.output} and the document summary to {args.summary}",
+          file=sys.stderr)
+
+    return 0 if all(summary["status"] == "completed" for summary in summaries.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+Adaptive rate-limit controller for Anthropic API calls
+
+This module decides how many model calls may be in flight at once. The limit
+follows an AIMD (additive increase, multiplicative decrease) rule: it grows by
+about one slot per window of successful calls and is cut by a constant factor
+when the API answers with a rate-limit (429) or overload (529) error. Throttled
+responses also pause new calls for the duration given by their retry-after
+header. Optional requests-per-minute and tokens-per-minute budgets keep the
+process below the account quota before the API has to push back.
+
+One controller is shared by every call path in a process (OCR, analysis and
+summary). The module only depends on the standard library and the anthropic
+SDK; its state is guarded by a lock, so the app's threads and the engine's
+event loop can all query it.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from anthropic import APIConnectionError, APIStatusError
+
+# Concurrency bounds (overridable through environment variables)
+RATE_INITIAL_CONCURRENCY = int(os.environ.get("PTW_INITIAL_CONCURRENCY", "4"))
+RATE_MAX_CONCURRENCY = int(os.environ.get("PTW_MAX_CONCURRENCY", "32"))
+
+# Account budgets enforced client-side (0 disables the budget)
+RATE_RPM_LIMIT = int(os.environ.get("PTW_RPM_LIMIT", "0"))
+RATE_TPM_LIMIT = int(os.environ.get("PTW_TPM_LIMIT", "0"))
+
+# Multiplicative decrease applied on a rate-limit or overload response
+RATE_BACKOFF_FACTOR = 0.5
+
+# Pause applied when a throttled response carries no retry-after header (seconds)
+RATE_DEFAULT_RETRY_AFTER = 5.0
+
+# Length of the RPM/TPM sliding window (seconds)
+RATE_WINDOW_SECONDS = 60.0
+
+# Longest single sleep while waiting for a slot, so released slots are noticed quickly
+RATE_POLL_INTERVAL = 0.05
+
+# Rough token cost of one image block (the API downsizes images to ~1.15 megapixels)
+IMAGE_TOKEN_ESTIMATE = 1600
+
+# HTTP status codes that mean "slow down"
+THROTTLE_STATUS_CODES = (429, 529)
+
+
+def estimate_request_tokens(request: Dict) -> int:
+    """
+    Estimate the input tokens of a Messages API request before sending it.
+
+    Text is counted at roughly four characters per token and every image or
+    document block at a fixed cost. The estimate only has to be good enough to
+    keep the TPM budget from being overshot; it is replaced by the real usage
+    once the response arrives.
+
+    Args:
+        request: Keyword arguments of messages.create()
+
+    Returns:
+        int: Estimated input tokens
+    """
+    chars = 0
+    blocks = 0
+
+    def count(content):
+        nonlocal chars, blocks
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for block in content:
+                if isinstance(block, dict) and block.get("type") == "text":
+                    chars += len(block.get("text", ""))
+                else:
+                    blocks += 1
+
+    count(request.get("system", ""))
+    for message in request.get("messages", []):
+        count(message.get("content", ""))
+
+    return chars // 4 + blocks * IMAGE_TOKEN_ESTIMATE
+
+
+def usage_tokens(message) -> Optional[int]:
+    """
+    Read the total tokens billed for a Messages API response.
+
+    Args:
+        message: Message returned by the API
+
+    Returns:
+        int or None: Input plus output tokens (including cache reads/writes), None if unknown
+    """
+    usage = getattr(message, "usage", None)
+    if usage is None:
+        return None
+    return sum(
+        getattr(usage, field, None) or 0
+        for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+    )
+
+
+def classify_error(error: Exception) -> Tuple[str, Optional[float]]:
+    """
+    Classify an API exception for the controller.
+
+    Args:
+        error: Exception raised by an API call
+
+    Returns:
+        tuple: (outcome, retry_after) where outcome is "throttled" (429/529),
+            "transient" (connection errors and other 5xx) or "error", and
+            retry_after is the server-requested pause in seconds, if any
+    """
+    if isinstance(error, APIStatusError):
+        retry_after = None
+        try:
+            header = error.response.headers.get("retry-after")
+            if header is not None:
+                retry_after = float(header)
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+        if error.status_code in THROTTLE_STATUS_CODES:
+            return "throttled", retry_after
+        if error.status_code >= 500:
+            return "transient", retry_after
+        return "error", None
+
+    if isinstance(error, APIConnectionError):
+        return "transient", None
+
+    return "error", None
+
+
+class RateLimitTicket:
+    """A granted call slot; returned by acquire_async() and handed back to release()."""
+
+    def __init__(self, started: float, window_entry: list):
+        """
+        Initialize the ticket.
+
+        Args:
+            started: Monotonic time the slot was granted
+            window_entry: [timestamp, tokens] entry in the controller's TPM window
+        """
+        self.started = started
+        self.window_entry = window_entry
+        self.tokens_used = None
+
+    def record_usage(self, message):
+        """
+        Attach the real token usage of the response to this ticket.
+
+        Args:
+            message: Message returned by the API
+        """
+        self.tokens_used = usage_tokens(message)
+
+
+class AdaptiveRateController:
+    """Thread-safe AIMD concurrency limit with retry-after pauses and RPM/TPM budgets."""
+
+    def __init__(self,
+                 initial_concurrency: int = RATE_INITIAL_CONCURRENCY,
+                 max_concurrency: int = RATE_MAX_CONCURRENCY,
+                 min_concurrency: int = 1,
+                 rpm_limit: int = RATE_RPM_LIMIT,
+                 tpm_limit: int = RATE_TPM_LIMIT,
+                 backoff_factor: float = RATE_BACKOFF_FACTOR):
+        """
+        Initialize the controller.
+
+        Args:
+            initial_concurrency: Concurrency limit before any feedback
+            max_concurrency: Upper bound for the limit
+            min_concurrency: Lower bound for the limit
+            rpm_limit: Requests per minute budget (0 = unlimited)
+            tpm_limit: Tokens per minute budget (0 = unlimited)
+            backoff_factor: Factor applied to the limit on a throttled response
+        """
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.backoff_factor = backoff_factor
+
+        self._lock = threading.Lock()
+        self._limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+
+        # Sliding windows for the RPM and TPM budgets
+        self._requests = deque()
+        self._tokens = deque()
+
+        # Counters for stats()
+        self._successes = 0
+        self._throttled = 0
+        self._errors = 0
+        self._latency = None
+
+    @property
+    def limit(self) -> int:
+        """Return the current concurrency limit."""
+        return int(self._limit)
+
+    def set_max_concurrency(self, max_concurrency: int):
+        """
+        Change the upper bound of the limit (e.g. from a command-line budget).
+
+        Args:
+            max_concurrency: New upper bound for the limit
+        """
+        with self._lock:
+            self.max_concurrency = max(self.min_concurrency, max_concurrency)
+            self._limit = min(self._limit, float(self.max_concurrency))
+
+    def _prune(self, now: float):
+        """Drop window entries older than the budget window."""
+        horizon = now - RATE_WINDOW_SECONDS
+        while self._requests and self._requests[0] <= horizon:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= horizon:
+            self._tokens.popleft()
+
+    def try_acquire(self, estimated_tokens: int = 0) -> Tuple[Optional[RateLimitTicket], float]:
+        """
+        Claim a call slot without blocking.
+
+        Args:
+            estimated_tokens: Expected tokens of the call, charged to the TPM budget
+
+        Returns:
+            tuple: (ticket, 0.0) when granted, or (None, seconds to wait before retrying)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+
+            if now < self._blocked_until:
+                return None, self._blocked_until - now
+
+            if self._in_flight >= int(self._limit):
+                return None, RATE_POLL_INTERVAL
+
+            if self.rpm_limit and len(self._requests) >= self.rpm_limit:
+                return None, self._requests[0] + RATE_WINDOW_SECONDS - now
+
+            if self.tpm_limit and self._tokens:
+                used = sum(tokens for _, tokens in self._tokens)
+                # A single oversized call is still let through once the window is empty
+                if used + estimated_tokens > self.tpm_limit:
+                    return None, self._tokens[0][0] + RATE_WINDOW_SECONDS - now
+
+            self._in_flight += 1
+            self._requests.append(now)
+            window_entry = [now, estimated_tokens]
+            self._tokens.append(window_entry)
+            return RateLimitTicket(now, window_entry), 0.0
+
+    async def acquire_async(self, estimated_tokens: int = 0) -> RateLimitTicket:
+        """
+        Wait on the running event loop until a call slot is granted.
+
+        Args:
+            estimated_tokens: Expected tokens of the call
+
+        Returns:
+            RateLimitTicket: The granted slot (must be passed to release())
+        """
+        while True:
+            ticket, wait = self.try_acquire(estimated_tokens)
+            if ticket:
+                return ticket
+            await asyncio.sleep(min(wait, RATE_POLL_INTERVAL * 20))
+
+    def release(self, ticket: RateLimitTicket, outcome: str = "success", retry_after: Optional[float] = None):
+        """
+        Return a call slot and feed the outcome back into the limit.
+
+        Args:
+            ticket: Ticket returned by acquire_async()
+            outcome: "success", "throttled", "transient" or "error" (see classify_error)
+            retry_after: Server-requested pause in seconds for throttled calls
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._in_flight = max(0, self._in_flight - 1)
+
+            if ticket.tokens_used is not None:
+                ticket.window_entry[1] = ticket.tokens_used
+            elif outcome != "success":
+                # Rejected calls are not billed, so their estimate is refunded
+                ticket.window_entry[1] = 0
+
+            if outcome == "success":
+                self._successes += 1
+                latency = now - ticket.started
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                # Additive increase: about +1 slot per window of successful calls
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+
+            elif outcome == "throttled":
+                self._throttled += 1
+                pause = retry_after if retry_after is not None else RATE_DEFAULT_RETRY_AFTER
+                self._blocked_until = max(self._blocked_until, now + pause)
+                # Multiplicative decrease once per congestion event: calls that
+                # were already in flight when the limit was last cut don't cut it again
+                if ticket.started >= self._last_decrease:
+                    self._limit = max(self.min_concurrency, self._limit * self.backoff_factor)
+                    self._last_decrease = now
+
+            else:
+                self._errors += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the current limit, load and counters.
+
+        Returns:
+            dict: limit, in_flight, rpm, tpm, successes, throttled, errors,
+                latency (EWMA seconds, 0 before the first success) and paused_for
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "rpm": len(self._requests),
+                "tpm": sum(tokens for _, tokens in self._tokens),
+                "successes": self._successes,
+                "throttled": self._throttled,
+                "errors": self._errors,
+                "latency": self._latency or 0.0,
+                "paused_for": max(0.0, self._blocked_until - now)
+            }
+
+
+# Process-wide controller, created lazily
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_rate_controller() -> AdaptiveRateController:
+    """Return the shared rate controller, creating it on first use."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdaptiveRateController()
+        return _controller
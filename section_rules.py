@@ -0,0 +1,324 @@
+"""
+Deterministic section rules for PTW Analyzer
+
+Some form sections can be decided from the OCR markup alone: section 18 is
+approved when a row has a name, a function and a signature, section 20 when a
+closure reason is checked, and so on. These checks used to run only after the
+analysis call, to override the model's rows.
+
+Rules are now declared as data in SECTION_RULES and evaluated over the parsed
+page (see ocr_page) before the analysis call. A rule names the facts it needs
+(tag counts, tag order, wording on the section's lines) and an ordered list of
+outcomes; the first outcome whose condition holds gives the status and the
+reason. An outcome with no status leaves the section undecided. Sections that
+are decided do not go to the model: their rules are left out of the analysis
+prompt, and a page whose sections are all decided skips the call entirely.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from analysis_rows import STATUS_APPROVED, STATUS_REPROVED
+from ocr_page import OCRSection, normalize_line, parse_ocr_page
+
+NAME_VALUES = ("name", "nome")
+FUNCTION_VALUES = ("function", "funcao")
+YES_VALUES = ("sim", "yes")
+
+# Words that turn a "marked" line into an unmarked one ("[Unchecked: ...]", "não marcado")
+NEGATION_WORDS = ("unchecked", "unselected", "not selected", "not checked", "desmarcado",
+                  "nao marcado", "nao selecionado", "empty")
+
+# Tags of marks the OCR could not read; sections holding them are left to the model
+UNCLEAR_KINDS = ("unclear", "unclear signature", "illegible")
+
+# Tags of the vision OCR form markup; the rules read nothing else, so a section
+# transcribed without any of them is left to the model
+MARKUP_KINDS = ("checked", "unchecked", "filled field", "empty field", "signed", "empty", "stamp") + UNCLEAR_KINDS
+
+
+def tag_matches(tag, kind: str, values: Optional[tuple]) -> bool:
+    """Return True if a tag has the kind and one of the values (any value if None)."""
+    return tag.kind == kind and (values is None or tag.value in values)
+
+
+def whole_words(words: tuple):
+    """Compile a pattern matching any of the words, not as part of a longer word ("checked" in "unchecked")."""
+    return re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\b")
+
+
+class Count:
+    """Fact: number of tags of a kind (or of several kinds) in the section."""
+
+    def __init__(self, kind, values: Optional[tuple] = None):
+        """
+        Initialize the fact.
+
+        Args:
+            kind: Tag kind ("signed", "filled field", ...) or tuple of kinds
+            values: Accepted tag values (any value if None)
+        """
+        self.kinds = kind if isinstance(kind, tuple) else (kind,)
+        self.values = values
+
+    def evaluate(self, section: OCRSection) -> int:
+        """Return the number of matching tags."""
+        return sum(section.count(kind, self.values) for kind in self.kinds)
+
+
+class Follows:
+    """Fact: a tag of one kind appears after a tag of another."""
+
+    def __init__(self, first: Tuple[str, Optional[tuple]], then: Tuple[str, Optional[tuple]]):
+        """
+        Initialize the fact.
+
+        Args:
+            first: (kind, values) of the first tag
+            then: (kind, values) of the tag that must follow it
+        """
+        self.first = first
+        self.then = then
+
+    def evaluate(self, section: OCRSection) -> bool:
+        """Return True if a 'then' tag follows a 'first' tag."""
+        seen_first = False
+        for tag in section.tags:
+            if seen_first and tag_matches(tag, *self.then):
+                return True
+            if tag_matches(tag, *self.first):
+                seen_first = True
+        return False
+
+
+class TagOnLine:
+    """Fact: a tag of a kind sits on a line containing one of some words."""
+
+    def __init__(self, kind: str, words: tuple):
+        """
+        Initialize the fact.
+
+        Args:
+            kind: Tag kind
+            words: Normalized words (lowercase, without accents)
+        """
+        self.kind = kind
+        self.words = words
+
+    def evaluate(self, section: OCRSection) -> bool:
+        """Return True if a matching tag is on a line with one of the words."""
+        return any(any(word in tag.line for word in self.words) for tag in section.find(self.kind))
+
+
+class LineWith:
+    """Fact: a line of the section contains a whole word of every group, and none of the excluded ones."""
+
+    def __init__(self, *groups: tuple, exclude: tuple = ()):
+        """
+        Initialize the fact.
+
+        Args:
+            *groups: Tuples of normalized words; a line must contain one word of each
+            exclude: Normalized words that disqualify a line (e.g. negations)
+        """
+        self.patterns = [whole_words(group) for group in groups]
+        self.exclude = whole_words(exclude) if exclude else None
+
+    def evaluate(self, section: OCRSection) -> bool:
+        """Return True if a line matches every group and no excluded word."""
+        return any(
+            all(pattern.search(line) for pattern in self.patterns)
+            and not (self.exclude and self.exclude.search(line))
+            for line in section.lines
+        )
+
+
+# Outcome: (condition over the facts, status or None for undecided, reason)
+Outcome = Tuple[Callable[[Dict[str, object]], bool], Optional[str], str]
+
+
+class SectionRule:
+    """Deterministic rule deciding one form section."""
+
+    def __init__(self, section: str, title: str, facts: Dict[str, object], outcomes: List[Outcome]):
+        """
+        Initialize the rule.
+
+        Args:
+            section: Section number ("14", ...)
+            title: Section title, as shown in the results table
+            facts: Fact name -> fact (Count, Follows, TagOnLine, LineWith)
+            outcomes: Outcomes tried in order; the first that holds decides
+        """
+        self.section = section
+        self.title = title
+        self.facts = facts
+        self.outcomes = outcomes
+        self._label_pattern = re.compile(
+            rf"^\W*(?:secao|section)?\s*{re.escape(section)}(?![.\d])|" + re.escape(normalize_line(title))
+        )
+
+    @property
+    def label(self) -> str:
+        """Section column value of the rule's rows ("14 - Operações Simultâneas")."""
+        return f"{self.section} - {self.title}"
+
+    def matches_label(self, label: str) -> bool:
+        """Return True if a result row's section column refers to this rule's section."""
+        return bool(self._label_pattern.search(normalize_line(label or "")))
+
+    def evaluate(self, page) -> Optional["RuleDecision"]:
+        """
+        Evaluate the rule on a parsed page.
+
+        Args:
+            page: OCRPage (see ocr_page.parse_ocr_page)
+
+        Returns:
+            RuleDecision or None: The decision, None if the section is not on the page
+        """
+        section = page.section(self.section)
+        if section is None:
+            return None
+        # Without markup every fact reads as "nothing marked", which is not evidence
+        if self.facts and not any(tag.kind in MARKUP_KINDS for tag in section.tags):
+            return RuleDecision(self, None, "")
+        facts = {name: fact.evaluate(section) for name, fact in self.facts.items()}
+        for condition, status, reason in self.outcomes:
+            if condition(facts):
+                return RuleDecision(self, status, reason)
+        return RuleDecision(self, None, "")
+
+
+class RuleDecision:
+    """Result of a section rule on one page."""
+
+    def __init__(self, rule: SectionRule, status: Optional[str], reason: str):
+        """
+        Initialize the decision.
+
+        Args:
+            rule: Rule that produced the decision
+            status: APROVADO, REPROVADO, or None if undecided
+            reason: Justification, used as the row's comment
+        """
+        self.rule = rule
+        self.status = status
+        self.reason = reason
+
+    @property
+    def decided(self) -> bool:
+        """Return True if the rule decided the section."""
+        return self.status is not None
+
+
+def always(facts: Dict[str, object]) -> bool:
+    """Outcome condition that always holds."""
+    return True
+
+
+SECTION_RULES = [
+    SectionRule(
+        "14", "Operações Simultâneas",
+        facts={
+            "yes_checked": Count("checked", YES_VALUES),
+            "filled_after_yes": Follows(("checked", YES_VALUES), ("filled field", None))
+        },
+        outcomes=[
+            (lambda f: f["yes_checked"] and not f["filled_after_yes"], STATUS_REPROVED,
+             "Seção 14: Marcado 'Sim' para operações simultâneas, mas campos obrigatórios não foram preenchidos."),
+            (lambda f: f["yes_checked"], STATUS_APPROVED,
+             "Seção 14: Operações simultâneas corretamente documentadas com campos preenchidos."),
+            (always, STATUS_APPROVED,
+             "Seção 14: Não há operações simultâneas (opção 'Não' selecionada ou formulário N/A).")
+        ]
+    ),
+    SectionRule(
+        "15", "Co-emissor",
+        facts={
+            "unclear": Count(UNCLEAR_KINDS),
+            "stamps": Count("stamp"),
+            "names": Count("filled field", NAME_VALUES),
+            "signatures": Count("signed")
+        },
+        outcomes=[
+            (lambda f: f["unclear"], None, "Seção 15: Marcas ilegíveis, decisão do modelo."),
+            (lambda f: f["stamps"], STATUS_APPROVED,
+             "Seção 15: Carimbo presente, o que aprova a seção."),
+            (lambda f: f["names"] != f["signatures"], STATUS_REPROVED,
+             "Seção 15: Inconsistência entre campos de nome e assinatura. Todos os campos preenchidos devem ter assinaturas correspondentes."),
+            (always, STATUS_APPROVED,
+             "Seção 15: Campos de co-emissor corretamente preenchidos ou adequadamente vazios.")
+        ]
+    ),
+    SectionRule(
+        "16", "Recomendações de Segurança Adicionais",
+        facts={},
+        outcomes=[
+            (always, STATUS_APPROVED, "Seção 16: Seção opcional, sempre aprovada.")
+        ]
+    ),
+    SectionRule(
+        "18", "Ciência da PT",
+        facts={
+            "unclear": Count(UNCLEAR_KINDS),
+            "names": Count("filled field", NAME_VALUES),
+            "functions": Count("filled field", FUNCTION_VALUES),
+            "signatures": Count("signed")
+        },
+        outcomes=[
+            (lambda f: f["unclear"], None, "Seção 18: Marcas ilegíveis, decisão do modelo."),
+            (lambda f: f["names"] and f["functions"] and f["signatures"], STATUS_APPROVED,
+             "Seção 18: Pelo menos uma linha completa com nome, função e assinatura."),
+            (lambda f: not (f["names"] or f["functions"] or f["signatures"]), STATUS_APPROVED,
+             "Seção 18: Seção completamente vazia, o que é aceitável."),
+            (always, STATUS_REPROVED,
+             "Seção 18: Informações parciais detectadas. Cada linha deve ter nome, função e assinatura ou estar completamente vazia.")
+        ]
+    ),
+    SectionRule(
+        "20", "Encerramento",
+        facts={
+            "reason_checked": TagOnLine("checked", ("termino do trabalho", "acidente", "outros")),
+            "reason_marked": LineWith(
+                ("encerramento", "closure", "termino", "trabalho concluido"),
+                ("checked", "marcado", "selected", "selecionado"),
+                exclude=NEGATION_WORDS
+            )
+        },
+        outcomes=[
+            (lambda f: f["reason_checked"], STATUS_APPROVED,
+             "Seção 20: Motivo de encerramento devidamente marcado."),
+            (lambda f: f["reason_marked"], STATUS_APPROVED,
+             "Seção 20: Motivo de encerramento devidamente marcado (detectado em análise secundária)."),
+            (always, STATUS_REPROVED,
+             "Seção 20: Nenhum motivo de encerramento selecionado. Um dos três motivos deve ser marcado.")
+        ]
+    )
+]
+
+
+def evaluate_section_rules(ocr_text: str) -> List[RuleDecision]:
+    """
+    Evaluate every section rule on a page.
+
+    The rules only apply to vision OCR transcriptions: text-layer pages (whose
+    visual regions are transcribed apart from their sections) and text without
+    any form markup are left to the model.
+
+    Args:
+        ocr_text: OCR text of the page
+
+    Returns:
+        list: Decisions (decided or not) of the rules whose section is on the page
+    """
+    page = parse_ocr_page(ocr_text)
+    if page.from_text_layer or not any(tag.kind in MARKUP_KINDS for tag in page.tags):
+        return []
+    decisions = [rule.evaluate(page) for rule in SECTION_RULES]
+    return [decision for decision in decisions if decision is not None]
+
+
+def rule_for_label(label: str) -> Optional[SectionRule]:
+    """Return the rule of the section a result row refers to, if any."""
+    return next((rule for rule in SECTION_RULES if rule.matches_label(label)), None)
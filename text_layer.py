@@ -0,0 +1,201 @@
+"""
+Native text layer extraction for PTW Analyzer
+
+Permits exported from the ERP are digitally generated PDFs: their text is
+already in the file, so sending a picture of the page to a vision model only
+to read it back is wasted time and tokens. This module decides, per page,
+whether the embedded text can stand in for vision OCR and builds an
+OCR-equivalent transcription from it: text blocks and form fields in reading
+order, with the fields written in the OCR markup ("[Checked: Sim]",
+"[Filled field: Nome]", "[Signed]"...) the analysis prompt relies on.
+
+Parts of a digital page that carry no text - embedded images such as
+signatures or stamps, drawn checkboxes, and annotations (tablet-signed ERP
+exports carry their signatures and stamps as Ink, Stamp or FreeText
+annotations) - are returned as regions, so only those crops go to vision OCR. Scanned pages (mostly covered by images, even
+when the scanner added an invisible OCR layer) and pages with too little text
+keep using full-page vision OCR.
+"""
+
+import os
+from typing import FrozenSet, List, Optional
+
+import fitz  # PyMuPDF
+
+from ocr_page import TEXT_LAYER_MARKER
+
+# Minimum characters of embedded text for a page to use its text layer
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("PTW_TEXT_LAYER_MIN_CHARS", "200"))
+
+# Share of the page covered by images above which the page is treated as a scan
+MAX_IMAGE_COVERAGE = 0.5
+
+# Images smaller than this share of the page (icons, bullets) are ignored
+MIN_REGION_COVERAGE = 0.002
+
+# Side of a drawn square treated as a checkbox (points)
+CHECKBOX_MIN_SIZE = 5
+CHECKBOX_MAX_SIZE = 20
+
+# Width of label text kept to the right of a checkbox crop (points)
+CHECKBOX_LABEL_WIDTH = 150
+
+# Annotation types that carry no visible page content
+HIDDEN_ANNOT_TYPES = (fitz.PDF_ANNOT_POPUP, fitz.PDF_ANNOT_LINK, fitz.PDF_ANNOT_WIDGET)
+
+# Pages needing more crops than this go to full-page vision OCR instead
+MAX_VISION_REGIONS = 8
+
+
+class PageTextLayer:
+    """OCR-equivalent text of a digital page and the regions that still need vision OCR."""
+
+    __slots__ = ("text", "regions")
+
+    def __init__(self, text: str, regions: List[fitz.Rect]):
+        """
+        Initialize the text layer.
+
+        Args:
+            text: Transcription built from the embedded text
+            regions: Page areas without text (in PDF points) to transcribe visually
+        """
+        self.text = text
+        self.regions = regions
+
+    @property
+    def fully_digital(self) -> bool:
+        """Return True if the page needs no vision OCR at all."""
+        return not self.regions
+
+
+def shared_image_xrefs(pdf: fitz.Document) -> FrozenSet[int]:
+    """
+    Find images repeated on several pages of a document.
+
+    Images used on more than one page (logos, form backgrounds) are part of
+    the template, not page content, and are never sent to vision OCR.
+
+    Args:
+        pdf: Open fitz.Document
+
+    Returns:
+        frozenset: xrefs of images that appear on two or more pages
+    """
+    seen, shared = set(), set()
+    for page in pdf:
+        for xref in {image[0] for image in page.get_images(full=False)}:
+            (shared if xref in seen else seen).add(xref)
+    return frozenset(shared)
+
+
+def _merge_rects(rects: List[fitz.Rect]) -> List[fitz.Rect]:
+    """Merge overlapping rectangles until none overlap."""
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r.y0, r.x0)):
+        rect = fitz.Rect(rect)
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if rect.intersects(other):
+                    merged.remove(other)
+                    rect |= other
+                    changed = True
+                    break
+        merged.append(rect)
+    return merged
+
+
+def _image_regions(page: fitz.Page, template_xrefs: FrozenSet[int]) -> Optional[List[fitz.Rect]]:
+    """Return content image areas, or None if images cover most of the page (a scan)."""
+    page_area = abs(page.rect)
+    covered = 0.0
+    regions = []
+    for info in page.get_image_info(xrefs=True):
+        rect = fitz.Rect(info["bbox"]) & page.rect
+        if rect.is_empty:
+            continue
+        covered += abs(rect)
+        if info.get("xref") in template_xrefs or abs(rect) < page_area * MIN_REGION_COVERAGE:
+            continue
+        regions.append(rect)
+    if page_area and covered / page_area > MAX_IMAGE_COVERAGE:
+        return None
+    return regions
+
+
+def _checkbox_regions(page: fitz.Page) -> List[fitz.Rect]:
+    """Return drawn checkboxes, widened to include their label."""
+    regions = []
+    for drawing in page.get_drawings():
+        rect = drawing["rect"]
+        if (CHECKBOX_MIN_SIZE <= rect.width <= CHECKBOX_MAX_SIZE
+                and CHECKBOX_MIN_SIZE <= rect.height <= CHECKBOX_MAX_SIZE
+                and abs(rect.width - rect.height) <= 2):
+            label = fitz.Rect(rect.x0 - 2, rect.y0 - 2, rect.x1 + CHECKBOX_LABEL_WIDTH, rect.y1 + 2)
+            regions.append(label & page.rect)
+    return regions
+
+
+def _annotation_regions(page: fitz.Page) -> List[fitz.Rect]:
+    """Return the areas of visible annotations (ink signatures, stamps, free text)."""
+    regions = []
+    for annot in page.annots() or []:
+        if annot.type[0] in HIDDEN_ANNOT_TYPES:
+            continue
+        rect = annot.rect & page.rect
+        if not rect.is_empty:
+            regions.append(rect)
+    return regions
+
+
+def _field_markup(widget) -> str:
+    """Return the OCR markup of a form field ("[Checked: Sim]", "[Filled field: Nome] ...")."""
+    label = widget.field_label or widget.field_name or ""
+    value = widget.field_value
+    if widget.field_type in (fitz.PDF_WIDGET_TYPE_CHECKBOX, fitz.PDF_WIDGET_TYPE_RADIOBUTTON):
+        checked = value not in (None, "", "Off", False)
+        return f"[{'Checked' if checked else 'Unchecked'}: {label}]"
+    if widget.field_type == fitz.PDF_WIDGET_TYPE_SIGNATURE:
+        return f"[{'Signed' if getattr(widget, 'is_signed', False) else 'Empty'}] {label}"
+    if value in (None, ""):
+        return f"[Empty field: {label}]"
+    return f"[Filled field: {label}] {value}"
+
+
+def _reading_order_text(page: fitz.Page) -> str:
+    """Return the text blocks and form fields of a page, top to bottom and left to right."""
+    items = [
+        (block[1], block[0], block[4].strip())
+        for block in page.get_text("blocks", sort=True)
+        if block[6] == 0 and block[4].strip()
+    ]
+    items += [(widget.rect.y0, widget.rect.x0, _field_markup(widget)) for widget in page.widgets() or []]
+    return "\n".join(text for _, _, text in sorted(items, key=lambda item: (item[0], item[1])))
+
+
+def extract_text_layer(page: fitz.Page, template_xrefs: FrozenSet[int] = frozenset()) -> Optional[PageTextLayer]:
+    """
+    Build the OCR-equivalent text of a digitally generated page.
+
+    Args:
+        page: fitz.Page to inspect
+        template_xrefs: Images shared across pages (see shared_image_xrefs)
+
+    Returns:
+        PageTextLayer or None: The text layer, or None when the page needs
+            full-page vision OCR (scan, little text, or too many visual regions)
+    """
+    if len(page.get_text("text").strip()) < TEXT_LAYER_MIN_CHARS:
+        return None
+
+    image_regions = _image_regions(page, template_xrefs)
+    if image_regions is None:
+        return None
+
+    regions = _merge_rects(image_regions + _checkbox_regions(page) + _annotation_regions(page))
+    if len(regions) > MAX_VISION_REGIONS:
+        return None
+
+    return PageTextLayer(f"{TEXT_LAYER_MARKER}\n{_reading_order_text(page)}", regions)
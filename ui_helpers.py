@@ -5,8 +5,10 @@ This module contains functions for UI components and styling.
 """
 import streamlit as st
 import base64
+import uuid
 from PIL import Image
 from io import BytesIO
+from page_store import SessionPages
 
 def get_image_base64(image_path, width=None):
     """
@@ -64,6 +66,25 @@ def init_session_state():
     if 'page_images' not in st.session_state:
         st.session_state.page_images = []
     
+    if 'page_index' not in st.session_state:
+        st.session_state.page_index = None
+    
+    # Disk-backed store for the session's page images (see page_store)
+    if 'page_store' not in st.session_state:
+        st.session_state.page_store = None
+    
+    # Identifies the session's analyses to the page scheduler (see page_scheduler)
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = uuid.uuid4().hex
+    
+    # Background analysis job of the current document (see job_runner)
+    if 'job_id' not in st.session_state:
+        st.session_state.job_id = None
+    
+    # Checkpoint key of the current document (see checkpoint)
+    if 'doc_key' not in st.session_state:
+        st.session_state.doc_key = None
+    
     if 'ptw_summary' not in st.session_state:
         st.session_state.ptw_summary = None
     
@@ -108,6 +129,32 @@ def init_session_state():
     if 'status_filter' not in st.session_state:
         st.session_state.status_filter = ["APROVADO", "REPROVADO", "CHECAGEM HUMANA NECESSARIA", "N/A"]
 
+def get_session_pages():
+    """
+    Return the session's disk-backed page store, creating it on first use.
+    
+    Returns:
+        SessionPages: Store that pages and captured photos are spilled to
+    """
+    if st.session_state.get('page_store') is None:
+        st.session_state.page_store = SessionPages()
+    return st.session_state.page_store
+
+def render_page_image(page, caption=None, key=None, rendition="preview"):
+    """
+    Display a page using its small rendition, loading the full page only on zoom.
+    
+    Args:
+        page: RenderedPage to display
+        caption: Optional image caption
+        key: Unique widget key for the zoom toggle (no toggle if omitted)
+        rendition: Rendition shown by default ("preview" or "thumbnail")
+    """
+    if key is not None and st.toggle("🔍 Ampliar (resolução total)", key=key):
+        st.image(page.data, caption=caption, use_container_width=True)
+    else:
+        st.image(page.rendition(rendition), caption=caption, use_container_width=True)
+
 def render_sidebar():
     """Render the navigation sidebar with menu options"""
     # Logo at the top of sidebar